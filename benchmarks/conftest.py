@@ -0,0 +1,43 @@
+import json
+import os
+import shutil
+import tempfile
+
+import pytest
+
+from benchmarks.synthetic import DATA_VERSION, make_archive, write_roocs_cfg
+
+# Size of the synthetic archive, set through the environment
+ARCHIVE_DIR = os.environ.get("FLAMINGO_BENCH_ARCHIVE",
+                             os.path.join(tempfile.gettempdir(), "flamingo-bench-archive"))
+ARCHIVE_SETTINGS = {
+    "years": int(os.environ.get("FLAMINGO_BENCH_YEARS", "5")),
+    "cru_ts_resolution": float(os.environ.get("FLAMINGO_BENCH_CRU_TS_RESOLUTION", "0.5")),
+    "haduk_grid_step": int(os.environ.get("FLAMINGO_BENCH_HADUK_GRID_STEP", "1")),
+}
+
+# The roocs configuration must be in place before daops/clisops are imported
+write_roocs_cfg(ARCHIVE_DIR, os.path.join(tempfile.gettempdir(), "roocs-bench.ini"))
+
+
+@pytest.fixture(scope="session")
+def synthetic_archive():
+    """
+    Generates the synthetic archive, unless one with the same settings
+    already exists in the archive directory.
+    """
+    settings_file = os.path.join(ARCHIVE_DIR, "settings.json")
+    settings = dict(ARCHIVE_SETTINGS, version=DATA_VERSION)
+
+    if os.path.isfile(settings_file):
+        with open(settings_file) as reader:
+            if json.load(reader) == settings:
+                return ARCHIVE_DIR
+
+    shutil.rmtree(os.path.join(ARCHIVE_DIR, "badc"), ignore_errors=True)
+    make_archive(ARCHIVE_DIR, **ARCHIVE_SETTINGS)
+
+    with open(settings_file, "w") as writer:
+        json.dump(settings, writer)
+
+    return ARCHIVE_DIR
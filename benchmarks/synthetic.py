@@ -0,0 +1,232 @@
+"""
+synthetic.py
+============
+
+Generates a synthetic archive of CRU TS and HadUK-Grid shaped NetCDF files,
+laid out like the CEDA archive, and a roocs configuration file pointing at it
+(as `tests.common.write_roocs_cfg` does for mini-ceda-archive).
+
+Usage:
+
+    python -m benchmarks.synthetic <archive_dir> --years 10
+"""
+
+import argparse
+import os
+
+import cftime
+import numpy as np
+import xarray as xr
+
+from jinja2 import Template
+
+
+CRU_TS_VERSION = "4.04"
+HADUK_GRID_VERSION = "v1.0.3.0"
+HADUK_GRID_DATASET_VERSION = "v20210712"
+
+FIRST_YEAR = 1961
+
+# Incremented when the generated data changes, so that archives are regenerated
+DATA_VERSION = 2
+
+# HadUK-Grid 1km grid: British National Grid eastings and northings (metres)
+HADUK_GRID_X = np.arange(-199500.0, 700000.0, 1000.0)
+HADUK_GRID_Y = np.arange(-199500.0, 1250000.0, 1000.0)
+
+HADUK_GRID_FILE_NAME_TEMPLATE = ("{__derive__var_id}_hadukgrid_uk_{spatial_average}_{frequency}_"
+                                 "{__derive__time_range}.{__derive__extension}")
+
+ROOCS_CFG_TEMPLATE = """[project:cru_ts]
+base_dir = {{ archive_dir }}/badc/cru/data/cru_ts
+file_name_template = {__derive__var_id}_{frequency}_{__derive__time_range}.{__derive__extension}
+fixed_path_modifiers =
+    variable:cld dtr frs pet pre tmn tmp tmx vap wet
+fixed_path_mappings =
+    cru_ts.4.04.{variable}:cru_ts_4.04/data/{variable}/*.nc
+attr_defaults =
+    frequency:mon
+facet_rule = project version_major version_minor variable
+
+[project:haduk_grid]
+base_dir = {{ archive_dir }}/badc/ukmo-hadobs/data/insitu/MOHC/HadOBS/HadUK-Grid
+file_name_template = {{ haduk_grid_file_name_template }}
+facet_rule = project version_major version_minor version_patch version_extra spatial_average frequency variable version
+fixed_path_modifiers =
+    variable:groundfrost pv rainfall sfcWind snowLying sun tas tasmin
+    frequency:mon
+fixed_path_mappings =
+    haduk_grid.v1.0.3.0.1km.{frequency}.{variable}.v20210712:v1.0.3.0/1km/{variable}/{frequency}/v20210712/*.nc
+"""
+
+
+def monthly_times(years):
+    return [cftime.DatetimeGregorian(year, month, 16) for year in years for month in range(1, 13)]
+
+
+def _data(shape, seed):
+    """
+    Returns a smooth field with some noise, at the 0.1 precision of the real
+    data, so that compression behaves as it does on archive files.
+    """
+    n_times, n_y, n_x = shape
+    t = np.arange(n_times).reshape(-1, 1, 1)
+    y = np.linspace(0, np.pi, n_y).reshape(1, -1, 1)
+    x = np.linspace(0, 2 * np.pi, n_x).reshape(1, 1, -1)
+
+    field = 15 + 10 * np.sin(y) * np.cos(x + t * np.pi / 6)
+    noise = np.random.default_rng(seed).normal(0, 1, shape)
+    return np.round(field + noise, 1).astype("float32")
+
+
+def make_cru_ts_file(archive_dir, variable, years, resolution=0.5):
+    """
+    Writes a CRU TS shaped file (global, regular lat/lon grid) for `years`.
+    Returns the file path.
+    """
+    out_dir = os.path.join(archive_dir, "badc", "cru", "data", "cru_ts",
+                           f"cru_ts_{CRU_TS_VERSION}", "data", variable)
+    os.makedirs(out_dir, exist_ok=True)
+
+    lat = np.arange(-90 + resolution / 2, 90, resolution)
+    lon = np.arange(-180 + resolution / 2, 180, resolution)
+    times = monthly_times(years)
+
+    ds = xr.Dataset(
+        {variable: (("time", "lat", "lon"), _data((len(times), len(lat), len(lon)), years[0]),
+                    {"long_name": variable, "units": "days"})},
+        coords={
+            "time": ("time", times, {"standard_name": "time"}),
+            "lat": ("lat", lat, {"standard_name": "latitude", "units": "degrees_north"}),
+            "lon": ("lon", lon, {"standard_name": "longitude", "units": "degrees_east"}),
+        },
+        attrs={"Conventions": "CF-1.4", "title": f"CRU TS{CRU_TS_VERSION} {variable}",
+               "institution": "Synthetic data for benchmarks", "history": "synthetic"},
+    )
+    ds.time.encoding["units"] = "days since 1900-1-1"
+    ds[variable].encoding["_FillValue"] = np.float32(9.96921e36)
+
+    file_path = os.path.join(out_dir, f"cru_ts{CRU_TS_VERSION}.{years[0]}.{years[-1]}.{variable}.dat.nc")
+    ds.to_netcdf(file_path)
+    return file_path
+
+
+def _haduk_grid_lat_lon(x, y):
+    "Approximates the latitude and longitude of British National Grid points."
+    xx, yy = np.meshgrid(x, y)
+    lat = 49.77 + yy / 111320.0
+    lon = -7.56 + xx / (111320.0 * np.cos(np.deg2rad(lat)))
+    return lat.astype("float64"), lon.astype("float64")
+
+
+def make_haduk_grid_file(archive_dir, variable, year, step=1):
+    """
+    Writes a HadUK-Grid 1km shaped file (projected grid with 2D latitude and
+    longitude) for one year. `step` thins the grid for smaller files.
+    Returns the file path.
+    """
+    out_dir = os.path.join(archive_dir, "badc", "ukmo-hadobs", "data", "insitu", "MOHC", "HadOBS",
+                           "HadUK-Grid", HADUK_GRID_VERSION, "1km", variable, "mon",
+                           HADUK_GRID_DATASET_VERSION)
+    os.makedirs(out_dir, exist_ok=True)
+
+    x = HADUK_GRID_X[::step]
+    y = HADUK_GRID_Y[::step]
+    lat, lon = _haduk_grid_lat_lon(x, y)
+    times = monthly_times([year])
+    dims = ("time", "projection_y_coordinate", "projection_x_coordinate")
+
+    # Values are missing outside an ellipse standing in for the land
+    data = _data((len(times), len(y), len(x)), year)
+    xx, yy = np.meshgrid(x, y)
+    sea = ((xx - 300000) / 350000) ** 2 + ((yy - 500000) / 650000) ** 2 > 1
+    data[:, sea] = np.nan
+
+    ds = xr.Dataset(
+        {
+            variable: (dims, data,
+                       {"long_name": variable, "units": "1", "grid_mapping": "transverse_mercator",
+                        "coordinates": "latitude longitude"}),
+            "transverse_mercator": ((), np.int32(0), {
+                "grid_mapping_name": "transverse_mercator",
+                "longitude_of_prime_meridian": 0.0,
+                "semi_major_axis": 6377563.396,
+                "semi_minor_axis": 6356256.909,
+                "longitude_of_central_meridian": -2.0,
+                "latitude_of_projection_origin": 49.0,
+                "false_easting": 400000.0,
+                "false_northing": -100000.0,
+                "scale_factor_at_central_meridian": 0.9996012717,
+            }),
+        },
+        coords={
+            "time": ("time", times, {"standard_name": "time"}),
+            "projection_y_coordinate": ("projection_y_coordinate", y,
+                                        {"standard_name": "projection_y_coordinate", "units": "m"}),
+            "projection_x_coordinate": ("projection_x_coordinate", x,
+                                        {"standard_name": "projection_x_coordinate", "units": "m"}),
+            "latitude": (dims[1:], lat, {"standard_name": "latitude", "units": "degrees_north"}),
+            "longitude": (dims[1:], lon, {"standard_name": "longitude", "units": "degrees_east"}),
+        },
+        attrs={"Conventions": "CF-1.7", "title": f"HadUK-Grid {variable}",
+               "institution": "Synthetic data for benchmarks", "history": "synthetic"},
+    )
+    ds.time.encoding["units"] = "hours since 1800-01-01 00:00:00"
+    ds[variable].encoding["_FillValue"] = np.float32(1e20)
+
+    file_path = os.path.join(out_dir, f"{variable}_hadukgrid_uk_1km_mon_{year}01-{year}12.nc")
+    ds.to_netcdf(file_path)
+    return file_path
+
+
+def make_archive(archive_dir, cru_ts_variables=("wet",), haduk_grid_variables=("snowLying",),
+                 years=10, cru_ts_resolution=0.5, haduk_grid_step=1):
+    """
+    Writes a synthetic archive with `years` years of monthly data for each
+    variable. CRU TS files hold 10 years each, HadUK-Grid files hold one year.
+    Returns the list of file paths.
+    """
+    all_years = list(range(FIRST_YEAR, FIRST_YEAR + years))
+    file_paths = []
+
+    for variable in cru_ts_variables:
+        for start in range(0, years, 10):
+            decade = all_years[start:start + 10]
+            file_paths.append(make_cru_ts_file(archive_dir, variable, decade, cru_ts_resolution))
+
+    for variable in haduk_grid_variables:
+        for year in all_years:
+            file_paths.append(make_haduk_grid_file(archive_dir, variable, year, haduk_grid_step))
+
+    return file_paths
+
+
+def write_roocs_cfg(archive_dir, cfg_path):
+    "Writes a roocs configuration for the archive and sets ROOCS_CONFIG to use it."
+    with open(cfg_path, "w") as writer:
+        writer.write(Template(ROOCS_CFG_TEMPLATE).render(
+            archive_dir=archive_dir, haduk_grid_file_name_template=HADUK_GRID_FILE_NAME_TEMPLATE))
+
+    os.environ["ROOCS_CONFIG"] = cfg_path
+    return cfg_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic CRU TS and HadUK-Grid archive.")
+    parser.add_argument("archive_dir")
+    parser.add_argument("--years", type=int, default=10, help="number of years of monthly data")
+    parser.add_argument("--cru-ts-resolution", type=float, default=0.5, help="grid spacing in degrees")
+    parser.add_argument("--haduk-grid-step", type=int, default=1, help="use every Nth point of the 1km grid")
+    args = parser.parse_args()
+
+    for file_path in make_archive(args.archive_dir, years=args.years,
+                                  cru_ts_resolution=args.cru_ts_resolution,
+                                  haduk_grid_step=args.haduk_grid_step):
+        print(f"wrote: {file_path}")
+
+    cfg_path = write_roocs_cfg(args.archive_dir, os.path.join(args.archive_dir, "roocs.ini"))
+    print(f"wrote: {cfg_path}")
+
+
+if __name__ == "__main__":
+    main()
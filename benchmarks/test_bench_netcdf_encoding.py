@@ -0,0 +1,51 @@
+"""
+Benchmarks of the NetCDF encoding profiles: the time taken to write a
+full-domain HadUK-Grid subset against the size of the output file.
+
+The output size and the compression ratio (relative to the uncompressed
+size of the data) are recorded in `extra_info`.
+"""
+
+import glob
+import os
+
+import pytest
+import xarray as xr
+
+from benchmarks.synthetic import FIRST_YEAR
+from flamingo.utils.encoding_utils import parse_profile
+from flamingo.utils.output_utils import DatasetResults, write_to_netcdfs
+
+
+PROFILES = {
+    "uncompressed": {},
+    "zlib1-map": {"zlib": True, "complevel": 1},
+    "zlib4-map": {"zlib": True, "complevel": 4},
+    "zlib4-timeseries": {"zlib": True, "complevel": 4, "chunks": "timeseries"},
+    "zlib4-packed": {"zlib": True, "complevel": 4, "pack": True},
+}
+
+
+@pytest.fixture(scope="module")
+def haduk_grid_dataset(synthetic_archive):
+    file_paths = sorted(glob.glob(os.path.join(synthetic_archive, "badc", "**", "snowLying", "mon",
+                                               "*", f"*_{FIRST_YEAR}01-*.nc"), recursive=True))
+    file_paths += sorted(glob.glob(os.path.join(synthetic_archive, "badc", "**", "snowLying", "mon",
+                                                "*", f"*_{FIRST_YEAR + 1}01-*.nc"), recursive=True))
+
+    ds = xr.open_mfdataset(file_paths, use_cftime=True)
+    yield ds.load()
+    ds.close()
+
+
+@pytest.mark.parametrize("profile_name", list(PROFILES))
+def test_bench_netcdf_encoding(benchmark, tmp_path, haduk_grid_dataset, profile_name):
+    profile = parse_profile(PROFILES[profile_name])
+    results = DatasetResults([haduk_grid_dataset])
+
+    output_paths = benchmark.pedantic(write_to_netcdfs, args=(results, str(tmp_path), profile),
+                                      rounds=3, iterations=1, warmup_rounds=1)
+
+    output_bytes = os.path.getsize(output_paths[0])
+    benchmark.extra_info["output_bytes"] = output_bytes
+    benchmark.extra_info["compression_ratio"] = haduk_grid_dataset["snowLying"].nbytes / output_bytes
@@ -0,0 +1,88 @@
+"""
+Benchmarks of output file serving: downloading a large output in full
+and its second half (a Range request, only possible with the output
+server), through werkzeug's `static_files` (as `flamingo start` served
+outputs before), the output server middleware on the werkzeug server,
+and the output server with `os.sendfile`.
+"""
+
+import http.client
+import os
+import threading
+
+import pytest
+
+from werkzeug.middleware.shared_data import SharedDataMiddleware
+from werkzeug.serving import make_server
+
+from flamingo.utils.config_utils import parse_size
+from flamingo.utils.serve_utils import OutputServerMiddleware, make_output_server
+
+
+OUTPUT_SIZE = parse_size(os.environ.get("FLAMINGO_BENCH_OUTPUT_SIZE", "100mb"))
+
+
+def _not_found(environ, start_response):
+    start_response("404 Not Found", [("Content-Length", "0")])
+    return [b""]
+
+
+SERVERS = {
+    "static_files": lambda output_dir: make_server(
+        "127.0.0.1", 0, SharedDataMiddleware(_not_found, {"/outputs": output_dir}), threaded=True
+    ),
+    "middleware": lambda output_dir: make_server(
+        "127.0.0.1", 0, OutputServerMiddleware(_not_found, output_dir), threaded=True
+    ),
+    "sendfile": lambda output_dir: make_output_server(
+        OutputServerMiddleware(None, output_dir), "127.0.0.1", 0
+    ),
+}
+
+
+@pytest.fixture(scope="module")
+def output_dir(tmp_path_factory):
+    output_dir = tmp_path_factory.mktemp("outputs")
+
+    with open(output_dir / "output_001.nc", "wb") as writer:
+        block = os.urandom(1024 ** 2)
+        for _ in range(OUTPUT_SIZE // len(block)):
+            writer.write(block)
+
+    return str(output_dir)
+
+
+def _download(port, headers):
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    connection.request("GET", "/outputs/output_001.nc", headers=headers)
+    response = connection.getresponse()
+
+    size = 0
+    for block in iter(lambda: response.read(1024 ** 2), b""):
+        size += len(block)
+
+    connection.close()
+    return response.status, size
+
+
+@pytest.mark.parametrize("part", ["full", "range"])
+@pytest.mark.parametrize("server_name", list(SERVERS))
+def test_bench_outputs(benchmark, output_dir, server_name, part):
+    if server_name == "static_files" and part == "range":
+        pytest.skip("static_files does not support Range requests")
+
+    server = SERVERS[server_name](output_dir)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    size = os.path.getsize(os.path.join(output_dir, "output_001.nc"))
+    headers = {"Range": f"bytes={size // 2}-"} if part == "range" else {}
+
+    try:
+        status, received = benchmark.pedantic(_download, args=(server.server_port, headers),
+                                              rounds=5, iterations=1, warmup_rounds=1)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert received == (size - size // 2 if part == "range" else size)
+    assert status == (206 if part == "range" else 200)
@@ -0,0 +1,47 @@
+"""
+Benchmarks of the point extraction processes: the latency of extracting
+the time series at one and at ten locations, to compare with the "point"
+cases of the subset benchmarks.
+"""
+
+import os
+
+import pytest
+
+from pywps import Service
+from pywps.tests import client_for, assert_response_success
+
+from benchmarks.test_bench_subset import TIME_RANGE, _cru_ts_inputs, _haduk_grid_inputs
+from flamingo.processes.wps_point_cru_ts import ExtractPointsCRUTS
+from flamingo.processes.wps_point_haduk_grid import ExtractPointsHadUKGrid
+
+
+PYWPS_CFG = os.path.join(os.path.dirname(__file__), "pywps.cfg")
+
+LOCATIONS = {
+    "1": ["51.75,-1.25"],
+    "10": [f"{51 + i * 0.2:.2f},{-3 + i * 0.3:.2f}" for i in range(10)],
+}
+
+CASES = [
+    (proc_class, inputs, n_locations, output_type)
+    for proc_class, inputs in ((ExtractPointsCRUTS, _cru_ts_inputs), (ExtractPointsHadUKGrid, _haduk_grid_inputs))
+    for n_locations in LOCATIONS
+    for output_type in ("csv", "json")
+]
+
+
+@pytest.mark.parametrize(
+    "proc_class,inputs,n_locations,output_type", CASES,
+    ids=[f"{case[0].IDENTIFIER}-{case[2]}-{case[3]}" for case in CASES]
+)
+def test_bench_points(benchmark, synthetic_archive, proc_class, inputs, n_locations, output_type):
+    client = client_for(Service(processes=[proc_class()], cfgfiles=[PYWPS_CFG]))
+    locations = ";".join(f"locations={location}" for location in LOCATIONS[n_locations])
+    data_inputs = f"{inputs()};timeDateRange={TIME_RANGE};{locations};output_type={output_type}"
+
+    url = (f"?service=WPS&request=Execute&version=1.0.0"
+           f"&identifier={proc_class.IDENTIFIER}&datainputs={data_inputs}")
+
+    resp = benchmark.pedantic(client.get, args=(url,), rounds=3, iterations=1, warmup_rounds=1)
+    assert_response_success(resp)
@@ -0,0 +1,98 @@
+"""
+End-to-end benchmarks of the subset processes against the synthetic archive.
+
+Each benchmark sends a WPS Execute request through the PyWPS test client and
+records the latency (timed by pytest-benchmark), and in `extra_info` the peak
+resident memory of the process and the throughput of output data.
+"""
+
+import os
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from pywps import Service
+from pywps.tests import client_for, assert_response_success
+
+from benchmarks.synthetic import FIRST_YEAR
+from flamingo.processes.wps_subset_cru_ts import SubsetCRUTS
+from flamingo.processes.wps_subset_haduk_grid import SubsetHadUKGrid
+from flamingo.utils.metrics_utils import MemorySampler
+
+
+PYWPS_CFG = os.path.join(os.path.dirname(__file__), "pywps.cfg")
+METALINK_NS = "{urn:ietf:params:xml:ns:metalink}"
+
+TIME_RANGE = f"{FIRST_YEAR}-01-01/{FIRST_YEAR + 1}-12-31"
+
+CRU_TS_AREAS = {
+    "point": "-0.5,51,0.5,52",
+    "region": "-10,35,30,70",
+    "full": None,
+}
+
+HADUK_GRID_AREAS = {
+    "point": "-1.02,51.74,-0.98,51.76",
+    "region": "-3,51,1,54",
+    "full": None,
+}
+
+
+def _label(mapping, value):
+    "Returns the WPS input label that maps to `value` in a DSET_INFO mapping."
+    return next(label for label, item in mapping.items() if value in item)
+
+
+def _cru_ts_inputs():
+    info = SubsetCRUTS.DSET_INFO
+    return (f"dataset_version={_label(info['input_datasets'], 'cru_ts.4.04')};"
+            f"variable={_label(info['input_variables'], 'wet')}")
+
+
+def _haduk_grid_inputs():
+    info = SubsetHadUKGrid.DSET_INFO
+    return (f"dataset_version={_label(info['input_datasets'], 'v1.0.3.0')};"
+            f"variable={_label(info['input_variables'], 'snowLying')};"
+            f"frequency=Monthly;spatial_average=1km")
+
+
+CASES = [
+    (proc_class, inputs, area_name, area, output_type)
+    for proc_class, inputs, areas in (
+        (SubsetCRUTS, _cru_ts_inputs, CRU_TS_AREAS),
+        (SubsetHadUKGrid, _haduk_grid_inputs, HADUK_GRID_AREAS),
+    )
+    for area_name, area in areas.items()
+    for output_type in ("netcdf", "csv", "parquet", "zarr")
+]
+
+
+def _get_output_paths(resp):
+    metalink_path = resp.xpath("//wps:Reference/@href")[0][7:]  # trim off 'file://'
+    root = ET.parse(metalink_path).getroot()
+    return [element.find(f"{METALINK_NS}metaurl").text[7:]
+            for element in root.findall(f"{METALINK_NS}file")]
+
+
+@pytest.mark.parametrize(
+    "proc_class,inputs,area_name,area,output_type", CASES,
+    ids=[f"{case[0].IDENTIFIER}-{case[2]}-{case[4]}" for case in CASES]
+)
+def test_bench_subset(benchmark, synthetic_archive, proc_class, inputs, area_name, area, output_type):
+    client = client_for(Service(processes=[proc_class()], cfgfiles=[PYWPS_CFG]))
+    data_inputs = f"{inputs()};timeDateRange={TIME_RANGE};output_type={output_type}"
+    if area:
+        data_inputs += f";area={area}"
+
+    url = (f"?service=WPS&request=Execute&version=1.0.0"
+           f"&identifier={proc_class.IDENTIFIER}&datainputs={data_inputs}")
+
+    with MemorySampler(interval=0.01) as memory:
+        resp = benchmark.pedantic(client.get, args=(url,), rounds=3, iterations=1, warmup_rounds=1)
+
+    assert_response_success(resp)
+    output_bytes = sum(os.path.getsize(path) for path in _get_output_paths(resp))
+
+    benchmark.extra_info["peak_rss_bytes"] = memory.peak
+    benchmark.extra_info["output_bytes"] = output_bytes
+    benchmark.extra_info["output_bytes_per_second"] = output_bytes / benchmark.stats.stats.mean
@@ -4,9 +4,20 @@
 
 from .__version__ import __author__, __email__, __version__  # noqa: F401
 
-from clisops.config import get_config
-import flamingo
 
-CONFIG = get_config(flamingo)
+def __getattr__(name):
+    # CONFIG and the WSGI application are created on first use, so that
+    # importing flamingo does not import the scientific stack
+    if name == "CONFIG":
+        from clisops.config import get_config
+        import flamingo
 
-from .wsgi import application  # noqa: F401
+        flamingo.CONFIG = get_config(flamingo)
+        return flamingo.CONFIG
+
+    if name == "application":
+        from .wsgi import application
+
+        return application
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -13,6 +13,7 @@ from jinja2 import Environment, PackageLoader
 from pywps import configuration
 
 from . import wsgi
+from .utils.serve_utils import output_server_enabled
 from urllib.parse import urlparse
 
 PID_FILE = os.path.abspath(os.path.join(os.path.curdir, "pywps.pid"))
@@ -79,8 +80,10 @@ def _run(application, bind_host=None, daemon=False):
     # call this *after* app is initialized ... needs pywps config.
     host, port = get_host()
     bind_host = bind_host or host
-    # need to serve the wps outputs
-    static_files = {"/outputs": configuration.get_config_value("server", "outputpath")}
+    # need to serve the wps outputs (unless the application serves them itself)
+    static_files = None
+    if not output_server_enabled():
+        static_files = {"/outputs": configuration.get_config_value("server", "outputpath")}
     run_simple(
         hostname=bind_host,
         port=port,
@@ -119,6 +122,103 @@ def print_dump(dumpfile):
     print(content)
 
 
+@cli.command("build-index")
+@click.option(
+    "--config", "-c", metavar="PATH", help="path to pywps configuration file."
+)
+@click.argument("collections", nargs=-1)
+def build_index(config, collections):
+    """Build the file index for archive collections.
+
+    If no COLLECTIONS are given, all collections offered by the
+    processes are indexed.
+    """
+    from .processes import get_processes
+    from .utils.index_utils import build_indexes, get_process_collections
+
+    # Loads the configuration
+    wsgi.create_app([config] if config else None)
+
+    collections = collections or get_process_collections(get_processes())
+    for index_path in build_indexes(collections):
+        click.echo("wrote index: {}".format(index_path))
+
+
+@cli.command("build-mirror")
+@click.option(
+    "--config", "-c", metavar="PATH", help="path to pywps configuration file."
+)
+@click.argument("collections", nargs=-1)
+def build_mirror(config, collections):
+    """Build or update the time series mirror of archive collections.
+
+    If no COLLECTIONS are given, the collections listed in the [mirror]
+    section of the configuration are mirrored.
+    """
+    from .utils.config_utils import get_config_list
+    from .utils.mirror_utils import build_mirrors
+
+    # Loads the configuration
+    wsgi.create_app([config] if config else None)
+
+    collections = collections or get_config_list("mirror", "collections", [])
+    if not collections:
+        raise click.UsageError("No collections to mirror: give them as arguments or in the [mirror] section.")
+
+    for manifest_path in build_mirrors(collections):
+        click.echo("wrote mirror: {}".format(manifest_path))
+
+
+@cli.command()
+@click.option(
+    "--config", "-c", metavar="PATH", help="path to pywps configuration file."
+)
+@click.option(
+    "--lane", "-l", "lanes", multiple=True, help="queue lane(s) to take jobs from."
+)
+def workers(config, lanes):
+    """Run a job worker that executes queued subset jobs.
+
+    Run one instance per worker process wanted on this host.
+    """
+    from .utils.config_utils import get_config_float, get_config_int, get_config_list
+    from .utils.job_utils import DEFAULT_LANE, get_queue_path, run_worker
+
+    # Loads the configuration
+    wsgi.create_app([config] if config else None)
+
+    run_worker(
+        get_queue_path(),
+        lanes=lanes or get_config_list("jobs", "lanes", [DEFAULT_LANE]),
+        config_files=[config] if config else None,
+        poll_interval=get_config_float("jobs", "poll_interval", 1.0),
+        user_limit=get_config_int("jobs", "user_limit", 2),
+        retention=get_config_int("jobs", "retention", 86400),
+        max_attempts=get_config_int("jobs", "max_attempts", 3),
+    )
+
+
+@cli.command("serve-outputs")
+@click.option(
+    "--config", "-c", metavar="PATH", help="path to pywps configuration file."
+)
+@click.option(
+    "--bind-host", "-b", metavar="IP-ADDRESS", default="127.0.0.1", help="IP address used to bind service."
+)
+@click.option(
+    "--port", "-p", metavar="PORT", default=5001, type=int, help="port used to serve the outputs."
+)
+def serve_outputs(config, bind_host, port):
+    """Serve the output files on their own, with HTTP Range support.
+
+    Files are sent with os.sendfile. Point the outputurl of the
+    configuration at this server (or route its path to it).
+    """
+    from .utils.serve_utils import serve_outputs
+
+    serve_outputs(wsgi.create_output_app([config] if config else None), bind_host, port)
+
+
 @cli.command()
 def status():
     """Show status of PyWPS service"""
@@ -239,9 +339,11 @@ def start(
 
         if pid == 0:
             os.setsid()
+            wsgi.start_workers(cfgfiles)
             _run(app, bind_host=bind_host, daemon=True)
         else:
             os._exit(0)
     else:
         # no daemon
+        wsgi.start_workers(cfgfiles)
         _run(app, bind_host=bind_host)
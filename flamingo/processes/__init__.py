@@ -1,7 +1,37 @@
-from .wps_subset_cru_ts import SubsetCRUTS
-from .wps_subset_haduk_grid import SubsetHadUKGrid
+import importlib
 
-processes = [
-    SubsetCRUTS(),
-    SubsetHadUKGrid(),
-]
+# Registry of the processes offered by the service, as "module:class" paths.
+# The process modules are only imported when the processes are first used.
+PROCESS_CLASSES = {
+    "SubsetCRUTimeSeries": "flamingo.processes.wps_subset_cru_ts:SubsetCRUTS",
+    "SubsetHadUKGrid": "flamingo.processes.wps_subset_haduk_grid:SubsetHadUKGrid",
+    "ExtractPointsCRUTimeSeries": "flamingo.processes.wps_point_cru_ts:ExtractPointsCRUTS",
+    "ExtractPointsHadUKGrid": "flamingo.processes.wps_point_haduk_grid:ExtractPointsHadUKGrid",
+    "AggregateCRUTimeSeries": "flamingo.processes.wps_aggregate_cru_ts:AggregateCRUTS",
+    "AggregateHadUKGrid": "flamingo.processes.wps_aggregate_haduk_grid:AggregateHadUKGrid",
+    "BatchSubsetCRUTimeSeries": "flamingo.processes.wps_batch_cru_ts:BatchSubsetCRUTS",
+    "BatchSubsetHadUKGrid": "flamingo.processes.wps_batch_haduk_grid:BatchSubsetHadUKGrid",
+}
+
+_processes = []
+
+
+def get_process_class(identifier):
+    module_name, class_name = PROCESS_CLASSES[identifier].split(":")
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def get_processes():
+    "Returns an instance of each registered process (created on first use)."
+    if not _processes:
+        _processes.extend(get_process_class(identifier)() for identifier in PROCESS_CLASSES)
+
+    return _processes
+
+
+def __getattr__(name):
+    # Keep `from flamingo.processes import processes` working
+    if name == "processes":
+        return get_processes()
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,79 @@
+from pywps import LiteralInput
+from pywps.app.exceptions import ProcessError
+
+from flamingo.processes._wps_subset_base import SubsetBase, SubsetInputFactory
+from flamingo.utils.aggregate_utils import (
+    OPERATIONS, parse_polygon, get_polygon_bbox, aggregate_results
+)
+from flamingo.utils.input_utils import parse_wps_input
+
+
+class AggregateInputFactory(SubsetInputFactory):
+    "Input factory for the aggregation processes."
+
+    def _get_input_operation(self):
+        return LiteralInput(
+            "operation",
+            "Operation",
+            abstract="The aggregation to apply to the subset. Repeat the input to apply "
+                     "several operations in turn (e.g. area_mean then annual_mean).",
+            data_type="string",
+            allowed_values=OPERATIONS,
+            min_occurs=1,
+            max_occurs=len(OPERATIONS),
+        )
+
+    def _get_input_polygon(self):
+        return LiteralInput(
+            "polygon",
+            "Polygon",
+            abstract="The polygon to average over (with area_mean), as \"lon lat\" vertices "
+                     "separated by commas, e.g. \"-3 51, 1 51, 1 54, -3 54\".",
+            data_type="string",
+            min_occurs=0,
+            max_occurs=1,
+        )
+
+
+class AggregateBase(SubsetBase):
+    """
+    Base class of the processes that aggregate a subset (area means,
+    seasonal/annual means and climatologies) before writing it. They take
+    the dataset information and inputs of a subset process (named by
+    DSET_INFO_ID).
+    """
+
+    # REQUIRED class properties (as for SubsetBase), and:
+    #  DSET_INFO_ID = str
+
+    def _define_inputs(self):
+        return AggregateInputFactory(self.DSET_INFO).get_inputs(self.INPUTS_LIST)
+
+    def _get_polygon(self, request):
+        value = parse_wps_input(request.inputs, "polygon", default=None)
+        if not value:
+            return None
+
+        try:
+            return parse_polygon(value)
+        except ValueError as exc:
+            raise ProcessError(str(exc))
+
+    def _get_area(self, request):
+        # Only the bounding box of the polygon needs to be read
+        area = super(AggregateBase, self)._get_area(request)
+        polygon = self._get_polygon(request)
+
+        if area is None and polygon:
+            return get_polygon_bbox(polygon)
+
+        return area
+
+    def _get_postprocess(self, request):
+        return {
+            "operations": parse_wps_input(request.inputs, "operation", as_sequence=True, must_exist=True),
+            "polygon": self._get_polygon(request),
+        }
+
+    def _postprocess(self, results, options):
+        return aggregate_results(results, options["operations"], options["polygon"])
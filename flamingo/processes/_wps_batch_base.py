@@ -0,0 +1,265 @@
+import os
+import shutil
+from contextlib import ExitStack
+
+from pywps import ComplexInput, FORMATS
+from pywps.app.exceptions import ProcessError
+
+from flamingo.processes._wps_subset_base import SubsetBase, SubsetInputFactory
+from flamingo.utils.admission_utils import admission_enabled, estimate_subset
+from flamingo.utils.batch_utils import parse_batch, parse_area, get_union_area, group_subsets
+from flamingo.utils.coalesce_utils import run_coalesced
+from flamingo.utils.compute_utils import compute_context
+from flamingo.utils.config_utils import get_config_int, get_config_size
+from flamingo.utils.input_utils import parse_wps_input, get_collection_files, normalise_request
+from flamingo.utils.metalink_utils import build_metalink
+from flamingo.utils.metrics_utils import StageTimer
+from flamingo.utils.output_utils import DatasetResults, concat_time_slices
+from flamingo.utils.progress_utils import OutputProgress, partial_outputs_enabled
+from flamingo.utils.response_utils import populate_response
+from flamingo.utils.result_cache_utils import get_result_key, fetch_results, store_results
+
+import logging
+LOGGER = logging.getLogger("PYWPS")
+
+
+# The DSET_INFO entries holding the allowed values of the subset inputs
+INPUT_INFO_KEYS = {
+    "dataset_version": "input_datasets",
+    "variable": "input_variables",
+    "frequency": "input_frequencies",
+    "spatial_average": "input_spatial_averages",
+}
+
+
+class BatchInputFactory(SubsetInputFactory):
+    "Input factory for the batch subset processes."
+
+    def _get_input_subsets(self):
+        return ComplexInput(
+            "subsets",
+            "Subsets",
+            abstract="A JSON list of subset specifications. Each one is an object with the "
+                     "inputs of the subset process (e.g. \"dataset_version\", \"variable\", "
+                     "\"timeDateRange\" and \"area\" as \"min_lon,min_lat,max_lon,max_lat\").",
+            supported_formats=[FORMATS.JSON],
+            min_occurs=1,
+            max_occurs=1,
+        )
+
+
+class BatchSubsetBase(SubsetBase):
+    """
+    Base class of the processes that run many subsets of a dataset in one
+    request. They take the dataset information of a subset process (named
+    by DSET_INFO_ID) and the same inputs for each subset, given as JSON.
+
+    Subsets of the same collection and time range share their reads: the
+    files are opened once and the union of the areas is read once.
+    """
+
+    # REQUIRED class properties (as for SubsetBase), and:
+    #  DSET_INFO_ID = str
+    #  SUBSET_INPUTS = [list] (the INPUTS_LIST of the subset process)
+
+    def _define_inputs(self):
+        return BatchInputFactory(self.DSET_INFO).get_inputs(self.INPUTS_LIST)
+
+    def _parse_subset(self, item):
+        """
+        Returns a subset specification (the collection, time range and area)
+        from an item of the batch, checking its inputs as WPS would.
+        """
+        for key in self.SUBSET_INPUTS:
+            if key not in INPUT_INFO_KEYS:
+                continue
+
+            # JSON lists and objects are not valid values (nor hashable)
+            value = item.get(key)
+            if not isinstance(value, str) or value not in self.DSET_INFO[INPUT_INFO_KEYS[key]]:
+                raise ValueError(f'Invalid or missing value for "{key}": {value!r}')
+
+        if not isinstance(item.get("timeDateRange") or "", str):
+            raise ValueError(f'Invalid value for "timeDateRange": {item["timeDateRange"]!r}')
+
+        collection = self._build_collection(self.DSET_INFO["input_datasets"][item["dataset_version"]],
+                                            self.DSET_INFO["input_variables"][item["variable"]])
+
+        return {
+            "collection": collection,
+            "time": item.get("timeDateRange") or None,
+            "area": parse_area(item.get("area")),
+        }
+
+    def _subset_group(self, collection, time, subsets):
+        """
+        Opens the files of `collection` once and returns, for each subset
+        of the group, the list of its Datasets.
+        """
+        from clisops.ops.subset import subset
+        from clisops.parameter._utils import interval
+        from clisops.utils.file_utils import FileMapper
+        from daops.utils.core import open_dataset
+
+        union = get_union_area([item["area"] for item in subsets])
+        resolved = self._resolve_collection(collection, interval(time) if time else None, union)
+        file_paths = resolved.file_paths if isinstance(resolved, FileMapper) else get_collection_files(collection)
+        ds = open_dataset(collection, file_paths, apply_fixes=False)
+
+        # The subset may be split into several time slices (see the clisops file_size_limit)
+        shared = concat_time_slices(subset(ds, time=interval(time) if time else None, area=union,
+                                           output_type="xarray"))
+
+        # Read the shared subset once if it fits in memory
+        if shared.nbytes <= get_config_size("batch", "max_memory", "1gb"):
+            shared = shared.load()
+
+        return [subset(shared, area=item["area"], output_type="xarray") if item["area"] else [shared]
+                for item in subsets]
+
+    def _estimate(self, inputs, output_format):
+        """
+        Returns the estimated size of the batch: each group reads the union
+        of the areas of its subsets once, and writes the outputs of each of
+        its subsets. Returns None if any collection is not indexed.
+        """
+        estimate = {"read_bytes": 0, "output_bytes": 0, "files": 0}
+
+        for (collection, time), members in group_subsets(inputs["subsets"]).items():
+            time_range = time.split("/") if time else None
+            union = get_union_area([item["area"] for _, item in members])
+
+            group_estimate = estimate_subset([collection], time_range, union, output_format)
+            if group_estimate is None:
+                return None
+
+            estimate["read_bytes"] += group_estimate["read_bytes"]
+            estimate["files"] += group_estimate["files"]
+
+            for _, item in members:
+                estimate["output_bytes"] += estimate_subset([collection], time_range, item["area"],
+                                                            output_format)["output_bytes"]
+
+        return estimate
+
+    def _run_subset(self, inputs, output_format, progress=None, timer=None, request_uuid=None):
+        """
+        Runs every subset of the batch and writes the results in the
+        requested format. The outputs of each subset are published as soon
+        as they are written (see `SubsetBase._run_subset`).
+        Returns the list of output file paths.
+        """
+        progress = progress or (lambda message, status_percentage=None: None)
+        timer = timer or StageTimer(self.IDENTIFIER)
+
+        subsets = inputs["subsets"]
+        groups = group_subsets(subsets)
+        output_uris = []
+
+        request_uuid = request_uuid or self.uuid
+        output_progress = None
+        if request_uuid and partial_outputs_enabled():
+            output_progress = OutputProgress(request_uuid, progress, len(subsets), output_format,
+                                             start=10, end=90)
+
+        with compute_context(self.DSET_INFO), ExitStack() as stack:
+            if output_progress:
+                stack.enter_context(output_progress.task_progress)
+
+            for n, ((collection, time), members) in enumerate(groups.items()):
+                progress(f"Subsetting {collection} ({n + 1} of {len(groups)})", 10 + 80 * n // len(groups))
+
+                with timer.stage("subset"):
+                    try:
+                        results = self._subset_group(collection, time, [item for _, item in members])
+                    except ProcessError:
+                        raise
+                    except Exception as exc:
+                        raise ProcessError(f"An error was reported with this job as follows: {str(exc)}")
+
+                for (index, _), datasets in zip(members, results):
+                    subset_uris = self._write_subset(index, datasets, output_format, progress, timer)
+                    output_uris.extend(subset_uris)
+
+                    if output_progress:
+                        output_progress.add(subset_uris)
+
+        progress("Wrote output files", 90)
+        return output_uris
+
+    def _write_subset(self, index, datasets, output_format, progress, timer):
+        """
+        Writes the Datasets of subset number `index` of the batch, with the
+        prefix "subset_XX_" to keep the names of the outputs unique.
+        """
+        prefix = f"subset_{index + 1:02d}"
+        output_dir = os.path.join(self.workdir, prefix)
+        os.makedirs(output_dir, exist_ok=True)
+
+        output_uris = []
+        for output_uri in self._write_outputs(DatasetResults(datasets), output_format, output_dir,
+                                              progress, timer):
+            target = os.path.join(self.workdir, f"{prefix}_{os.path.basename(output_uri)}")
+            shutil.move(output_uri, target)
+            output_uris.append(target)
+
+        shutil.rmtree(output_dir, ignore_errors=True)
+        return output_uris
+
+    def _run_handler(self, request, response, timer):
+
+        with timer.stage("input_parsing"):
+            output_format = parse_wps_input(request.inputs, "output_type", must_exist=True)
+
+            try:
+                subsets = [self._parse_subset(item) for item in parse_batch(
+                    request.inputs["subsets"][0].data, get_config_int("batch", "max_subsets", 50)
+                )]
+            except ValueError as exc:
+                raise ProcessError(str(exc))
+
+            inputs = {
+                "subsets": subsets,
+                "output_dir": self.workdir,
+                "output_type": output_format,
+                "apply_fixes": False,
+            }
+
+        collections = list(dict.fromkeys(item["collection"] for item in subsets))
+
+        with timer.stage("result_cache_lookup"):
+            result_key = get_result_key([
+                normalise_request(self.IDENTIFIER, item["collection"], item["time"] and item["time"].split("/"),
+                                  item["area"], output_format,
+                                  output_options=self._get_output_options(output_format))
+                for item in subsets
+            ])
+            output_uris = fetch_results(result_key, self.workdir)
+
+        if output_uris is None:
+            def run():
+                estimate, large = None, False
+                if admission_enabled():
+                    with timer.stage("admission"):
+                        estimate, large = self._admit(inputs, output_format, response)
+
+                output_uris = self._execute(request, response, inputs, output_format, timer,
+                                            estimate=estimate, large=large)
+                store_results(result_key, output_uris)
+                return output_uris
+
+            output_uris = run_coalesced(result_key, self.workdir, run, progress=response.update_status)
+
+        with timer.stage("metalink_build"):
+            ml4 = build_metalink(
+                self.METALINK_ID,
+                "Batch subsetting results into output file(s).",
+                self.workdir,
+                output_uris,
+                output_format,
+                request_uuid=self.uuid
+            )
+
+        LOGGER.warning("Populating response object...")
+        with timer.stage("provenance_write"):
+            populate_response(response, "subset", self.workdir, inputs, collections, ml4)
@@ -0,0 +1,162 @@
+from pywps import LiteralInput
+from pywps.app.exceptions import ProcessError
+
+from flamingo.processes._wps_subset_base import SubsetBase, SubsetInputFactory
+from flamingo.utils.coalesce_utils import run_coalesced
+from flamingo.utils.decompress_utils import decompress_files
+from flamingo.utils.index_utils import select_files
+from flamingo.utils.input_utils import parse_wps_input, get_collection_files, normalise_request
+from flamingo.utils.metalink_utils import build_metalink
+from flamingo.utils.mirror_utils import select_mirror_files
+from flamingo.utils.point_utils import (
+    parse_point, get_points_bbox, read_point_series, write_point_series, POINT_FORMATS
+)
+from flamingo.utils.response_utils import populate_response
+from flamingo.utils.result_cache_utils import get_result_key, fetch_results, store_results
+
+import logging
+LOGGER = logging.getLogger("PYWPS")
+
+
+# Maximum number of locations in one request
+MAX_LOCATIONS = 100
+
+
+class PointInputFactory(SubsetInputFactory):
+    "Input factory for the point extraction processes."
+
+    def _get_input_locations(self):
+        return LiteralInput(
+            "locations",
+            "Locations",
+            abstract="A location to extract the time series at, as \"latitude,longitude\" "
+                     "(e.g. \"51.75,-1.25\"). Repeat the input for several locations.",
+            data_type="string",
+            min_occurs=1,
+            max_occurs=MAX_LOCATIONS,
+        )
+
+    def _get_input_variable(self):
+        # The time series of one variable are extracted per request
+        variable = super(PointInputFactory, self)._get_input_variable()
+        variable.max_occurs = 1
+        return variable
+
+    def _get_input_output_type(self):
+        return LiteralInput(
+            "output_type",
+            "Output Format",
+            abstract="The file format required for you output data.",
+            data_type="string",
+            allowed_values=list(POINT_FORMATS),
+            min_occurs=1,
+            max_occurs=1,
+        )
+
+
+class PointExtractBase(SubsetBase):
+    """
+    Base class of the processes that extract time series at points of a
+    dataset. They take the dataset information and inputs of a subset
+    process (named by DSET_INFO_ID) and run in the request, without the
+    job workers: only the grid cells nearest to the points are read.
+    """
+
+    # REQUIRED class properties (as for SubsetBase), and:
+    #  DSET_INFO_ID = str
+
+    def _define_inputs(self):
+        return PointInputFactory(self.DSET_INFO).get_inputs(self.INPUTS_LIST)
+
+    def _get_files(self, collection, time, points):
+        """
+        Returns the (decompressed) files of the collection that overlap the
+        requested time range and the points, from the time series mirror of
+        the collection if it reads less.
+        """
+        mirror_paths = select_mirror_files(collection, time, get_points_bbox(points))
+        if mirror_paths is not None:
+            return mirror_paths
+
+        file_paths = select_files(collection, time, get_points_bbox(points))
+
+        if file_paths is None:
+            file_paths = get_collection_files(collection)
+
+        if not file_paths:
+            raise ProcessError("No data files were found for the requested time range and locations.")
+
+        return decompress_files(file_paths)
+
+    def _run_extraction(self, collection, variable, points, time, output_format, timer):
+        "Extracts the point time series and returns the list of output file paths."
+        time_value = getattr(time, "value", time) or (None, None)
+        start, end = [str(value).replace(" ", "T") if value else None for value in time_value]
+
+        with timer.stage("file_discovery"):
+            file_paths = self._get_files(collection, time, points)
+
+        with timer.stage("point_extraction"):
+            try:
+                series = read_point_series(file_paths, variable, points, start, end)
+            except ValueError as exc:
+                raise ProcessError(str(exc))
+            except Exception as exc:
+                raise ProcessError(f"An error was reported with this job as follows: {str(exc)}")
+
+        with timer.stage("point_write"):
+            return write_point_series(series, self.workdir, output_format)
+
+    def _run_handler(self, request, response, timer):
+
+        with timer.stage("input_parsing"):
+            output_format = parse_wps_input(request.inputs, "output_type", must_exist=True)
+            time = parse_wps_input(request.inputs, "timeDateRange", as_interval=True, default=None)
+
+            try:
+                points = [parse_point(value) for value in
+                          parse_wps_input(request.inputs, "locations", as_sequence=True, must_exist=True)]
+            except ValueError as exc:
+                raise ProcessError(str(exc))
+
+        with timer.stage("collection_resolution"):
+            collection = self._get_collection(request.inputs)
+            variable = self.DSET_INFO["input_variables"][
+                parse_wps_input(request.inputs, "variable", must_exist=True)
+            ]
+
+        with timer.stage("result_cache_lookup"):
+            cache_request = normalise_request(self.IDENTIFIER, collection, time, None, output_format)
+            cache_request["locations"] = [[round(lat, 4), round(lon, 4)] for lat, lon in points]
+
+            result_key = get_result_key(cache_request)
+            output_uris = fetch_results(result_key, self.workdir)
+
+        if output_uris is None:
+            def run():
+                response.update_status("Extracting time series", 10)
+                output_uris = self._run_extraction(collection, variable, points, time, output_format, timer)
+                store_results(result_key, output_uris)
+                return output_uris
+
+            output_uris = run_coalesced(result_key, self.workdir, run, progress=response.update_status)
+
+        with timer.stage("metalink_build"):
+            ml4 = build_metalink(
+                self.METALINK_ID,
+                "Time series extracted at the requested locations.",
+                self.workdir,
+                output_uris,
+                output_format
+            )
+
+        inputs = {
+            "time": time,
+            "locations": [f"{lat},{lon}" for lat, lon in points],
+            "output_type": output_format,
+            "apply_fixes": False,
+        }
+
+        LOGGER.warning("Populating response object...")
+        with timer.stage("provenance_write"):
+            populate_response(response, "extract_points", self.workdir, inputs, collection, ml4)
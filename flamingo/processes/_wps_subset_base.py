@@ -1,6 +1,5 @@
 import os
-
-from daops.ops.subset import subset
+from contextlib import ExitStack
 
 from pywps import (
     BoundingBoxInput,
@@ -13,17 +12,58 @@ from pywps import (
 from pywps.app.Common import Metadata
 from pywps.app.exceptions import ProcessError
 
-from flamingo.utils.input_utils import parse_wps_input
+from flamingo.utils.admission_utils import (
+    admission_enabled, estimate_subset, describe_estimate, check_estimate, get_large_job_slots,
+    get_large_lane
+)
+from flamingo.utils.coalesce_utils import run_coalesced
+from flamingo.utils.compute_utils import compute_context
+from flamingo.utils.config_utils import get_config_float, get_config_int, get_config_list, get_config_value
+from flamingo.utils.decompress_utils import decompress_files, pin_decompressed_files
+from flamingo.utils.encoding_utils import get_netcdf_profile
+from flamingo.utils.index_utils import select_files
+from flamingo.utils.job_utils import DEFAULT_LANE, jobs_enabled, get_request_user, run_job
+from flamingo.utils.input_utils import (
+    parse_wps_input, get_collection_files, to_file_mapper, normalise_request
+)
 from flamingo.utils.metalink_utils import build_metalink
-from flamingo.utils.output_utils import write_to_csvs
+from flamingo.utils.metrics_utils import StageTimer, profile_job
+from flamingo.utils.mirror_utils import select_mirror_files
+from flamingo.utils.output_utils import (
+    DatasetResults, merge_datasets, write_to_csvs, write_to_netcdfs, write_to_tables, write_to_zarrs,
+    parse_chunks, get_zarr_compressor
+)
+from flamingo.utils.progress_utils import OutputProgress, partial_outputs_enabled
 from flamingo.utils.response_utils import populate_response
-
-# Load content information about datasets and inputs
-from ceda_wps_assets.flamingo import get_dset_info
+from flamingo.utils.result_cache_utils import get_result_key, fetch_results, store_results
 
 import logging
 LOGGER = logging.getLogger("PYWPS")
 
+
+PROCESS_METADATA = [
+    Metadata("CEDA WPS UI", "https://ceda-wps-ui.ceda.ac.uk"),
+    Metadata("CEDA WPS", "https://ceda-wps.ceda.ac.uk"),
+    Metadata("Disclaimer", "https://help.ceda.ac.uk/article/4642-disclaimer"),
+]
+
+
+class DsetInfo:
+    """
+    Descriptor giving the content information about the datasets and inputs
+    of a process class. It is loaded from `ceda_wps_assets` (using the
+    DSET_INFO_ID of the class if it has one, or else its IDENTIFIER) the
+    first time it is used.
+    """
+
+    def __get__(self, instance, owner):
+        if "_dset_info" not in owner.__dict__:
+            from ceda_wps_assets.flamingo import get_dset_info
+            owner._dset_info = get_dset_info(getattr(owner, "DSET_INFO_ID", owner.IDENTIFIER))
+
+        return owner._dset_info
+
+
 class SubsetInputFactory:
     """
     Factory class for returning a list of WPS Input objects.
@@ -58,10 +98,24 @@ class SubsetInputFactory:
         return LiteralInput(
             "variable",
             "Variable",
-            abstract="The variable to subset",
+            abstract="The variable to subset. Repeat the input to subset several variables "
+                     "in one request.",
             data_type="string",
             allowed_values=list(self.DSET_INFO["input_variables"].keys()),
             min_occurs=1,
+            max_occurs=len(self.DSET_INFO["input_variables"]),
+        )
+
+    def _get_input_merge(self):
+        return LiteralInput(
+            "merge",
+            "Merge Variables",
+            abstract="Write the variables of a multi-variable subset to the same output "
+                     "file(s), instead of one set of outputs per variable.",
+            data_type="boolean",
+            default=False,
+            min_occurs=0,
+            max_occurs=1,
         )
 
     def _get_input_frequency(self):
@@ -111,7 +165,7 @@ class SubsetInputFactory:
             "Output Format",
             abstract="The file format required for you output data.",
             data_type="string",
-            allowed_values=["netcdf", "csv"],
+            allowed_values=["netcdf", "csv", "parquet", "feather", "zarr"],
             min_occurs=1,
             max_occurs=1,
         )
@@ -125,9 +179,9 @@ class SubsetBase(Process):
     #  ABSTRACT = str
     #  KEYWORDS = [list]
     #  METALINK_ID = str
-    #  DSET_INFO = str
     #  INPUTS_LIST = [list]
-    #  PROCESS_METADATA = [list]
+
+    DSET_INFO = DsetInfo()
 
     def __init__(self):
 
@@ -140,7 +194,7 @@ class SubsetBase(Process):
             title=self.TITLE,
             abstract=self.ABSTRACT,
             keywords=self.KEYWORDS,
-            metadata=self.PROCESS_METADATA,
+            metadata=self._get_process_metadata(),
             version="1.0.0",
             inputs=inputs,
             outputs=outputs,
@@ -148,6 +202,11 @@ class SubsetBase(Process):
             status_supported=True,
         )
 
+    def _get_process_metadata(self):
+        return PROCESS_METADATA + [
+            Metadata(name, url) for name, url in self.DSET_INFO["catalogue_records"].items()
+        ]
+
     def _define_inputs(self):
         inputs = SubsetInputFactory(self.DSET_INFO).get_inputs(self.INPUTS_LIST)
         return inputs
@@ -174,64 +233,461 @@ class SubsetBase(Process):
                 abstract="Provenance document as diagram.",
                 as_reference=True,
                 supported_formats=[
-                    Format("image/png", extension=".png", encoding="base64")
+                    Format("image/png", extension=".png", encoding="base64"),
+                    Format("image/svg+xml", extension=".svg"),
                 ],
             ),
         ]
 
         return outputs
 
-    def _get_collection(self, inputs):
+    def _build_collection(self, dataset_version, variable):
         raise NotImplementedError()
 
-    def _handler(self, request, response):
+    def _get_collection(self, inputs):
+        return self._get_collections(inputs)[0]
 
-        LOGGER.warning("Starting work...")
-        output_format = parse_wps_input(request.inputs, "output_type", must_exist=True)
-
-        output_type = output_format
-        if output_format == "csv":
-            output_type = "xarray" 
-
-        collection = self._get_collection(request.inputs)
-
-        inputs = {
-            "collection": collection,
-            "time": parse_wps_input(request.inputs, "timeDateRange", as_interval=True, 
-                                    default=None),
-            "area": parse_wps_input(request.inputs, "area", default=None),
-            "output_dir": self.workdir,
-            "file_namer": "simple",
-            "output_type": output_type,
-            "apply_fixes": False
-        }
+    def _get_collections(self, inputs):
+        "Returns the collections of the requested variables, in the order they were given."
+        dataset_version = self.DSET_INFO["input_datasets"][
+            parse_wps_input(inputs, "dataset_version", must_exist=True)
+        ]
+        variables = parse_wps_input(inputs, "variable", as_sequence=True, must_exist=True)
+
+        return [
+            self._build_collection(dataset_version, self.DSET_INFO["input_variables"][variable])
+            for variable in dict.fromkeys(variables)
+        ]
+
+    def get_collections(self):
+        "Returns all the collection identifiers that this process can subset."
+        return [
+            self._build_collection(dataset_version, variable)
+            for dataset_version in self.DSET_INFO["input_datasets"].values()
+            for variable in self.DSET_INFO["input_variables"].values()
+        ]
+
+    def _resolve_collection(self, collection, time=None, area=None):
+        """
+        Returns the collection argument to pass to `subset`. If the collection
+        has a time series mirror (see `mirror_utils`) that reads less for the
+        requested time and area, its files are used. If the collection has
+        been indexed, only the files overlapping the requested time and area
+        are used. Compressed archive files are swapped for cached,
+        decompressed copies. Otherwise the collection identifier is passed
+        through unchanged.
+        """
+        mirror_paths = select_mirror_files(collection, time, area)
+        if mirror_paths is not None:
+            return to_file_mapper(mirror_paths, os.path.join(self.workdir, "inputs"))
+
+        file_paths = select_files(collection, time, area)
+        indexed = file_paths is not None
+
+        if not indexed:
+            file_paths = get_collection_files(collection)
+
+        if not file_paths:
+            raise ProcessError("No data files were found for the requested time range and area.")
+
+        resolved_paths = decompress_files(file_paths)
+
+        if resolved_paths == file_paths and not indexed:
+            return collection
+
+        return to_file_mapper(resolved_paths, os.path.join(self.workdir, "inputs"))
+
+    def _run_subset(self, inputs, output_format, progress=None, timer=None, request_uuid=None):
+        """
+        Runs the subset and writes the results in the requested format.
+        Progress is reported by calling `progress(message, percentage)` and
+        the stages are timed with `timer` (a `StageTimer`). The outputs are
+        published as they are written in the output directory of the request
+        `request_uuid` (by default, the UUID of this process), if it is set
+        (see `progress_utils`).
+        Returns the list of output file paths.
+        """
+        from daops.ops.subset import subset
+
+        progress = progress or (lambda message, status_percentage=None: None)
+        timer = timer or StageTimer(self.IDENTIFIER)
+
+        # A list of collections is given for a multi-variable subset
+        collections = inputs["collection"]
+        if not isinstance(collections, list):
+            collections = [collections]
+
+        progress("Finding input files", 5)
+        with timer.stage("file_discovery"):
+            resolved = [self._resolve_collection(collection, inputs["time"], inputs["area"])
+                        for collection in collections]
+        subset_inputs = dict(inputs)
+        postprocess = subset_inputs.pop("postprocess", None)
+        merge = subset_inputs.pop("merge", False)
 
         LOGGER.warning("Beginning processing...")
+        progress("Subsetting data", 10)
+
+        with compute_context(self.DSET_INFO):
+            with timer.stage("subset"):
+                try:
+                    if len(resolved) == 1:
+                        results = subset(**dict(subset_inputs, collection=resolved[0]))
+                    else:
+                        results = self._subset_collections(subset_inputs, collections, resolved)
+                except Exception as exc:
+                    raise ProcessError(f"An error was reported with this job as follows: {str(exc)}")
+
+            if merge:
+                with timer.stage("merge"):
+                    try:
+                        results = merge_datasets(results)
+                    except Exception as exc:
+                        raise ProcessError(f"The variables could not be merged: {str(exc)}")
+
+            if postprocess:
+                with timer.stage("postprocess"):
+                    try:
+                        results = self._postprocess(results, postprocess)
+                    except ValueError as exc:
+                        raise ProcessError(str(exc))
+
+            LOGGER.warning("Wrote results")
+            if inputs["output_type"] == "netcdf":
+                output_uris = results.file_uris
+            else:
+                output_progress = self._get_output_progress(results, output_format, progress, request_uuid)
+                with ExitStack() as stack:
+                    if output_progress:
+                        stack.enter_context(output_progress.task_progress)
+
+                    output_uris = self._write_outputs(results, output_format, self.workdir, progress, timer,
+                                                      output_progress=output_progress)
+
+        progress("Wrote output files", 90)
+        return output_uris
+
+    def _subset_collections(self, inputs, collections, resolved):
+        """
+        Subsets several collections (e.g. the variables of a multi-variable
+        request) with the same inputs. The (lazy) Datasets of all the
+        collections are returned together, to be computed by the same dask
+        scheduler when they are written. The collections are opened one at
+        a time, as the HDF5 library is not safe to open files from several
+        threads.
+
+        Params:
+        :inputs [dict]: the subset inputs (except the collection)
+        :collections [list]: the collection identifiers
+        :resolved [list]: the collection arguments to pass to `subset` (see `_resolve_collection`)
+
+        Returns:
+        :results [DatasetResults]: the Datasets of each collection
+        """
+        from daops.ops.subset import subset
+
+        subsets = [subset(**dict(inputs, collection=collection, output_type="xarray"))
+                   for collection in resolved]
+
+        results = DatasetResults()
+        for collection, result in zip(collections, subsets):
+            for result_list in result._results.values():
+                results.add(collection, result_list)
+
+        return results
+
+    def _get_output_progress(self, results, output_format, progress, request_uuid=None):
+        """
+        Returns an `OutputProgress` publishing the outputs of the subset
+        `results` as they are written, or None if partial outputs are
+        disabled or the request is not known.
+        """
+        request_uuid = request_uuid or self.uuid
+        if not request_uuid or not partial_outputs_enabled():
+            return None
+
+        n_outputs = sum(len(result_list) for result_list in results._results.values())
+        return OutputProgress(request_uuid, progress, n_outputs, output_format)
+
+    def _write_outputs(self, results, output_format, output_dir, progress, timer, output_progress=None):
+        """
+        Writes the Datasets of subset `results` to `output_dir` in the
+        requested format. The paths of each output are passed to
+        `output_progress` (an `OutputProgress`, or None) as soon as it is
+        written. Returns the list of output file paths.
+        """
+        on_output = output_progress.add if output_progress else None
+
+        if output_format == "netcdf":
+            progress("Writing NetCDF files", 70)
+            with timer.stage("netcdf_write"):
+                try:
+                    return write_to_netcdfs(results, output_dir, get_netcdf_profile(self.DSET_INFO),
+                                            on_output=on_output)
+                except Exception as exc:
+                    raise ProcessError(f"An error occurred when writing NetCDF output: {str(exc)}")
+        elif output_format in ("parquet", "feather"):
+            progress(f"Converting to {output_format}", 70)
+            with timer.stage("table_conversion"):
+                try:
+                    return write_to_tables(
+                        results, output_dir, fmt=output_format,
+                        compression=get_config_value("tabular", "compression", "zstd"), on_output=on_output
+                    )
+                except Exception as exc:
+                    raise ProcessError(f"An error occurred when converting to {output_format}: {str(exc)}")
+        elif output_format == "zarr":
+            progress("Writing Zarr stores", 70)
+            with timer.stage("zarr_write"):
+                try:
+                    return self._write_zarrs(results, output_dir, on_output=on_output)
+                except Exception as exc:
+                    raise ProcessError(f"An error occurred when writing Zarr output: {str(exc)}")
+        else:
+            progress("Converting to CSV", 70)
+            with timer.stage("csv_conversion"):
+                try:
+                    # Output type must be: "csv"
+                    return self._write_csvs(results, output_dir, on_output=on_output)
+                except Exception as exc:
+                    raise ProcessError(f"An error occurred when converting to CSV: {str(exc)}")
+
+    def _get_output_options(self, output_format):
+        """
+        Returns the settings (of the configuration and `DSET_INFO`) that
+        change the output files written in `output_format`, or None.
+        """
+        if output_format == "netcdf":
+            return {"profile": get_netcdf_profile(self.DSET_INFO)}
+        elif output_format in ("parquet", "feather"):
+            return {"compression": get_config_value("tabular", "compression", "zstd")}
+        elif output_format == "zarr":
+            return {
+                "layout": get_config_value("zarr", "layout", "zip"),
+                "chunks": get_config_list("zarr", "chunks", ["time:12"]),
+                "compressor": get_config_value("zarr", "compressor", "lz4"),
+                "compression_level": get_config_int("zarr", "compression_level", 5),
+            }
+
+        return None
+
+    def _get_area(self, request):
+        "Returns the area to subset over from the request inputs, or None."
+        return parse_wps_input(request.inputs, "area", default=None)
+
+    def _get_postprocess(self, request):
+        """
+        Returns the options of the post-processing step (see `_postprocess`)
+        from the request inputs, or None if the results are written as they
+        are. Sub-classes that transform the subset override this method.
+        """
+        return None
+
+    def _postprocess(self, results, options):
+        """
+        Transforms the (lazy) Datasets in the subset `results` before they
+        are written, using the options returned by `_get_postprocess`.
+        Returns the results.
+        """
+        return results
+
+    def _write_csvs(self, results, output_dir, on_output=None):
+        """
+        Writes the subset results to CSV files, converted by a pool of
+        processes as set in the `[csv]` configuration section (by default,
+        one per dask worker of the job).
+        """
+        import dask
+
+        workers = get_config_int("csv", "workers", 0) or dask.config.get("num_workers", None) or 1
+
+        return write_to_csvs(results, output_dir, workers=workers,
+                             slab_size=get_config_int("csv", "slab_size", 5000000),
+                             start_method=get_config_value("csv", "start_method", "forkserver"),
+                             on_output=on_output)
+
+    def _write_zarrs(self, results, output_dir, on_output=None):
+        "Writes the subset results to Zarr stores, as set in the `[zarr]` configuration section."
+        compressor = get_zarr_compressor(get_config_value("zarr", "compressor", "lz4"),
+                                         get_config_int("zarr", "compression_level", 5))
+
+        return write_to_zarrs(results, output_dir,
+                              chunks=parse_chunks(get_config_list("zarr", "chunks", ["time:12"])),
+                              compressor=compressor,
+                              layout=get_config_value("zarr", "layout", "zip"), on_output=on_output)
+
+    def _estimate(self, inputs, output_format):
+        """
+        Returns the estimated size of the subset from the file index (see
+        `admission_utils.estimate_subset`), or None if the collections are
+        not indexed.
+        """
+        collections = inputs["collection"]
+        if not isinstance(collections, list):
+            collections = [collections]
+
+        return estimate_subset(collections, inputs["time"], inputs["area"], output_format)
+
+    def _admit(self, inputs, output_format, response):
+        """
+        Estimates the size of the subset from the file index and checks it
+        against the `[admission]` limits (see `admission_utils`). The
+        estimate is reported in the status of the job.
+
+        Returns the estimate (or None if the collections are not indexed)
+        and True if the subset should run as a large job. Raises a
+        ProcessError if it is too large to run.
+        """
+        estimate = self._estimate(inputs, output_format)
+        if estimate is None:
+            LOGGER.info("The collections are not indexed: the size of the subset is not estimated")
+            return None, False
+
+        LOGGER.info(f"{describe_estimate(estimate)}: {estimate}")
+
         try:
-            results = subset(**inputs)
-        except Exception as exc:
-            raise ProcessError(f"An error was reported with this job as follows: {str(exc)}")
+            large = check_estimate(estimate, self.workdir)
+        except ValueError as exc:
+            raise ProcessError(str(exc))
+
+        response.update_status(describe_estimate(estimate), 2)
+        return estimate, large
+
+    def _execute(self, request, response, inputs, output_format, timer, estimate=None, large=False):
+        """
+        Runs the subset, in the job worker pool if it is enabled, or else
+        in this process. Large jobs run in the lane of large jobs, or else
+        wait (at most `[admission] wait_timeout` seconds) for a slot for
+        large jobs on this host. Returns the list of output file paths.
+        """
+        if not jobs_enabled():
+            if not large:
+                return self._run_subset(inputs, output_format, progress=response.update_status, timer=timer)
+
+            response.update_status("Waiting to run as a large job", 3)
+            wait_timeout = get_config_float("admission", "wait_timeout", 3600)
+
+            with ExitStack() as stack:
+                try:
+                    stack.enter_context(get_large_job_slots().acquire(1, timeout=wait_timeout))
+                except TimeoutError:
+                    raise ProcessError(f"The service is busy with other large jobs: no slot was free after "
+                                       f"{wait_timeout:g} seconds. Please try again later.")
+
+                return self._run_subset(inputs, output_format, progress=response.update_status, timer=timer)
+
+        kwargs = {
+            "identifier": self.IDENTIFIER,
+            "inputs": inputs,
+            "output_format": output_format,
+            "workdir": self.workdir,
+            "job_id": str(self.uuid),
+        }
 
-        LOGGER.warning("Wrote results")
-        if output_type == "netcdf":
-            output_uris = results.file_uris
-        else:
+        lane = get_large_lane() if large else DEFAULT_LANE
+        message = f"Job queued in the {lane} lane"
+        if estimate:
+            message = f"{describe_estimate(estimate)}. {message}"
+
+        try:
+            return run_job("flamingo.utils.subset_utils:run_process_subset", kwargs,
+                           response=response, user=get_request_user(request), lane=lane,
+                           priority=get_config_int("jobs", "priority", 0), message=message)
+        except RuntimeError as exc:
+            raise ProcessError(str(exc))
+
+    def _handler(self, request, response):
+
+        LOGGER.warning("Starting work...")
+        timer = StageTimer(self.IDENTIFIER, str(self.uuid))
+
+        # The decompressed input files are kept in their cache until the job ends
+        with profile_job(f"{self.IDENTIFIER}-{self.uuid}"), pin_decompressed_files():
             try:
-                # Output type must be: "csv"
-                output_uris = write_to_csvs(results, self.workdir)
-            except Exception as exc:
-                raise ProcessError(f"An error occurred when converting to CSV: {str(exc)}")
-                
-        ml4 = build_metalink(
-            self.METALINK_ID,
-            "Subsetting result into output file(s).",
-            self.workdir,
-            output_uris,
-            output_format 
-        )
+                self._run_handler(request, response, timer)
+            except Exception:
+                timer.finish("failed")
+                raise
 
-        LOGGER.warning("Populating response object...")
-        populate_response(response, "subset", self.workdir, inputs, collection, ml4)
+        timer.finish("succeeded")
 
         LOGGER.warning("Returning response!")
         return response
+
+    def _run_handler(self, request, response, timer):
+
+        with timer.stage("collection_resolution"):
+            collections = self._get_collections(request.inputs)
+            collection = collections[0] if len(collections) == 1 else collections
+
+        with timer.stage("input_parsing"):
+            output_format = parse_wps_input(request.inputs, "output_type", must_exist=True)
+
+            postprocess = self._get_postprocess(request)
+            merge = len(collections) > 1 and parse_wps_input(request.inputs, "merge", default=False)
+
+            output_type = output_format
+            # Outputs that flamingo writes itself (NetCDF files are written by
+            # clisops unless they have an encoding profile, are post-processed
+            # or hold several variables)
+            transformed = postprocess or len(collections) > 1 or get_netcdf_profile(self.DSET_INFO)
+            if output_format in ("csv", "parquet", "feather", "zarr") or (output_format == "netcdf" and transformed):
+                output_type = "xarray"
+
+            inputs = {
+                "time": parse_wps_input(request.inputs, "timeDateRange", as_interval=True,
+                                        default=None),
+                "area": self._get_area(request),
+                "output_dir": self.workdir,
+                "file_namer": "simple",
+                "output_type": output_type,
+                "apply_fixes": False,
+                "collection": collection,
+            }
+
+            if postprocess:
+                inputs["postprocess"] = postprocess
+            if merge:
+                inputs["merge"] = True
+
+        with timer.stage("result_cache_lookup"):
+            cache_request = normalise_request(
+                self.IDENTIFIER, collection, inputs["time"], inputs["area"], output_format,
+                output_options=self._get_output_options(output_format)
+            )
+            if postprocess:
+                cache_request["postprocess"] = postprocess
+            if merge:
+                cache_request["merge"] = True
+
+            result_key = get_result_key(cache_request)
+            output_uris = fetch_results(result_key, self.workdir)
+
+        if output_uris is None:
+            def run():
+                estimate, large = None, False
+                if admission_enabled():
+                    with timer.stage("admission"):
+                        estimate, large = self._admit(inputs, output_format, response)
+
+                output_uris = self._execute(request, response, inputs, output_format, timer,
+                                            estimate=estimate, large=large)
+                store_results(result_key, output_uris)
+                return output_uris
+
+            # Identical requests in flight wait for this one (see coalesce_utils)
+            output_uris = run_coalesced(result_key, self.workdir, run, progress=response.update_status)
+
+        with timer.stage("metalink_build"):
+            ml4 = build_metalink(
+                self.METALINK_ID,
+                "Subsetting result into output file(s).",
+                self.workdir,
+                output_uris,
+                output_format,
+                request_uuid=self.uuid
+            )
+
+        LOGGER.warning("Populating response object...")
+        with timer.stage("provenance_write"):
+            populate_response(response, "subset", self.workdir, inputs, collection, ml4)
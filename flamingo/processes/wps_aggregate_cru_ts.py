@@ -0,0 +1,18 @@
+from flamingo.processes._wps_aggregate_base import *
+from flamingo.processes.wps_subset_cru_ts import SubsetCRUTS
+
+
+class AggregateCRUTS(AggregateBase):
+
+    IDENTIFIER = "AggregateCRUTimeSeries"
+    DSET_INFO_ID = SubsetCRUTS.IDENTIFIER
+    TITLE = "Aggregate CRU Time Series"
+    ABSTRACT = ("Calculate area means, seasonal or annual means and climatologies "
+                "of a subset of the CRU Time Series data")
+    KEYWORDS = ["aggregate", "average", "climatology", "climate", "research", "unit", "time", "series"]
+    METALINK_ID = "aggregate-cru-ts-result"
+
+    INPUTS_LIST = ["dataset_version", "variable", "timeDateRange", "area", "polygon",
+                   "operation", "merge", "output_type"]
+
+    _build_collection = SubsetCRUTS._build_collection
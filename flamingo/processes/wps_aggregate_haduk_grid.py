@@ -0,0 +1,18 @@
+from flamingo.processes._wps_aggregate_base import *
+from flamingo.processes.wps_subset_haduk_grid import SubsetHadUKGrid
+
+
+class AggregateHadUKGrid(AggregateBase):
+
+    IDENTIFIER = "AggregateHadUKGrid"
+    DSET_INFO_ID = SubsetHadUKGrid.IDENTIFIER
+    TITLE = "Aggregate HadUK-Grid"
+    ABSTRACT = ("Calculate area means, seasonal or annual means and climatologies "
+                "of a subset of the HadUK-Grid data")
+    KEYWORDS = ["aggregate", "average", "climatology", "observations", "HadUK", "grid", "gridded"]
+    METALINK_ID = "aggregate-haduk-grid-result"
+
+    INPUTS_LIST = ["dataset_version", "variable", "frequency", "spatial_average",
+                   "timeDateRange", "area", "polygon", "operation", "merge", "output_type"]
+
+    _build_collection = SubsetHadUKGrid._build_collection
@@ -0,0 +1,17 @@
+from flamingo.processes._wps_batch_base import *
+from flamingo.processes.wps_subset_cru_ts import SubsetCRUTS
+
+
+class BatchSubsetCRUTS(BatchSubsetBase):
+
+    IDENTIFIER = "BatchSubsetCRUTimeSeries"
+    DSET_INFO_ID = SubsetCRUTS.IDENTIFIER
+    TITLE = "Batch Subset CRU Time Series"
+    ABSTRACT = "Extract many subsets from the CRU Time Series data in one request"
+    KEYWORDS = ["subset", "batch", "climate", "research", "unit", "time", "series", "data"]
+    METALINK_ID = "batch-subset-cru-ts-result"
+
+    INPUTS_LIST = ["subsets", "output_type"]
+    SUBSET_INPUTS = SubsetCRUTS.INPUTS_LIST
+
+    _build_collection = SubsetCRUTS._build_collection
@@ -0,0 +1,17 @@
+from flamingo.processes._wps_batch_base import *
+from flamingo.processes.wps_subset_haduk_grid import SubsetHadUKGrid
+
+
+class BatchSubsetHadUKGrid(BatchSubsetBase):
+
+    IDENTIFIER = "BatchSubsetHadUKGrid"
+    DSET_INFO_ID = SubsetHadUKGrid.IDENTIFIER
+    TITLE = "Batch Subset HadUK-Grid"
+    ABSTRACT = "Extract many subsets from the HadUK-Grid data in one request"
+    KEYWORDS = ["subset", "batch", "climate", "observations", "HadUK", "grid", "gridded", "data"]
+    METALINK_ID = "batch-subset-haduk-grid-result"
+
+    INPUTS_LIST = ["subsets", "output_type"]
+    SUBSET_INPUTS = SubsetHadUKGrid.INPUTS_LIST
+
+    _build_collection = SubsetHadUKGrid._build_collection
@@ -0,0 +1,16 @@
+from flamingo.processes._wps_point_base import *
+from flamingo.processes.wps_subset_cru_ts import SubsetCRUTS
+
+
+class ExtractPointsCRUTS(PointExtractBase):
+
+    IDENTIFIER = "ExtractPointsCRUTimeSeries"
+    DSET_INFO_ID = SubsetCRUTS.IDENTIFIER
+    TITLE = "Extract Points from CRU Time Series"
+    ABSTRACT = "Extract time series at one or more locations from the CRU Time Series data"
+    KEYWORDS = ["point", "location", "climate", "research", "unit", "time", "series", "data"]
+    METALINK_ID = "points-cru-ts-result"
+
+    INPUTS_LIST = ["dataset_version", "variable", "timeDateRange", "locations", "output_type"]
+
+    _build_collection = SubsetCRUTS._build_collection
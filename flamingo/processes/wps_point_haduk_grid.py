@@ -0,0 +1,17 @@
+from flamingo.processes._wps_point_base import *
+from flamingo.processes.wps_subset_haduk_grid import SubsetHadUKGrid
+
+
+class ExtractPointsHadUKGrid(PointExtractBase):
+
+    IDENTIFIER = "ExtractPointsHadUKGrid"
+    DSET_INFO_ID = SubsetHadUKGrid.IDENTIFIER
+    TITLE = "Extract Points from HadUK-Grid"
+    ABSTRACT = "Extract time series at one or more locations from the HadUK-Grid data"
+    KEYWORDS = ["point", "location", "climate", "observations", "HadUK", "grid", "gridded", "data"]
+    METALINK_ID = "points-haduk-grid-result"
+
+    INPUTS_LIST = ["dataset_version", "variable", "frequency", "spatial_average",
+                   "timeDateRange", "locations", "output_type"]
+
+    _build_collection = SubsetHadUKGrid._build_collection
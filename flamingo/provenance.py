@@ -1,103 +1,180 @@
+"""
+Provenance documents (W3C PROV, serialised as PROV-JSON) for the outputs of
+a process.
+
+The namespaces and the agents (the CDS, flamingo and daops) are the same for
+every job, so they are built and serialised once per process (`get_skeleton`).
+Each job only adds its activity, the input and output entities and the
+relations between them, which are written into the pre-serialised skeleton
+without building a `prov` document. The `prov` library is only used to draw
+the diagram (`write_png`).
+"""
+
+import json
 import os
+from functools import lru_cache
 
-from prov.model import ProvDocument
-from prov.dot import prov_to_dot
+from flamingo import __version__ as flamingo_version
 
 
-class Provenance(object):
-    def __init__(self, output_dir):
-        self.output_dir = output_dir
-        self.doc = None
-        self.workflow = None
+PREFIXES = {
+    "provone": "http://purl.dataone.org/provone/2015/01/15/ontology#",
+    "dcterms": "http://purl.org/dc/terms/",
+    "default": "http://purl.org/roocs/prov#",
+}
 
-    def start(self, workflow=False):
-        from daops import __version__ as daops_version
-        from flamingo import __version__ as flamingo_version
-
-        self.doc = ProvDocument()
-        # Declaring namespaces for various prefixes
-        self.doc.set_default_namespace(uri="http://purl.org/roocs/prov#")
-        self.doc.add_namespace("prov", uri="http://www.w3.org/ns/prov#")
-        self.doc.add_namespace(
-            "provone", uri="http://purl.dataone.org/provone/2015/01/15/ontology#"
-        )
-        self.doc.add_namespace("dcterms", uri="http://purl.org/dc/terms/")
-        # Define entities
-        project_cds = self.doc.agent(
-            ":copernicus_CDS",
-            {
+
+def get_package_version(package):
+    "Returns the installed version of `package`, without importing it."
+    from importlib.metadata import version, PackageNotFoundError
+
+    try:
+        return version(package)
+    except PackageNotFoundError:
+        return "unknown"
+
+
+@lru_cache(maxsize=None)
+def get_skeleton():
+    """
+    Returns the static part of the provenance documents: the namespaces, the
+    agents and the relations between them.
+    """
+    daops_version = get_package_version("daops")
+
+    return {
+        "prefix": PREFIXES,
+        "agent": {
+            "copernicus_CDS": {
                 "prov:type": "prov:Organization",
                 "dcterms:title": "Copernicus Climate Data Store",
             },
-        )
-        self.sw_flamingo = self.doc.agent(
-            ":flamingo",
-            {
+            "flamingo": {
                 "prov:type": "prov:SoftwareAgent",
                 "dcterms:source": f"https://github.com/cedadev/flamingo/releases/tag/v{flamingo_version}",
             },
-        )
-        self.doc.wasAttributedTo(self.sw_flamingo, project_cds)
-        self.sw_daops = self.doc.agent(
-            ":daops",
-            {
+            "daops": {
                 "prov:type": "prov:SoftwareAgent",
                 "dcterms:source": f"https://github.com/roocs/daops/releases/tag/v{daops_version}",
             },
-        )
-        # workflow
+        },
+        "wasAttributedTo": {
+            "_:id1": {"prov:entity": "flamingo", "prov:agent": "copernicus_CDS"},
+        },
+    }
+
+
+@lru_cache(maxsize=None)
+def _get_skeleton_json():
+    # The skeleton serialised without its closing brace, so that the
+    # sections of each job can be appended to it
+    return json.dumps(get_skeleton(), indent=4)[:-2]
+
+
+def _get_names(paths):
+    "Returns the entity names for a collection identifier, or a list of paths/URLs."
+    if isinstance(paths, str):
+        paths = [paths]
+
+    return [os.path.basename(str(path).rstrip("/")) for path in paths]
+
+
+class Provenance(object):
+    """
+    Provenance document of a job, written to `output_dir`.
+
+    Params:
+    :output_dir [str]: the directory to write the document to
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = output_dir
+        self.records = None
+        self.workflow = None
+        self._n_relations = 0
+
+    def _relation(self, kind, attributes):
+        # The skeleton holds the relation "_:id1"
+        self._n_relations += 1
+        self.records.setdefault(kind, {})[f"_:id{self._n_relations + 1}"] = attributes
+
+    def start(self, workflow=False):
+        self.records = {}
+        self._n_relations = 0
+
         if workflow is True:
-            self.workflow = self.doc.entity(
-                ":workflow", {"prov:type": "provone:Workflow"}
-            )
-            orchestrate = self.doc.activity(
-                ":orchestrate",
-                other_attributes={
+            self.workflow = "workflow"
+            self.records["entity"] = {"workflow": {"prov:type": "provone:Workflow"}}
+            self.records["activity"] = {
+                "orchestrate": {
                     "prov:startedAtTime": "2020-11-26T09:15:00",
                     "prov:endedAtTime": "2020-11-26T09:30:00",
-                },
-            )
-            self.doc.wasAssociatedWith(
-                orchestrate, agent=self.sw_flamingo, plan=self.workflow
-            )
+                }
+            }
+            self._relation("wasAssociatedWith", {
+                "prov:activity": "orchestrate", "prov:agent": "flamingo", "prov:plan": "workflow"
+            })
 
     def add_operator(self, operator, parameters, collection, output):
-        op = self.doc.activity(
-            f":{operator}",
-            other_attributes={
-                ":time": parameters.get("time"),
-                ":apply_fixes": parameters.get("apply_fixes"),
-            },
-        )
-        # input data
-        ds_in = os.path.basename(collection[0])
-        # ds_in_attrs = {
-        #     'prov:type': 'provone:Data',
-        #     'prov:value': f'{ds_in}',
-        # }
-        op_in = self.doc.entity(f":{ds_in}")
+        """
+        Adds the activity of `operator`, which derived every output file (or
+        URL) in `output` from the files or dataset identified by `collection`.
+        """
+        self.records.setdefault("activity", {})[operator] = {
+            "time": parameters.get("time"),
+            "apply_fixes": parameters.get("apply_fixes"),
+        }
+
+        entities = self.records.setdefault("entity", {})
+        inputs = _get_names(collection)
+        outputs = _get_names(output)
+
+        for name in inputs + outputs:
+            entities.setdefault(name, {})
+
         # operator started by daops
         if self.workflow:
-            self.doc.wasAssociatedWith(op, agent=self.sw_daops, plan=self.workflow)
+            self._relation("wasAssociatedWith", {
+                "prov:activity": operator, "prov:agent": "daops", "prov:plan": self.workflow
+            })
         else:
-            self.doc.start(op, starter=self.sw_daops, trigger=self.sw_flamingo)
-        # Generated output file
+            self._relation("wasStartedBy", {
+                "prov:activity": operator, "prov:trigger": "flamingo", "prov:starter": "daops"
+            })
+
+        for ds_out in outputs:
+            for ds_in in inputs:
+                self._relation("wasDerivedFrom", {
+                    "prov:generatedEntity": ds_out, "prov:usedEntity": ds_in, "prov:activity": operator
+                })
+
+    def to_json(self):
+        "Returns the document as PROV-JSON."
+        records = json.dumps(self.records, indent=4, default=str)[1:]
+
+        if records.strip() == "}":
+            return _get_skeleton_json() + "\n}"
 
-        ds_out = os.path.basename(output[0])
-        # ds_out_attrs = {
-        #     'prov:type': 'provone:Data',
-        #     'prov:value': f'{ds_out}',
-        # }
-        op_out = self.doc.entity(f":{ds_out}")
-        self.doc.wasDerivedFrom(op_out, op_in, activity=op)
+        return _get_skeleton_json() + "," + records
+
+    def to_prov(self):
+        "Returns the document as a `prov.model.ProvDocument`."
+        from prov.model import ProvDocument
+
+        return ProvDocument.deserialize(content=self.to_json(), format="json")
 
     def write_json(self):
         outfile = os.path.join(self.output_dir, "provenance.json")
-        self.doc.serialize(outfile, format="json")
+
+        with open(outfile, "w") as writer:
+            writer.write(self.to_json())
+
         return outfile
 
     def write_png(self):
+        from prov.dot import prov_to_dot
+
         outfile = os.path.join(self.output_dir, "provenance.png")
-        figure = prov_to_dot(self.doc)
+        figure = prov_to_dot(self.to_prov())
         figure.write_png(outfile)
         return outfile
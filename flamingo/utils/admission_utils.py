@@ -0,0 +1,276 @@
+"""
+admission_utils.py
+==================
+
+Admission control for subset jobs. The size of a subset is estimated before
+it runs, so that a request too large for the host is rejected up front, and
+large requests are kept apart from the others instead of running out of
+memory next to them.
+
+The estimate is made from the file index of each collection (see
+`index_utils`): the grid shape and data types of the files that overlap the
+request, and the fraction of their time steps and grid cells covered by the
+requested time range and area. It gives the size of the data read
+(uncompressed, as held by dask) and the approximate size of the outputs in
+the requested format. Collections without an index are not estimated, and
+their jobs are admitted as they are.
+
+Jobs are then:
+
+ - rejected, if they would read or write more than the configured limits,
+   or write more than the free disk space of the output directory;
+ - run as large jobs, if they would read more than `large_job_size`. Large
+   jobs run in their own lane of the job queue (served by `flamingo workers
+   --lane large`), or, without the job workers, wait for one of the
+   `large_jobs` slots of the host;
+ - otherwise, run as usual.
+
+Settings are read from the `[admission]` configuration section.
+"""
+
+import math
+import os
+import re
+import shutil
+import tempfile
+
+from flamingo.utils.compute_utils import CoreBudget
+from flamingo.utils.config_utils import (
+    get_config_bool, get_config_float, get_config_int, get_config_size, get_config_value
+)
+from flamingo.utils.index_utils import get_file_records
+
+import logging
+LOGGER = logging.getLogger("PYWPS")
+
+
+# Approximate size of one field of a row of the tabular outputs (a value or
+# a coordinate), in bytes
+OUTPUT_FIELD_BYTES = {
+    "csv": 10,
+    "parquet": 8,
+    "feather": 8,
+}
+
+DATE_PATTERN = re.compile(r"^(-?\d+)(?:-(\d{1,2}))?(?:-(\d{1,2}))?")
+
+
+def admission_enabled():
+    return get_config_bool("admission", "enabled", True)
+
+
+def get_large_lane():
+    "Returns the lane of the job queue that large jobs are submitted to."
+    return get_config_value("admission", "large_lane", "large")
+
+
+def format_size(n_bytes):
+    "Returns a number of bytes as a readable string, e.g. 1.5 GB."
+    for unit in ("bytes", "KB", "MB", "GB"):
+        if n_bytes < 1024:
+            return f"{n_bytes:.0f} {unit}" if unit == "bytes" else f"{n_bytes:.1f} {unit}"
+        n_bytes /= 1024
+
+    return f"{n_bytes:.1f} TB"
+
+
+def _to_years(value):
+    """
+    Returns a date string (e.g. "2001-06-30T12:00:00", or a partial date such
+    as "2001") as a number of years, to compare dates of any calendar.
+    """
+    match = DATE_PATTERN.match(str(value).strip())
+    if not match:
+        raise ValueError(f"Invalid date: {value}")
+
+    year, month, day = match.groups()
+    return int(year) + (int(month or 1) - 1) / 12 + (int(day or 1) - 1) / 372
+
+
+def _count_steps(n_steps, first, last, start=None, end=None):
+    """
+    Returns how many of `n_steps` evenly spaced values from `first` to `last`
+    lie between `start` and `end` (None for no bound).
+    """
+    start = first if start is None else max(start, first)
+    end = last if end is None else min(end, last)
+
+    if end < start:
+        return 0
+
+    if n_steps < 2 or last <= first:
+        return n_steps
+
+    step = (last - first) / (n_steps - 1)
+    count = math.floor((end - first) / step + 1e-6) - math.ceil((start - first) / step - 1e-6) + 1
+    return min(max(count, 0), n_steps)
+
+
+def _extent_fractions(bbox, area):
+    """
+    Returns the fractions of the latitude and longitude extents of `bbox`
+    covered by the requested `area`.
+    """
+    if not bbox or not area:
+        return 1.0, 1.0
+
+    min_lon, min_lat, max_lon, max_lat = [float(value) for value in area]
+    f_min_lon, f_min_lat, f_max_lon, f_max_lat = bbox
+
+    def fraction(low, high, f_low, f_high):
+        if f_high <= f_low:
+            return 1.0
+
+        overlap = min(high, f_high) - max(low, f_low)
+        return min(max(overlap / (f_high - f_low), 0.0), 1.0)
+
+    # Only compare longitudes if both use the -180 to 180 convention (see index_utils)
+    lon_fraction = 1.0
+    if -180 <= min_lon <= max_lon <= 180 and -180 <= f_min_lon <= f_max_lon <= 180:
+        lon_fraction = fraction(min_lon, max_lon, f_min_lon, f_max_lon)
+
+    return fraction(min_lat, max_lat, f_min_lat, f_max_lat), lon_fraction
+
+
+def is_gridded(dims):
+    "Returns True for the dimensions of a gridded variable: time and (at least) two others."
+    return "time" in dims and len(dims) >= 3
+
+
+def get_selected_shape(record, dims, time=None, area=None):
+    """
+    Returns the number of values selected along each of the dimensions
+    `dims` of a gridded variable in the file of an index `record`, for the
+    requested time interval and area. The last two dimensions are taken to
+    be the latitude (or y) and longitude (or x) of the grid.
+    """
+    shape = record["shape"]
+    selected = [shape[dim] for dim in dims]
+
+    time_value = getattr(time, "value", time) or (None, None)
+    start, end = [_to_years(value) if value else None for value in time_value]
+
+    if record["time"] and shape["time"]:
+        first, last = [_to_years(value) for value in record["time"]]
+        selected[dims.index("time")] = _count_steps(shape["time"], first, last, start, end)
+
+    # The selection keeps at least one cell of a file that overlaps the area
+    for axis, fraction in zip((-2, -1), _extent_fractions(record["bbox"], area)):
+        selected[axis] = max(round(selected[axis] * fraction), 1)
+
+    return selected
+
+
+def get_itemsize(dtype):
+    match = re.search(r"\d+", dtype)
+    return int(match.group()) // 8 if match else 8
+
+
+def estimate_file(record, time=None, area=None, output_format="netcdf"):
+    """
+    Returns the estimated number of bytes read from the file of an index
+    `record` for the requested time interval and area, and written for it
+    in `output_format`.
+
+    Only the gridded variables (with a time and two other dimensions) are
+    counted: bounds and other small variables are left out.
+    """
+    shape = record["shape"]
+    file_bytes = read_bytes = output_bytes = 0
+
+    for var in record["variables"].values():
+        dims = var["dims"]
+        n_values = 1
+        for dim in dims:
+            n_values *= shape[dim]
+
+        file_bytes += n_values * get_itemsize(var["dtype"])
+
+        if not is_gridded(dims):
+            continue
+
+        selected = 1
+        for size in get_selected_shape(record, dims, time, area):
+            selected *= size
+
+        read_bytes += selected * get_itemsize(var["dtype"])
+
+        if output_format in OUTPUT_FIELD_BYTES:
+            # One row per value, with its coordinates
+            output_bytes += selected * (len(dims) + 1) * OUTPUT_FIELD_BYTES[output_format]
+
+    if output_format not in OUTPUT_FIELD_BYTES:
+        # Compressed as well as the archive file
+        output_bytes = read_bytes * min(record["size"] / file_bytes, 1.0) if file_bytes else read_bytes
+
+    return read_bytes, int(output_bytes)
+
+
+def estimate_subset(collections, time=None, area=None, output_format="netcdf", index_dir=None):
+    """
+    Returns the estimated size of a subset of `collections`, or None if any
+    of them has no (up-to-date) index.
+
+    Returns:
+    :estimate [dict]: "read_bytes" (the size of the data read, uncompressed),
+        "output_bytes" (the approximate size of the outputs) and "files" (the
+        number of files read)
+    """
+    estimate = {"read_bytes": 0, "output_bytes": 0, "files": 0}
+
+    for collection in collections:
+        records = get_file_records(collection, time, area, index_dir)
+        if records is None:
+            return None
+
+        for record in records:
+            read_bytes, output_bytes = estimate_file(record, time, area, output_format)
+            estimate["read_bytes"] += read_bytes
+            estimate["output_bytes"] += output_bytes
+            estimate["files"] += 1
+
+    return estimate
+
+
+def describe_estimate(estimate):
+    return (f"Estimated to read {format_size(estimate['read_bytes'])} from {estimate['files']} files "
+            f"and write {format_size(estimate['output_bytes'])}")
+
+
+def check_estimate(estimate, output_dir):
+    """
+    Checks the estimated size of a subset against the `[admission]` limits
+    and the free disk space of `output_dir`. Returns True if the subset
+    should run as a large job.
+
+    Raises ValueError if the subset is too large to run.
+    """
+    max_read_size = get_config_size("admission", "max_read_size", "100gb")
+    max_output_size = get_config_size("admission", "max_output_size", "50gb")
+
+    if max_read_size and estimate["read_bytes"] > max_read_size:
+        raise ValueError(
+            f"The request is too large: it would read about {format_size(estimate['read_bytes'])} "
+            f"of data, over the limit of {format_size(max_read_size)}. "
+            f"Please request a shorter time range or a smaller area."
+        )
+
+    free_space = shutil.disk_usage(output_dir).free
+    if (max_output_size and estimate["output_bytes"] > max_output_size) or \
+            estimate["output_bytes"] > free_space:
+        limit = min(max_output_size or free_space, free_space)
+        raise ValueError(
+            f"The request is too large: its outputs would take about "
+            f"{format_size(estimate['output_bytes'])}, over the limit of {format_size(limit)}. "
+            f"Please request a shorter time range or a smaller area."
+        )
+
+    return estimate["read_bytes"] > get_config_size("admission", "large_job_size", "2gb")
+
+
+def get_large_job_slots():
+    "Returns the host-wide slots that large jobs run in when there are no job workers."
+    lock_dir = get_config_value("admission", "lock_dir",
+                                os.path.join(tempfile.gettempdir(), "flamingo", "admission"))
+    return CoreBudget(lock_dir, get_config_int("admission", "large_jobs", 1),
+                      poll_interval=get_config_float("admission", "poll_interval", 1.0))
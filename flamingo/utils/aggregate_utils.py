@@ -0,0 +1,278 @@
+"""
+aggregate_utils.py
+==================
+
+Spatial and temporal aggregation of subset results, applied lazily (in the
+dask graph of each Dataset) before the outputs are written, so that only the
+aggregated data is computed, written and served.
+
+Operations:
+    area_mean             mean over the area (weighted by the cosine of the
+                          latitude on regular latitude/longitude grids), or
+                          over the cells inside a polygon
+    seasonal_mean         mean of each season (DJF, MAM, JJA, SON)
+    annual_mean           mean of each calendar year
+    monthly_climatology   mean of each calendar month over all years
+    seasonal_climatology  mean of each season over all years
+
+Climatologies keep a time axis: each mean is placed at the first time step
+of its month or season.
+
+Several operations can be applied in turn, e.g. "area_mean" then
+"annual_mean" gives a time series of annual area means.
+"""
+
+from flamingo.utils.index_utils import LATITUDE_NAMES, LONGITUDE_NAMES
+
+import logging
+LOGGER = logging.getLogger("PYWPS")
+
+
+# Resampling frequencies and CF cell methods of the temporal means
+RESAMPLE_FREQUENCIES = {
+    "seasonal_mean": ("QS-DEC", "time: mean (interval: 3 months)"),
+    "annual_mean": ("YS", "time: mean (interval: 1 year)"),
+}
+
+# Grouping and CF cell methods of the climatologies
+CLIMATOLOGY_GROUPS = {
+    "monthly_climatology": ("time.month", "time: mean over years"),
+    "seasonal_climatology": ("time.season", "time: mean over years"),
+}
+
+OPERATIONS = ["area_mean"] + list(RESAMPLE_FREQUENCIES) + list(CLIMATOLOGY_GROUPS)
+
+BOUNDS_SUFFIXES = ("_bnds", "_bounds")
+
+
+def parse_polygon(value):
+    """
+    Returns a list of (lon, lat) vertices from a string of "lon lat" pairs
+    separated by commas, e.g. "-3 51, 1 51, 1 54, -3 51". Raises ValueError
+    if the polygon is not valid.
+    """
+    try:
+        vertices = [tuple(float(item) for item in pair.split()) for pair in value.split(",")]
+    except ValueError:
+        raise ValueError(f'Invalid polygon "{value}": expected "lon lat" pairs separated by commas')
+
+    if any(len(vertex) != 2 for vertex in vertices) or len(set(vertices)) < 3:
+        raise ValueError(f'Invalid polygon "{value}": at least 3 "lon lat" vertices are required')
+
+    return vertices
+
+
+def get_polygon_bbox(vertices):
+    "Returns the bounding box [min_lon, min_lat, max_lon, max_lat] of a polygon."
+    lons = [lon for lon, _ in vertices]
+    lats = [lat for _, lat in vertices]
+    return [min(lons), min(lats), max(lons), max(lats)]
+
+
+def polygon_mask(lons, lats, vertices):
+    """
+    Returns a boolean array that is True where the points (`lons`, `lats`:
+    arrays of the same shape) are inside the polygon (even-odd rule).
+    """
+    import numpy as np
+
+    inside = np.zeros(np.shape(lons), dtype=bool)
+    n_vertices = len(vertices)
+
+    for i in range(n_vertices):
+        x1, y1 = vertices[i]
+        x2, y2 = vertices[(i + 1) % n_vertices]
+
+        if y1 == y2:
+            continue
+
+        crosses = (y1 > lats) != (y2 > lats)
+        x_cross = x1 + (lats - y1) * (x2 - x1) / (y2 - y1)
+        inside ^= crosses & (lons < x_cross)
+
+    return inside
+
+
+def _find_coord(ds, names, standard_name):
+    for name, var in ds.coords.items():
+        if var.attrs.get("standard_name") == standard_name or name in names:
+            return var
+
+    return None
+
+
+def get_grid_mappings(ds):
+    "Returns the names of the grid mapping variables of `ds` (e.g. 'transverse_mercator')."
+    return {var.attrs["grid_mapping"] for var in ds.data_vars.values() if "grid_mapping" in var.attrs}
+
+
+def get_data_variables(ds, dim):
+    """
+    Returns the names of the numeric data variables of `ds` along `dim`
+    (except bounds and grid mappings).
+    """
+    import numpy as np
+
+    excluded = get_grid_mappings(ds) | {name for name in ds.data_vars if name.endswith(BOUNDS_SUFFIXES)}
+
+    return [name for name, var in ds.data_vars.items()
+            if dim in var.dims and np.issubdtype(var.dtype, np.number) and name not in excluded]
+
+
+def _add_cell_method(da, method):
+    cell_methods = da.attrs.get("cell_methods")
+    da.attrs["cell_methods"] = f"{cell_methods} {method}" if cell_methods else method
+
+
+def _replace_variables(ds, dim, aggregated):
+    """
+    Returns `ds` with its variables along `dim` replaced by the `aggregated`
+    Dataset. Grid mappings (which are repeated along time when files are
+    concatenated) keep their first value, and the other variables along
+    `dim` that were not aggregated are dropped.
+    """
+    dropped = [name for name, var in ds.variables.items() if dim in var.dims]
+    grid_mappings = {name: ds[name].isel({dim: 0}, drop=True) for name in get_grid_mappings(ds)
+                     if name in dropped}
+
+    result = ds.drop_vars(dropped).merge(aggregated).assign(grid_mappings)
+    result.attrs = dict(ds.attrs)
+    return result
+
+
+def area_mean(ds, polygon=None):
+    """
+    Returns the mean of the data variables of `ds` over the area, or over
+    the cells inside `polygon` (a list of (lon, lat) vertices).
+    """
+    import numpy as np
+    import xarray as xr
+
+    lat = _find_coord(ds, LATITUDE_NAMES, "latitude")
+    lon = _find_coord(ds, LONGITUDE_NAMES, "longitude")
+
+    if lat is None or lon is None:
+        raise ValueError("No latitude/longitude coordinates were found for the area mean")
+
+    dims = list(dict.fromkeys(lat.dims + lon.dims))
+
+    # Regular grids are weighted by the area of the cells; projected grids
+    # (such as HadUK-Grid) have cells of equal area
+    if lat.ndim == 1:
+        weights = np.cos(np.deg2rad(lat)) * xr.ones_like(lon)
+    else:
+        weights = xr.ones_like(lat)
+
+    if polygon:
+        lats, lons = xr.broadcast(lat, lon)
+        mask = polygon_mask(lons.values, lats.values, polygon)
+        if not mask.any():
+            raise ValueError("No grid cells were found inside the polygon")
+
+        weights = weights.where(xr.DataArray(mask, dims=lats.dims, coords=lats.coords), 0)
+
+    weights = weights.reset_coords(drop=True).fillna(0)
+    names = [name for name in get_data_variables(ds, dims[0]) if set(dims) <= set(ds[name].dims)]
+
+    aggregated = xr.Dataset()
+    for name in names:
+        da = ds[name].weighted(weights).mean(dims, keep_attrs=True)
+        if np.issubdtype(ds[name].dtype, np.floating):
+            da = da.astype(ds[name].dtype)
+
+        # The means are no longer on the grid
+        da.attrs.pop("grid_mapping", None)
+        _add_cell_method(da, "area: mean")
+        aggregated[name] = da
+
+    spatial = [name for name, var in ds.coords.items() if set(var.dims) & set(dims)]
+    return _replace_variables(ds, dims[0], aggregated).drop_vars(
+        spatial + list(get_grid_mappings(ds)), errors="ignore"
+    )
+
+
+def temporal_mean(ds, operation):
+    "Returns the seasonal or annual means (`operation`) of the data variables of `ds`."
+    freq, cell_method = RESAMPLE_FREQUENCIES[operation]
+    names = get_data_variables(ds, "time")
+
+    aggregated = ds[names].resample(time=freq).mean(keep_attrs=True)
+    for name in names:
+        _add_cell_method(aggregated[name], cell_method)
+
+    return _replace_variables(ds, "time", aggregated)
+
+
+def climatology(ds, operation):
+    """
+    Returns the monthly or seasonal climatology (`operation`) of the data
+    variables of `ds`. Each mean is placed at the first time step of its
+    month or season, so that the result keeps a time axis, and the period
+    of the climatology is recorded in the "climatology_period" attribute.
+    """
+    import numpy as np
+
+    group, cell_method = CLIMATOLOGY_GROUPS[operation]
+    label = group.split(".")[1]
+    names = get_data_variables(ds, "time")
+
+    aggregated = ds[names].groupby(group).mean(keep_attrs=True)
+    for name in names:
+        _add_cell_method(aggregated[name], cell_method)
+
+    labels = ds[group].values
+    times = ds["time"].values
+    first_times = [times[np.argmax(labels == value)] for value in aggregated[label].values]
+
+    aggregated = aggregated.rename({label: "time"}).assign_coords(time=first_times).sortby("time")
+    aggregated["time"].attrs = ds["time"].attrs
+
+    result = _replace_variables(ds, "time", aggregated)
+    result.attrs["climatology_period"] = f"{_format_date(times[0])}/{_format_date(times[-1])}"
+    return result
+
+
+def _format_date(value):
+    return value.strftime("%Y-%m-%d") if hasattr(value, "strftime") else str(value)[:10]
+
+
+def aggregate(ds, operations, polygon=None):
+    """
+    Applies the aggregation `operations` to a Dataset, in turn.
+
+    Params:
+    :ds [xarray.Dataset]: the Dataset to aggregate
+    :operations [list]: operation names (see `OPERATIONS`)
+    :polygon [list]: (lon, lat) vertices of the area of "area_mean", or None
+
+    Returns:
+    :ds [xarray.Dataset]: the aggregated Dataset (not yet computed)
+    """
+    for operation in operations:
+        if operation == "area_mean":
+            ds = area_mean(ds, polygon)
+        elif operation in RESAMPLE_FREQUENCIES:
+            ds = temporal_mean(ds, operation)
+        elif operation in CLIMATOLOGY_GROUPS:
+            ds = climatology(ds, operation)
+        else:
+            raise ValueError(f"Unknown aggregation operation: {operation}")
+
+    return ds
+
+
+def aggregate_results(results, operations, polygon=None):
+    """
+    Aggregates the Datasets in a `results` object returned by the
+    `clisops.subset()` function, in place. Returns `results`.
+
+    The time slices that a large subset is split into are joined first, so
+    that seasons, years and climatologies are computed over all of them.
+    """
+    from flamingo.utils.output_utils import concat_time_slices
+
+    for key, result_list in results._results.items():
+        if result_list:
+            results._results[key] = [aggregate(concat_time_slices(result_list), operations, polygon)]
+
+    return results
@@ -0,0 +1,91 @@
+"""
+batch_utils.py
+==============
+
+Helpers for batch subsets: many subsets in one request, given as a JSON
+list of subset specifications such as:
+
+    [
+        {"dataset_version": "...", "variable": "...",
+         "timeDateRange": "1951-01-01/1960-12-31", "area": "-10,35,30,70"},
+        ...
+    ]
+
+The keys are the inputs of the matching subset process, with the same
+values. Subsets of the same collection and time range are grouped so that
+the files of each group are opened once, and the union of their areas is
+read (and held in memory, if it is small enough) once for all of them.
+"""
+
+import json
+from collections import OrderedDict
+
+
+def parse_batch(value, max_subsets):
+    """
+    Returns the list of subset specifications (dictionaries) in a JSON
+    document. Raises ValueError if it is not a non-empty list of objects of
+    at most `max_subsets` items.
+    """
+    try:
+        subsets = json.loads(value)
+    except (TypeError, ValueError) as exc:
+        raise ValueError(f"The subsets are not valid JSON: {exc}")
+
+    if not isinstance(subsets, list) or not subsets or not all(isinstance(item, dict) for item in subsets):
+        raise ValueError("The subsets must be a non-empty JSON list of objects.")
+
+    if len(subsets) > max_subsets:
+        raise ValueError(f"Too many subsets in one request: {len(subsets)} (the limit is {max_subsets}).")
+
+    return subsets
+
+
+def parse_area(value):
+    """
+    Returns an area as a list of 4 floats [min_lon, min_lat, max_lon, max_lat]
+    from a comma-separated string or a list, or None if there is no area.
+    """
+    if value in (None, ""):
+        return None
+
+    items = value.split(",") if isinstance(value, str) else value
+
+    try:
+        area = [float(item) for item in items]
+    except (TypeError, ValueError):
+        area = []
+
+    if len(area) != 4:
+        raise ValueError(f'Invalid area "{value}": expected "min_lon,min_lat,max_lon,max_lat"')
+
+    return area
+
+
+def get_union_area(areas):
+    """
+    Returns the bounding box covering all `areas`, or None if any of them
+    is None (the whole domain).
+    """
+    if not areas or any(area is None for area in areas):
+        return None
+
+    return [min(area[0] for area in areas), min(area[1] for area in areas),
+            max(area[2] for area in areas), max(area[3] for area in areas)]
+
+
+def group_subsets(subsets):
+    """
+    Groups subset specifications (dictionaries with "collection", "time"
+    and "area" keys) by collection and time range.
+
+    Returns an ordered dictionary of {(collection, time): [(index, subset), ...]}
+    where `index` is the position of the subset in `subsets`.
+    """
+    groups = OrderedDict()
+
+    for index, subset in enumerate(subsets):
+        key = (subset["collection"], subset["time"])
+        groups.setdefault(key, []).append((index, subset))
+
+    return groups
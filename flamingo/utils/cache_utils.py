@@ -0,0 +1,288 @@
+"""
+cache_utils.py
+==============
+
+A size-bounded, on-disk cache that can be shared safely between the
+worker processes of a deployment.
+
+Each entry is a directory named by its key. Entries are populated in a
+private temporary directory and moved into place with an atomic rename,
+so readers never see a partially written entry. Population of a key is
+guarded by an exclusive file lock: a second process asking for the same
+key waits for the first one and then re-uses its entry.
+
+The modification time of an entry directory records when it was last
+used and drives least-recently-used eviction. Entries can be pinned while
+they are in use (a shared lock), and pinned entries are never evicted
+or replaced.
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+
+import logging
+LOGGER = logging.getLogger("PYWPS")
+
+
+MARKER_FILE = ".entry.json"
+
+
+def make_key(*parts):
+    "Returns a stable hexadecimal key for the given parts."
+    content = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def get_dir_size(path):
+    "Returns the total size (in bytes) of all files below `path`."
+    total = 0
+
+    for dir_path, _, file_names in os.walk(path):
+        for file_name in file_names:
+            file_path = os.path.join(dir_path, file_name)
+            if not os.path.islink(file_path):
+                total += os.path.getsize(file_path)
+
+    return total
+
+
+class DiskCache:
+    """
+    Size-bounded directory cache with LRU eviction and an optional
+    time-to-live (in seconds) for each entry.
+
+    Params:
+    :cache_dir [str]: directory holding the cache entries
+    :max_size [int]: size budget in bytes (0 means unbounded)
+    :ttl [int]: maximum age of an entry in seconds (None means no expiry)
+    """
+
+    LOCK_DIR = ".locks"
+    TMP_DIR = ".tmp"
+
+    def __init__(self, cache_dir, max_size=0, ttl=None):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.ttl = ttl
+
+        for subdir in (self.LOCK_DIR, self.TMP_DIR):
+            os.makedirs(os.path.join(self.cache_dir, subdir), exist_ok=True)
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def _read_marker(self, path):
+        try:
+            with open(os.path.join(path, MARKER_FILE)) as fp:
+                return json.load(fp)
+        except (OSError, ValueError):
+            return None
+
+    def _is_expired(self, marker):
+        return bool(self.ttl) and (time.time() - marker["created"]) > self.ttl
+
+    @contextmanager
+    def lock(self, key, blocking=True, shared=False, discard=False):
+        """
+        Context manager holding an exclusive (or `shared`) lock on `key`
+        across processes. Yields True if the lock was acquired (always the
+        case when blocking). An exclusive lock can `discard` its lock file
+        when it is released.
+        """
+        lock_file = os.path.join(self.cache_dir, self.LOCK_DIR, f"{key}.lock")
+        flags = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        if not blocking:
+            flags |= fcntl.LOCK_NB
+
+        while True:
+            with open(lock_file, "a") as fp:
+                try:
+                    fcntl.flock(fp, flags)
+                except BlockingIOError:
+                    yield False
+                    return
+
+                # The lock file may have been discarded while we waited for it
+                try:
+                    current = os.stat(lock_file).st_ino == os.fstat(fp.fileno()).st_ino
+                except FileNotFoundError:
+                    current = False
+
+                if not current:
+                    fcntl.flock(fp, fcntl.LOCK_UN)
+                    continue
+
+                try:
+                    yield True
+                finally:
+                    if discard and not shared:
+                        os.unlink(lock_file)
+                    fcntl.flock(fp, fcntl.LOCK_UN)
+                return
+
+    @contextmanager
+    def pin(self, key):
+        """
+        Context manager keeping the entry for `key` from being evicted by
+        any process while it is in use. Pin the key before getting (or
+        creating) its entry: an entry being evicted is gone once pinned.
+        """
+        with self.lock(f"{key}.pin", shared=True):
+            yield
+
+    def get(self, key):
+        """
+        Returns the path to the entry for `key`, or None if there is no
+        valid entry. A hit marks the entry as recently used.
+        """
+        path = self._entry_path(key)
+        marker = self._read_marker(path)
+
+        if not marker or self._is_expired(marker):
+            return None
+
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # Evicted by another process since the marker was read
+            return None
+
+        return path
+
+    def get_or_create(self, key, populate):
+        """
+        Returns the path to the entry for `key`, creating it if required.
+
+        `populate` is called with a temporary directory that it must fill
+        with the entry contents. It is only called by one process at a time
+        for a given key.
+        """
+        path = self.get(key)
+        if path:
+            return path
+
+        with self.lock(key):
+            # Another process may have created the entry while we waited
+            path = self.get(key)
+            if path:
+                return path
+
+            path = self._create(key, populate)
+
+        # Never evict the new entry, even if it is larger than the budget
+        self.evict(keep=[key])
+        return path
+
+    def _create(self, key, populate):
+        path = self._entry_path(key)
+
+        with ExitStack() as stack:
+            # An expired entry that is in use is returned as it is, rather
+            # than replaced under its readers (it is evicted once unpinned)
+            if os.path.isdir(path):
+                if not stack.enter_context(self.lock(f"{key}.pin", blocking=False)):
+                    LOGGER.info(f"Keeping expired cache entry {path} while it is in use")
+                    return path
+
+            tmp_path = os.path.join(self.cache_dir, self.TMP_DIR, f"{key}.{uuid.uuid4().hex}")
+            os.makedirs(tmp_path)
+
+            try:
+                populate(tmp_path)
+
+                marker = {"created": time.time(), "size": get_dir_size(tmp_path)}
+                with open(os.path.join(tmp_path, MARKER_FILE), "w") as fp:
+                    json.dump(marker, fp)
+
+                # Remove any expired entry before moving the new one into place
+                if os.path.isdir(path):
+                    self._remove(path)
+
+                os.rename(tmp_path, path)
+            except Exception:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+                raise
+
+        LOGGER.info(f"Added cache entry {path} ({marker['size']} bytes)")
+        return path
+
+    def _remove(self, path):
+        # Rename first so that the entry disappears atomically for readers
+        trash = os.path.join(self.cache_dir, self.TMP_DIR, f"trash.{uuid.uuid4().hex}")
+
+        try:
+            os.rename(path, trash)
+        except FileNotFoundError:
+            return
+
+        shutil.rmtree(trash, ignore_errors=True)
+
+    def entries(self):
+        """
+        Returns a list of (last_used, size, path, marker) tuples for all
+        complete entries, least recently used first.
+        """
+        entries = []
+
+        for name in os.listdir(self.cache_dir):
+            if name.startswith("."):
+                continue
+
+            path = self._entry_path(name)
+            marker = self._read_marker(path)
+
+            if marker is None:
+                continue
+
+            try:
+                last_used = os.stat(path).st_mtime
+            except FileNotFoundError:
+                continue
+
+            entries.append((last_used, marker["size"], path, marker))
+
+        return sorted(entries, key=lambda entry: entry[0])
+
+    def evict(self, keep=()):
+        """
+        Removes expired entries, then the least recently used entries
+        until the cache fits in its size budget. The entries of the keys in
+        `keep` and pinned entries are not removed. Skipped if another
+        process is already evicting.
+        """
+        with self.lock("evict", blocking=False) as acquired:
+            if not acquired:
+                return
+
+            entries = self.entries()
+            total = sum(entry[1] for entry in entries)
+
+            for last_used, size, path, marker in entries:
+                expired = self._is_expired(marker)
+                over_budget = self.max_size and total > self.max_size
+
+                key = os.path.basename(path)
+                if not (expired or over_budget) or key in keep:
+                    continue
+
+                # Hold the locks of the entry while removing it, so that it
+                # cannot be pinned (or re-created) meanwhile, and discard them
+                with self.lock(key, blocking=False, discard=True) as unlocked:
+                    with self.lock(f"{key}.pin", blocking=False, discard=True) as unpinned:
+                        if not (unlocked and unpinned):
+                            continue
+
+                        LOGGER.info(f"Evicting cache entry {path} ({size} bytes)")
+                        self._remove(path)
+
+                total -= size
+
+            if self.max_size and total > self.max_size:
+                LOGGER.warning(f"Cache {self.cache_dir} holds {total} bytes in entries in use, "
+                               f"over its budget of {self.max_size} bytes")
@@ -0,0 +1,254 @@
+"""
+capabilities_utils.py
+=====================
+
+A WSGI layer that caches the GetCapabilities and DescribeProcess responses
+of the PyWPS `Service`.
+
+These documents only change when the process definitions (`DSET_INFO`) or
+the configuration change, so they are rendered once (the common requests
+when the application starts, others on first use) and then served from
+memory with an ETag and Last-Modified date, gzip-compressed for clients
+that accept it. Conditional requests are answered with "304 Not Modified".
+
+Responses are cached by the parameters that select them (service,
+request, version, identifier and language), keeping at most `max_entries`
+of them, least recently used first out. The cache is cleared if any
+configuration file is modified, and the ETags
+depend on the `DSET_INFO` of every process, so they change between
+deployments that change the datasets offered.
+"""
+
+import gzip
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import parse_qsl, urlencode
+
+from flamingo import __version__ as flamingo_version
+from flamingo.utils.cache_utils import make_key
+from flamingo.utils.config_utils import get_config_bool, get_config_int
+from flamingo.utils.serve_utils import accepts_gzip
+
+import logging
+LOGGER = logging.getLogger("PYWPS")
+
+
+CACHED_REQUESTS = ("getcapabilities", "describeprocess")
+
+# Parameters that select the response (others are ignored by the Service)
+KEY_PARAMETERS = ("service", "request", "version", "identifier", "language")
+
+# Parameters whose values are not case-sensitive
+CASE_INSENSITIVE = ("service", "request")
+
+
+def capabilities_cache_enabled():
+    return get_config_bool("capabilities_cache", "enabled", True)
+
+
+def get_common_requests(processes, version="1.0.0"):
+    "Returns the query strings of the requests to render when the application starts."
+    identifiers = [process.identifier for process in processes] + ["all"]
+
+    return [f"service=WPS&request=GetCapabilities&version={version}"] + [
+        f"service=WPS&request=DescribeProcess&version={version}&identifier={identifier}"
+        for identifier in identifiers
+    ]
+
+
+class CachedResponse:
+    "A rendered response, held both plain and gzip-compressed."
+
+    def __init__(self, status, headers, body, fingerprint):
+        self.status = status
+        self.headers = [(name, value) for name, value in headers
+                        if name.lower() not in ("content-length", "content-encoding", "etag",
+                                                "last-modified", "cache-control", "vary")]
+        self.body = body
+        self.gzip_body = gzip.compress(body)
+        self.last_modified = int(time.time())
+        self.etag = '"{}"'.format(make_key(fingerprint, hashlib.sha256(body).hexdigest())[:32])
+
+    def is_not_modified(self, environ):
+        if_none_match = environ.get("HTTP_IF_NONE_MATCH")
+        if if_none_match:
+            return self.etag in [tag.strip() for tag in if_none_match.split(",")] or \
+                if_none_match.strip() == "*"
+
+        if_modified_since = environ.get("HTTP_IF_MODIFIED_SINCE")
+        if if_modified_since:
+            try:
+                return parsedate_to_datetime(if_modified_since).timestamp() >= self.last_modified
+            except (TypeError, ValueError):
+                return False
+
+        return False
+
+
+class CapabilitiesCacheMiddleware:
+    """
+    WSGI middleware that serves cached GetCapabilities and DescribeProcess
+    responses from `app` (a PyWPS `Service`) and passes all other requests
+    through.
+
+    Params:
+    :app [callable]: the WSGI application to wrap
+    :processes [list]: the processes offered by the application
+    :config_files [list]: configuration files that invalidate the cache when modified
+    """
+
+    def __init__(self, app, processes, config_files=None):
+        self.app = app
+        self.processes = processes
+        self.config_files = [path for path in (config_files or []) if path]
+        self.max_age = get_config_int("capabilities_cache", "max_age", 60)
+        self.max_entries = get_config_int("capabilities_cache", "max_entries", 256)
+
+        self._responses = OrderedDict()
+        self._lock = threading.Lock()
+        self._config_state = None
+        self._fingerprint = None
+
+    def _get_config_state(self):
+        state = []
+
+        for path in self.config_files:
+            try:
+                stat = os.stat(path)
+                state.append((path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                state.append((path, None, None))
+
+        return state
+
+    def _check_fingerprint(self):
+        "Clears the cache if the configuration files have changed."
+        config_state = self._get_config_state()
+
+        if config_state != self._config_state:
+            if self._config_state is not None:
+                LOGGER.info("Configuration changed: clearing cached capabilities")
+
+            self._responses = OrderedDict()
+            self._config_state = config_state
+            self._fingerprint = make_key(
+                flamingo_version, config_state,
+                {process.identifier: getattr(process, "DSET_INFO", None) for process in self.processes}
+            )
+
+        return self._fingerprint
+
+    @staticmethod
+    def get_cache_key(environ):
+        """
+        Returns the cache key for a GetCapabilities or DescribeProcess
+        request, or None if the request should not be cached.
+        """
+        if environ.get("REQUEST_METHOD", "GET") != "GET":
+            return None
+
+        params = []
+        for name, value in parse_qsl(environ.get("QUERY_STRING", ""), keep_blank_values=True):
+            name = name.lower()
+            if name in KEY_PARAMETERS:
+                params.append((name, value.lower() if name in CASE_INSENSITIVE else value))
+
+        if dict(params).get("request") not in CACHED_REQUESTS:
+            return None
+
+        # The Service answers the same way on any path, so only the query is used
+        return urlencode(sorted(params))
+
+    def render(self, environ):
+        "Calls the wrapped application and returns its response as a `CachedResponse`."
+        captured = {}
+
+        def start_response(status, headers, exc_info=None):
+            captured["status"] = status
+            captured["headers"] = headers
+
+        result = self.app(environ, start_response)
+        try:
+            body = b"".join(result)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+
+        return CachedResponse(captured["status"], captured["headers"], body, self._fingerprint)
+
+    def prerender(self, query_strings):
+        "Renders and caches the responses to GET requests with `query_strings`."
+        from werkzeug.test import EnvironBuilder
+
+        self._check_fingerprint()
+
+        for query_string in query_strings:
+            environ = EnvironBuilder(query_string=query_string).get_environ()
+            self._call_cached(environ, self.get_cache_key(environ), lambda *args: None)
+
+    def _get(self, key):
+        with self._lock:
+            response = self._responses.get(key)
+            if response is not None:
+                self._responses.move_to_end(key)
+
+            return response
+
+    def _add(self, key, response):
+        with self._lock:
+            self._responses[key] = response
+
+            while len(self._responses) > self.max_entries:
+                self._responses.popitem(last=False)
+
+    def _call_cached(self, environ, key, start_response):
+        response = self._get(key)
+
+        if response is None:
+            response = self.render(environ)
+
+            # Only successful responses are cached
+            if not response.status.startswith("200"):
+                start_response(response.status, response.headers + [
+                    ("Content-Length", str(len(response.body)))
+                ])
+                return [response.body]
+
+            self._add(key, response)
+
+        headers = response.headers + [
+            ("ETag", response.etag),
+            ("Last-Modified", formatdate(response.last_modified, usegmt=True)),
+            ("Cache-Control", f"public, max-age={self.max_age}"),
+            ("Vary", "Accept-Encoding"),
+        ]
+
+        if response.is_not_modified(environ):
+            start_response("304 Not Modified", [header for header in headers
+                                                if header[0] != "Content-Type"])
+            return [b""]
+
+        if accepts_gzip(environ):
+            body = response.gzip_body
+            headers.append(("Content-Encoding", "gzip"))
+        else:
+            body = response.body
+
+        start_response(response.status, headers + [("Content-Length", str(len(body)))])
+        return [body]
+
+    def __call__(self, environ, start_response):
+        key = self.get_cache_key(environ)
+        if key is None:
+            return self.app(environ, start_response)
+
+        self._check_fingerprint()
+        return self._call_cached(environ, key, start_response)
+
+    def __getattr__(self, name):
+        # Give access to the attributes of the wrapped application
+        return getattr(self.app, name)
@@ -0,0 +1,225 @@
+"""
+coalesce_utils.py
+=================
+
+Coalescing of identical requests in flight. When several users send the
+same request at about the same time (e.g. when a portal page loads), only
+the first one runs: the others wait for it and re-use its outputs.
+
+Requests are identified by their result cache key (see
+`result_cache_utils`), built from the normalised request. Running requests
+are registered in a table shared by all processes on one host, held in
+SQLite. A request whose key is registered by a running request waits for
+it to finish, then links its output files into its own output directory.
+If the first request fails, the waiting ones fail with the same message
+(or the default message of a ProcessError, if it failed unexpectedly).
+If it dies, or takes longer than the timeout, the waiting requests run
+themselves.
+
+Settings are read from the `[coalescing]` configuration section.
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import time
+import uuid
+
+import psutil
+from pywps.app.exceptions import ProcessError
+
+from flamingo.utils.config_utils import get_config_bool, get_config_float, get_config_value
+from flamingo.utils.result_cache_utils import link_or_copy
+
+import logging
+LOGGER = logging.getLogger("PYWPS")
+
+
+RUNNING, SUCCEEDED, FAILED = "running", "succeeded", "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS requests (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    outputs TEXT,
+    message TEXT,
+    started REAL NOT NULL,
+    finished REAL
+);
+"""
+
+
+def coalescing_enabled():
+    return get_config_bool("coalescing", "enabled", True)
+
+
+def get_table_path():
+    return get_config_value("coalescing", "database",
+                            os.path.join(tempfile.gettempdir(), "flamingo", "inflight.sqlite"))
+
+
+class InflightTable:
+    """
+    The table of the requests in flight on one host.
+
+    Params:
+    :db_path [str]: path to the SQLite database file
+    :max_age [float]: seconds to keep finished requests in the table
+    """
+
+    def __init__(self, db_path, max_age=3600):
+        self.db_path = db_path
+        self.max_age = max_age
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def register(self, key, owner, pid=None):
+        """
+        Registers `owner` as running the request `key`, unless another
+        owner is already running it. Returns None if `owner` was registered,
+        or else the row of the running request.
+        """
+        conn = self._connect()
+
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM requests WHERE status != ? AND finished < ?",
+                         (RUNNING, time.time() - self.max_age))
+
+            row = conn.execute("SELECT * FROM requests WHERE key = ?", (key,)).fetchone()
+
+            if row and row["status"] == RUNNING and row["owner"] != owner and psutil.pid_exists(row["pid"]):
+                conn.execute("COMMIT")
+                return row
+
+            conn.execute(
+                "INSERT OR REPLACE INTO requests (key, owner, pid, status, started) VALUES (?, ?, ?, ?, ?)",
+                (key, owner, pid or os.getpid(), RUNNING, time.time())
+            )
+            conn.execute("COMMIT")
+            return None
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def get(self, key):
+        with self._connect() as conn:
+            return conn.execute("SELECT * FROM requests WHERE key = ?", (key,)).fetchone()
+
+    def finish(self, key, owner, status, outputs=None, message=None):
+        "Records the end of the request `key` run by `owner`."
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE requests SET status = ?, outputs = ?, message = ?, finished = ? "
+                "WHERE key = ? AND owner = ?",
+                (status, json.dumps(outputs) if outputs is not None else None, message,
+                 time.time(), key, owner)
+            )
+
+    def wait(self, key, owner, poll_interval=0.5, timeout=3600):
+        """
+        Waits for the request `key` run by `owner` to finish. Returns its
+        row, or None if it has gone (e.g. its process died) or is still
+        running after `timeout` seconds.
+        """
+        deadline = time.time() + timeout
+
+        while time.time() < deadline:
+            row = self.get(key)
+
+            if row is None or row["owner"] != owner or not psutil.pid_exists(row["pid"]):
+                return None
+
+            if row["status"] != RUNNING:
+                return row
+
+            time.sleep(poll_interval)
+
+        return None
+
+
+def publish_outputs(output_paths, output_dir):
+    """
+    Links the output files of another request into `output_dir`. Returns
+    the new output paths, in the same order.
+    """
+    published = []
+
+    for output_path in output_paths:
+        target = os.path.join(output_dir, os.path.basename(output_path))
+        if os.path.abspath(output_path) != os.path.abspath(target):
+            link_or_copy(output_path, target)
+        published.append(target)
+
+    return published
+
+
+def run_coalesced(key, output_dir, func, progress=None):
+    """
+    Runs `func` (which returns a list of output file paths) for the request
+    identified by `key`, unless an identical request is running: then waits
+    for it and returns its outputs, linked into `output_dir`.
+
+    Raises a ProcessError with the message of the identical request if it
+    failed.
+    """
+    if not coalescing_enabled():
+        return func()
+
+    poll_interval = get_config_float("coalescing", "poll_interval", 0.5)
+    timeout = get_config_float("coalescing", "timeout", 3600)
+
+    table = InflightTable(get_table_path(), max_age=timeout)
+    owner = uuid.uuid4().hex
+
+    while True:
+        running = table.register(key, owner)
+
+        if running is None:
+            break
+
+        LOGGER.info(f"Waiting for the identical request {running['owner']} in process {running['pid']}")
+        if progress:
+            progress("Waiting for an identical request in progress", 5)
+
+        row = table.wait(key, running["owner"], poll_interval, timeout)
+
+        if row is None:
+            # The request has gone: run it (unless another waiting request does first)
+            if time.time() - running["started"] < timeout:
+                continue
+
+            LOGGER.warning("The identical request is taking too long: running this one")
+            return func()
+
+        if row["status"] == FAILED:
+            raise ProcessError(row["message"])
+
+        try:
+            return publish_outputs(json.loads(row["outputs"]), output_dir)
+        except OSError as exc:
+            # The outputs have been removed since: run the request again
+            LOGGER.warning(f"Could not re-use the outputs of the identical request: {exc}")
+
+    try:
+        output_paths = func()
+    except BaseException as exc:
+        # Only the messages of process errors are meant for users
+        table.finish(key, owner, FAILED, message=str(exc) if isinstance(exc, ProcessError) else None)
+        raise
+
+    table.finish(key, owner, SUCCEEDED, outputs=output_paths)
+    return output_paths
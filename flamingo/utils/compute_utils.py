@@ -0,0 +1,163 @@
+"""
+compute_utils.py
+================
+
+Controls how dask computes each subset job.
+
+The scheduler, the number of workers per job and the memory available to a
+job are set in the `[compute]` configuration section and applied around
+the `subset` call and output conversion of each job.
+
+Workers are drawn from a core budget shared by every flamingo process on
+the host: each worker holds an exclusive lock on one of `max_workers` slot
+files. A job takes up to `workers_per_job` free slots, and waits for at
+least one, so concurrent jobs share the cores instead of oversubscribing
+them. Locks are released by the operating system if a process dies.
+
+The length of the chunks written by `clisops` is bounded by a per-dataset
+memory limit (`chunk_memory_limit` in `DSET_INFO`, or the configured
+default), reduced so that every worker of the job can hold two chunks
+within `memory_limit`.
+"""
+
+import fcntl
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+
+from flamingo.utils.config_utils import (
+    get_config_float, get_config_int, get_config_size, get_config_value, parse_size
+)
+
+import logging
+LOGGER = logging.getLogger("PYWPS")
+
+
+SCHEDULERS = ("threads", "processes", "synchronous")
+
+
+def get_max_workers():
+    "Returns the size of the core budget shared by all jobs on this host."
+    return get_config_int("compute", "max_workers", 0) or os.cpu_count() or 1
+
+
+class CoreBudget:
+    """
+    A host-wide pool of worker slots shared between processes.
+
+    Params:
+    :lock_dir [str]: directory holding one lock file per slot
+    :size [int]: number of slots in the pool
+    :poll_interval [float]: seconds to wait between attempts when no slot is free
+    """
+
+    def __init__(self, lock_dir, size, poll_interval=0.5):
+        self.lock_dir = lock_dir
+        self.size = size
+        self.poll_interval = poll_interval
+        os.makedirs(lock_dir, exist_ok=True)
+
+    def _try_slot(self, slot):
+        fp = open(os.path.join(self.lock_dir, f"slot.{slot}.lock"), "a")
+
+        try:
+            fcntl.flock(fp, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            fp.close()
+            return None
+
+        return fp
+
+    @contextmanager
+    def acquire(self, wanted, timeout=None):
+        """
+        Context manager holding up to `wanted` free slots (and at least one,
+        waiting for it if necessary). Yields the number of slots held.
+        Raises TimeoutError if no slot is free after `timeout` seconds.
+        """
+        wanted = max(1, min(wanted, self.size))
+        deadline = time.time() + timeout if timeout else None
+        held = []
+
+        try:
+            while not held:
+                for slot in range(self.size):
+                    if len(held) == wanted:
+                        break
+
+                    fp = self._try_slot(slot)
+                    if fp is not None:
+                        held.append(fp)
+
+                if not held:
+                    if deadline and time.time() > deadline:
+                        raise TimeoutError(f"No slot was free after {timeout:g} seconds")
+
+                    time.sleep(self.poll_interval)
+
+            yield len(held)
+        finally:
+            for fp in held:
+                fcntl.flock(fp, fcntl.LOCK_UN)
+                fp.close()
+
+
+def get_core_budget():
+    lock_dir = get_config_value("compute", "lock_dir",
+                                os.path.join(tempfile.gettempdir(), "flamingo", "compute"))
+    return CoreBudget(lock_dir, get_max_workers(),
+                      poll_interval=get_config_float("compute", "poll_interval", 0.5))
+
+
+def get_chunk_memory_limit(dset_info, n_workers):
+    """
+    Returns the memory limit (in bytes) for one chunk of output data for a
+    dataset, so that each of `n_workers` workers can hold two chunks within
+    the configured `memory_limit` for a job.
+    """
+    chunk_limit = get_config_size("compute", "chunk_memory_limit", "512mb")
+
+    if dset_info and dset_info.get("chunk_memory_limit"):
+        chunk_limit = parse_size(dset_info["chunk_memory_limit"])
+
+    memory_limit = get_config_size("compute", "memory_limit", "0mb")
+    if memory_limit:
+        chunk_limit = min(chunk_limit, memory_limit // (2 * n_workers))
+
+    return chunk_limit
+
+
+@contextmanager
+def compute_context(dset_info=None):
+    """
+    Context manager that applies the `[compute]` settings to the dask
+    computations run inside it, holding worker slots from the core budget.
+
+    Params:
+    :dset_info [dict]: the `DSET_INFO` of the process, which may set a
+        "chunk_memory_limit" for its dataset (e.g. "256mb")
+    """
+    import dask
+    import clisops.utils.output_utils as clisops_output_utils
+
+    scheduler = get_config_value("compute", "scheduler", "threads")
+    if scheduler not in SCHEDULERS:
+        raise ValueError(f"Unknown dask scheduler in [compute] configuration: {scheduler}")
+
+    wanted = 1 if scheduler == "synchronous" else get_config_int("compute", "workers_per_job", 4)
+
+    with get_core_budget().acquire(wanted) as n_workers:
+        chunk_limit = get_chunk_memory_limit(dset_info, n_workers)
+        LOGGER.info(f"Computing with the {scheduler} scheduler: {n_workers} workers, "
+                    f"chunks of up to {chunk_limit} bytes")
+
+        # clisops reads its chunk memory limit from a module-level setting
+        original_limit = clisops_output_utils.chunk_memory_limit
+        clisops_output_utils.chunk_memory_limit = f"{chunk_limit}B"
+
+        try:
+            with dask.config.set(scheduler=scheduler, num_workers=n_workers):
+                yield n_workers
+        finally:
+            clisops_output_utils.chunk_memory_limit = original_limit
@@ -0,0 +1,64 @@
+"""
+config_utils.py
+===============
+
+Helpers for reading flamingo settings from the PyWPS configuration files.
+Values not set in any configuration file fall back to the given default.
+"""
+
+from pywps import configuration
+
+
+def get_config_value(section, option, default=None):
+    """
+    Returns the raw configuration value (string or boolean) or `default`.
+    """
+    value = configuration.get_config_value(section, option, default_value=default)
+
+    if value == "":
+        return default
+
+    return value
+
+
+def get_config_bool(section, option, default=False):
+    value = get_config_value(section, option, default)
+
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "yes", "on", "true")
+
+    return bool(value)
+
+
+def get_config_int(section, option, default=0):
+    return int(get_config_value(section, option, default))
+
+
+def get_config_float(section, option, default=0.0):
+    return float(get_config_value(section, option, default))
+
+
+def parse_size(value):
+    """
+    Returns a size such as "20gb" or "500mb" in bytes.
+    """
+    return int(configuration.get_size_mb(str(value)) * 1024 ** 2)
+
+
+def get_config_size(section, option, default="0mb"):
+    """
+    Returns a size setting such as "20gb" or "500mb" in bytes.
+    """
+    return parse_size(get_config_value(section, option, default))
+
+
+def get_config_list(section, option, default=None):
+    """
+    Returns a comma or newline separated setting as a list of strings.
+    """
+    value = get_config_value(section, option, None)
+
+    if value is None:
+        return list(default or [])
+
+    return [item.strip() for item in str(value).replace("\n", ",").split(",") if item.strip()]
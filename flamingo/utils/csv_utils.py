@@ -0,0 +1,419 @@
+"""
+csv_utils.py
+============
+
+A streaming writer for comma-separated NASA Ames files.
+
+Variables in a Dataset are grouped by their dimensions and each group is
+written to its own file, using the NASA Ames File Format Index (FFI) that
+matches the number of dimensions (1001, 2010 or 3010). The file header
+follows the layout users previously received from `nappy`.
+
+The data section is written in blocks along the first (unbounded)
+dimension, so only one block of each variable is held in memory at a time,
+and values are formatted in bulk with NumPy.
+
+Several Datasets can be converted by a pool of processes (see
+`write_datasets_to_csvs`). The data section of each file is then split
+into slabs along its first dimension: the steps of the data section do
+not depend on each other, so each slab is written to a part file by one
+process and the parts are joined in order. The files are the same as
+those written by a single process.
+"""
+
+import datetime
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import dask
+import numpy as np
+import xarray as xr
+
+from flamingo import __version__ as flamingo_version
+
+
+FFI_BY_NDIMS = {1: 1001, 2: 2010, 3: 3010}
+
+DEFAULT_ORG = "Data held at British Atmospheric Data Centre (BADC), Rutherford Appleton Laboratory, UK."
+HEADER_ATTRS = ("institution", "source", "title", "history")
+MISSING_DATE = "999 999 999"
+
+# Maximum number of values per variable to load into memory at once
+BLOCK_SIZE = 1_000_000
+
+# Number of values in the slabs of data converted by each process of a pool
+SLAB_SIZE = 5_000_000
+
+
+def is_time(da):
+    return np.issubdtype(da.dtype, np.datetime64) or (
+        da.dtype == object and da.size > 0 and hasattr(da.values.flat[0], "calendar")
+    )
+
+
+def get_csv_variables(ds):
+    """
+    Returns an ordered list of groups of variables to write, one group per
+    output file. Each group is a (dims, [variable names]) tuple. Variables
+    with no dimensions are not included.
+    """
+    groups = {}
+    names = [name for name in ds.data_vars] + \
+            [name for name in ds.coords if name not in ds.dims]
+
+    for name in names:
+        dims = ds[name].dims
+        if dims:
+            groups.setdefault(dims, []).append(name)
+
+    # Order groups by number of dimensions (the main variables first)
+    return sorted(groups.items(), key=lambda group: -len(group[0]))
+
+
+def get_singletons(ds):
+    "Returns the names of variables without dimensions."
+    return [name for name in ds.variables if not ds[name].dims]
+
+
+def get_axis_values(ds, dim):
+    """
+    Returns a tuple of (numeric values, units) for dimension `dim`.
+    Times are encoded as "days since" the first time value.
+    """
+    if dim not in ds.coords:
+        return np.arange(ds.sizes[dim]), None
+
+    coord = ds[dim]
+
+    if is_time(coord):
+        first = coord.values[0]
+        units = f"days since {first.strftime('%Y-%m-%d %H:%M:%S')}" if hasattr(first, "strftime") \
+            else f"days since {np.datetime_as_string(first, unit='s').replace('T', ' ')}"
+        calendar = getattr(first, "calendar", None) or "standard"
+        values, _, _ = xr.coding.times.encode_cf_datetime(coord.values, units, calendar)
+        return values, units
+
+    return coord.values, coord.attrs.get("units")
+
+
+def get_label(ds, name, units=None):
+    attrs = ds[name].attrs if name in ds.variables else {}
+    long_name = attrs.get("long_name", attrs.get("standard_name", name))
+    units = units or attrs.get("units")
+
+    return f"{long_name} ({units})" if units else long_name
+
+
+def get_spacing(values):
+    "Returns the interval between regularly spaced values, or 0 if irregular."
+    if len(values) < 2:
+        return 0
+
+    diffs = np.diff(values.astype("float64"))
+    return float(diffs[0]) if np.allclose(diffs, diffs[0]) else 0
+
+
+def get_first_date(ds, dim):
+    if dim in ds.coords and is_time(ds[dim]):
+        first = ds[dim].values[0]
+        if not hasattr(first, "year"):
+            first = first.astype("datetime64[s]").item()
+        return f"{first.year} {first.month} {first.day}"
+
+    return MISSING_DATE
+
+
+def get_missing_value(var):
+    "Returns the missing value from the variable encoding, or NaN."
+    for source in (var.encoding, var.attrs):
+        for key in ("_FillValue", "missing_value"):
+            # Coordinates may have an explicit None to disable the fill value
+            if source.get(key) is not None:
+                return source[key]
+
+    return np.nan
+
+
+def format_values(arr, float_format):
+    "Returns a 2D array of values as a list of delimited strings, one per row."
+    strings = np.char.mod(float_format, arr.reshape(arr.shape[0], -1))
+    return [",".join(row) for row in strings]
+
+
+def _build_header(ds, dims, var_names, axes, singletons):
+    today = datetime.date.today()
+    # NASA Ames lists the independent variables fastest-varying first
+    rev_dims = dims[::-1]
+    ffi = FFI_BY_NDIMS[len(dims)]
+
+    lines = [
+        str(ds.attrs.get("institution", None)),
+        DEFAULT_ORG,
+        str(ds.attrs.get("source", None)),
+        str(ds.attrs.get("title", None)),
+        "1,1",
+        f"{get_first_date(ds, dims[0])},{today.year} {today.month} {today.day}",
+        ",".join(str(get_spacing(axes[dim][0])) for dim in rev_dims),
+    ]
+
+    # Sizes and values of the bounded independent variables
+    if ffi != 1001:
+        bounded = rev_dims[:-1]
+        sizes = ",".join(str(len(axes[dim][0])) for dim in bounded)
+        lines.extend([sizes, sizes])
+        lines.extend([",".join(f"{value:g}" for value in axes[dim][0]) for dim in bounded])
+
+    lines.extend([get_label(ds, dim, axes[dim][1]) for dim in rev_dims])
+
+    lines.extend([
+        str(len(var_names)),
+        ",".join("1" for _ in var_names),
+        ",".join(f"{get_missing_value(ds[name]):g}" for name in var_names),
+    ])
+    lines.extend([get_label(ds, name) for name in var_names])
+
+    # Number of auxiliary variables (FFI 1001 has no NAUXV line)
+    if ffi != 1001:
+        lines.append("0")
+
+    special = ["==== Special Comments follow ===="]
+
+    if singletons:
+        special.append("== Singleton Variables defined in the source file follow ==")
+        for name in singletons:
+            special.append(f"  Variable {name}: {get_label(ds, name)}")
+            special.extend(f"    {key} = {value}" for key, value in ds[name].attrs.items())
+            special.append(f"    value = {float(ds[name].values)}")
+        special.append("== Singleton Variables defined in the source file end ==")
+
+    special.append("=== Additional Variable Attributes defined in the source file ===")
+    special.append("== Variable attributes from source (NetCDF) file follow ==")
+    for name in var_names:
+        special.append(f"  Variable {name}: {get_label(ds, name)}")
+        special.extend(f"    {key} = {value}" for key, value in ds[name].attrs.items())
+    special.append("== Variable attributes from source (NetCDF) file end ==")
+    special.append("==== Special Comments end ====")
+
+    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    normal = ["==== Normal Comments follow ===="]
+    normal.extend(f"{key}:   {value}" for key, value in ds.attrs.items() if key not in HEADER_ATTRS)
+    normal.append(f"History:  {now} - Converted to NASA Ames format using flamingo-{flamingo_version}.")
+    normal.extend(f"    {line}" for line in str(ds.attrs.get("history", "")).splitlines())
+    normal.append("==== Normal Comments end ====")
+    normal.append("=== Data Section begins on the next line ===")
+
+    # As nappy, label the columns of FFI 1001 files (as the last normal comment line)
+    if ffi == 1001:
+        labels = [get_label(ds, dims[0], axes[dims[0]][1])] + [get_label(ds, name) for name in var_names]
+        normal.append(",".join(labels))
+
+    lines.extend([str(len(special))] + special + [str(len(normal))] + normal)
+
+    first_line = f"{len(lines) + 1},{ffi}"
+    return [first_line] + lines
+
+
+def _iter_data_lines(ds, dims, var_names, axes, float_format):
+    "Yields the data section of the file, one block of lines at a time."
+    dim0 = dims[0]
+    dim0_values = axes[dim0][0]
+    values_per_step = int(np.prod([ds.sizes[dim] for dim in dims[1:]])) * len(var_names)
+    block_length = max(1, BLOCK_SIZE // max(values_per_step, 1))
+
+    for start in range(0, len(dim0_values), block_length):
+        block = slice(start, start + block_length)
+        variables = [ds[name].transpose(*dims) for name in var_names]
+        arrays = []
+
+        # The blocks of all the variables are read together
+        for var, arr in zip(variables, dask.compute(*[var.isel({dim0: block}).data for var in variables])):
+            arr = np.asarray(arr)
+            missing = get_missing_value(var)
+
+            if arr.dtype.kind == "f" and not np.isnan(missing):
+                arr = np.where(np.isnan(arr), missing, arr)
+            arrays.append(arr)
+
+        steps = np.char.mod("%g", dim0_values[block].astype("float64"))
+
+        if len(dims) == 1:
+            # FFI 1001: one line per step with all variables
+            table = np.column_stack([dim0_values[block]] + arrays)
+            yield format_values(table, float_format)
+            continue
+
+        lines = []
+        rows = [format_values(arr.reshape(-1, arr.shape[-1]), float_format) for arr in arrays]
+        rows_per_step = int(np.prod(arrays[0].shape[1:-1])) if len(dims) == 3 else 1
+
+        for i, step in enumerate(steps):
+            lines.append(step)
+            for var_rows in rows:
+                lines.extend(var_rows[i * rows_per_step:(i + 1) * rows_per_step])
+
+        yield lines
+
+
+def get_output_paths(output_file, n_files):
+    "Returns the file names to use, numbered if there are multiple files."
+    if n_files == 1:
+        return [output_file]
+
+    base, ext = os.path.splitext(output_file)
+    return [f"{base}_{i}{ext}" for i in range(1, n_files + 1)]
+
+
+def _iter_files(ds, output_file):
+    """
+    Yields the files to write for a Dataset, as (dims, variable names,
+    axes, header lines, output path) tuples.
+    """
+    groups = [(dims, names) for dims, names in get_csv_variables(ds) if len(dims) in FFI_BY_NDIMS]
+    singletons = get_singletons(ds)
+    output_paths = get_output_paths(output_file, len(groups))
+
+    for (dims, var_names), output_path in zip(groups, output_paths):
+        axes = {dim: get_axis_values(ds, dim) for dim in dims}
+        yield dims, var_names, axes, _build_header(ds, dims, var_names, axes, singletons), output_path
+
+
+def write_dataset_to_csv(ds, output_file, float_format="%g"):
+    """
+    Writes an Xarray Dataset to one or more NASA Ames CSV files.
+
+    Params:
+    :ds [xarray.Dataset]: the Dataset to write
+    :output_file [str]: output file path (numbered if multiple files are written)
+    :float_format [str]: format applied to each data value
+
+    Returns:
+    :output_file_paths [list]: a list of output file paths
+    """
+    output_paths = []
+
+    for dims, var_names, axes, header, output_path in _iter_files(ds, output_file):
+        with open(output_path, "w") as writer:
+            writer.write("\n".join(header) + "\n")
+
+            for lines in _iter_data_lines(ds, dims, var_names, axes, float_format):
+                writer.write("\n".join(lines) + "\n")
+
+        output_paths.append(output_path)
+
+    return output_paths
+
+
+def write_data_slab(ds, dims, var_names, axes, float_format, output_path, mode="w"):
+    """
+    Writes the data section of the variables `var_names` of a slab of a
+    Dataset (its steps along the first dimension, whose values are in
+    `axes`) to `output_path`. Run by the processes of a pool, which
+    compute the slab themselves.
+    """
+    with dask.config.set(scheduler="synchronous"):
+        with open(output_path, mode) as writer:
+            for lines in _iter_data_lines(ds, dims, var_names, axes, float_format):
+                writer.write("\n".join(lines) + "\n")
+
+    return output_path
+
+
+def _get_slabs(ds, dims, var_names, axes, slab_size):
+    "Returns the (start, stop) steps of the slabs of a data section."
+    n_steps = len(axes[dims[0]][0])
+    values_per_step = int(np.prod([ds.sizes[dim] for dim in dims[1:]])) * len(var_names)
+    slab_length = max(1, slab_size // max(values_per_step, 1))
+
+    return [(start, min(start + slab_length, n_steps)) for start in range(0, n_steps, slab_length)]
+
+
+def write_datasets_to_csvs(datasets, output_files, float_format="%g", workers=1,
+                           slab_size=SLAB_SIZE, start_method=None, on_output=None):
+    """
+    Writes Xarray Datasets to NASA Ames CSV files (as `write_dataset_to_csv`),
+    converting their data in a pool of `workers` processes, one slab of
+    about `slab_size` values at a time.
+
+    Params:
+    :datasets [list]: the Datasets to write
+    :output_files [list]: the output file path of each Dataset
+    :float_format [str]: format applied to each data value
+    :workers [int]: number of processes (the Datasets are written in this
+        process if there is only one, or only one slab to write, or if this
+        process is a daemon, such as a job worker, that cannot start any)
+    :slab_size [int]: number of values in each slab
+    :start_method [str]: how the processes are started ("forkserver",
+        "spawn" or "fork"), or None for the default of the platform
+    :on_output [callable]: called with the output file paths of each Dataset
+        as soon as they are written (or None)
+
+    Returns:
+    :output_file_paths [list]: a list of the output file paths of each Dataset
+    """
+    import multiprocessing
+
+    output_paths = []
+    slabs = []
+    # The number of slabs written when the files of each Dataset are complete
+    pending = []
+
+    def report(n_written):
+        while pending and pending[0][0] <= n_written:
+            paths = pending.pop(0)[1]
+            if on_output:
+                on_output(paths)
+
+    for ds, output_file in zip(datasets, output_files):
+        paths = []
+
+        for dims, var_names, axes, header, output_path in _iter_files(ds, output_file):
+            with open(output_path, "w") as writer:
+                writer.write("\n".join(header) + "\n")
+
+            dim0 = dims[0]
+            values, units = axes[dim0]
+
+            for n, (start, stop) in enumerate(_get_slabs(ds, dims, var_names, axes, slab_size)):
+                slab_axes = dict(axes, **{dim0: (values[start:stop], units)})
+                slabs.append((output_path, ds[var_names].isel({dim0: slice(start, stop)}),
+                              dims, var_names, slab_axes, f"{output_path}.part{n:04d}"))
+
+            paths.append(output_path)
+
+        output_paths.append(paths)
+        pending.append((len(slabs), paths))
+
+    serial = workers <= 1 or len(slabs) <= 1 or multiprocessing.current_process().daemon
+
+    if serial:
+        report(0)
+        for n, (output_path, ds, dims, var_names, axes, _) in enumerate(slabs):
+            write_data_slab(ds, dims, var_names, axes, float_format, output_path, mode="a")
+            report(n + 1)
+
+        return output_paths
+
+    mp_context = multiprocessing.get_context(start_method) if start_method else None
+
+    try:
+        with ProcessPoolExecutor(max_workers=min(workers, len(slabs)), mp_context=mp_context) as executor:
+            futures = [executor.submit(write_data_slab, ds, dims, var_names, axes, float_format, part_path)
+                       for _, ds, dims, var_names, axes, part_path in slabs]
+
+            # The parts are joined in order, as they are written
+            report(0)
+            for n, ((output_path, *_), future) in enumerate(zip(slabs, futures)):
+                part_path = future.result()
+
+                with open(output_path, "ab") as writer, open(part_path, "rb") as reader:
+                    shutil.copyfileobj(reader, writer, 1024 ** 2)
+
+                os.remove(part_path)
+                report(n + 1)
+    finally:
+        for *_, part_path in slabs:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+    return output_paths
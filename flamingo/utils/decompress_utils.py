@@ -0,0 +1,114 @@
+"""
+decompress_utils.py
+===================
+
+Functions to serve gzip-compressed archive files (such as the CRU TS 4.05
+and 4.06 `*.dat.nc.gz` files) from a persistent cache of decompressed
+copies, so that the decompression cost is paid once per file rather than
+once per request.
+
+The copies used by a job are pinned in the cache until the job ends (see
+`pin_decompressed_files`), so that other processes do not evict them while
+they are read.
+"""
+
+import gzip
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import ExitStack, contextmanager
+
+from flamingo.utils.cache_utils import DiskCache, make_key
+from flamingo.utils.config_utils import get_config_bool, get_config_size, get_config_value
+
+import logging
+LOGGER = logging.getLogger("PYWPS")
+
+
+COMPRESSED_EXTENSION = ".gz"
+COPY_BUFFER_SIZE = 16 * 1024 ** 2
+
+_cache = None
+_pins = threading.local()
+
+
+def get_decompress_cache():
+    """
+    Returns the shared `DiskCache` of decompressed files, or None if the
+    cache is disabled in the `[decompress_cache]` configuration section.
+    """
+    global _cache
+
+    if not get_config_bool("decompress_cache", "enabled", True):
+        return None
+
+    if _cache is None:
+        cache_dir = get_config_value("decompress_cache", "cache_dir",
+                                     os.path.join(tempfile.gettempdir(), "flamingo", "decompressed"))
+        max_size = get_config_size("decompress_cache", "max_size", "20gb")
+        _cache = DiskCache(cache_dir, max_size=max_size)
+
+    return _cache
+
+
+def is_compressed(file_path):
+    return file_path.endswith(COMPRESSED_EXTENSION)
+
+
+def decompress_file(file_path, cache):
+    """
+    Returns the path to a decompressed copy of `file_path` held in `cache`.
+    The entry is keyed by the source path, modification time and size so
+    that a changed source file is decompressed again.
+    """
+    stat = os.stat(file_path)
+    key = make_key("decompress", os.path.abspath(file_path), stat.st_mtime_ns, stat.st_size)
+    file_name = os.path.basename(file_path)[:-len(COMPRESSED_EXTENSION)]
+
+    def populate(entry_dir):
+        LOGGER.info(f"Decompressing {file_path} into cache")
+
+        with gzip.open(file_path, "rb") as reader:
+            with open(os.path.join(entry_dir, file_name), "wb") as writer:
+                shutil.copyfileobj(reader, writer, COPY_BUFFER_SIZE)
+
+    stack = getattr(_pins, "stack", None)
+    if stack is not None:
+        stack.enter_context(cache.pin(key))
+
+    entry_dir = cache.get_or_create(key, populate)
+    return os.path.join(entry_dir, file_name)
+
+
+@contextmanager
+def pin_decompressed_files():
+    """
+    Context manager pinning the decompressed copies returned in this thread
+    (i.e. for this job) until it exits.
+    """
+    previous = getattr(_pins, "stack", None)
+
+    with ExitStack() as stack:
+        _pins.stack = stack
+        try:
+            yield
+        finally:
+            _pins.stack = previous
+
+
+def decompress_files(file_paths):
+    """
+    Replaces any compressed files in `file_paths` with the paths of their
+    cached, decompressed copies. Returns `file_paths` unchanged if there
+    are no compressed files or the cache is disabled.
+    """
+    if not any(is_compressed(file_path) for file_path in file_paths):
+        return file_paths
+
+    cache = get_decompress_cache()
+    if cache is None:
+        return file_paths
+
+    return [decompress_file(file_path, cache) if is_compressed(file_path) else file_path
+            for file_path in file_paths]
@@ -0,0 +1,134 @@
+"""
+diagram_utils.py
+================
+
+Renders the provenance diagram (the `prov_plot` output) in the background,
+so that Graphviz never adds latency to a job.
+
+The output is given the URL where the diagram will be published (in the
+PyWPS output directory of the request) and the diagram is rendered in a
+thread pool after the handler returns. Diagrams are cached on disk, keyed
+on the provenance graph: jobs with the same graph (most repeated requests)
+re-use the rendered file without calling Graphviz.
+"""
+
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from pywps import configuration
+
+from flamingo.utils.cache_utils import DiskCache, make_key
+from flamingo.utils.config_utils import (
+    get_config_bool, get_config_int, get_config_size, get_config_value
+)
+from flamingo.utils.result_cache_utils import link_or_copy
+
+import logging
+LOGGER = logging.getLogger("PYWPS")
+
+
+DIAGRAM_FORMATS = ("png", "svg")
+
+_cache = None
+_executor = None
+
+
+def diagrams_available():
+    """
+    Returns True if diagrams are enabled in the `[prov_diagram]`
+    configuration section and Graphviz is installed.
+    """
+    if not get_config_bool("prov_diagram", "enabled", True):
+        return False
+
+    if shutil.which("dot") is None:
+        LOGGER.warning("Graphviz 'dot' was not found: provenance diagrams are disabled")
+        return False
+
+    return True
+
+
+def get_diagram_cache():
+    "Returns the shared `DiskCache` of rendered diagrams."
+    global _cache
+
+    if _cache is None:
+        cache_dir = get_config_value("prov_diagram", "cache_dir",
+                                     os.path.join(tempfile.gettempdir(), "flamingo", "diagrams"))
+        max_size = get_config_size("prov_diagram", "max_size", "100mb")
+        _cache = DiskCache(cache_dir, max_size=max_size)
+
+    return _cache
+
+
+def _get_executor():
+    global _executor
+
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=get_config_int("prov_diagram", "workers", 1),
+                                       thread_name_prefix="prov-diagram")
+
+    return _executor
+
+
+def get_diagram_key(provenance, fmt):
+    "Returns the cache key for the diagram of a `Provenance` document in format `fmt`."
+    return make_key("diagram", fmt, provenance.to_json())
+
+
+def render_diagram(prov_json, fmt, file_path):
+    "Renders a PROV-JSON document as a diagram in format `fmt` (png or svg)."
+    from prov.dot import prov_to_dot
+    from prov.model import ProvDocument
+
+    doc = ProvDocument.deserialize(content=prov_json, format="json")
+    prov_to_dot(doc).write(file_path, format=fmt)
+
+
+def _render_and_publish(key, prov_json, fmt, target, render):
+    file_name = f"diagram.{fmt}"
+
+    def populate(entry_dir):
+        render(prov_json, fmt, os.path.join(entry_dir, file_name))
+
+    try:
+        entry_dir = get_diagram_cache().get_or_create(key, populate)
+        link_or_copy(os.path.join(entry_dir, file_name), target)
+    except Exception as exc:
+        LOGGER.warning(f"Could not render the provenance diagram {target}: {exc}")
+        raise
+
+    return target
+
+
+def publish_diagram(provenance, output, request_uuid, render=render_diagram):
+    """
+    Sets `output` to reference the diagram of `provenance`, published in the
+    output directory of the request `request_uuid`.
+
+    A cached diagram is published straight away and None is returned.
+    Otherwise the diagram is rendered in the background with `render` and
+    the `Future` of the rendering is returned.
+    """
+    fmt = output.data_format.extension.lstrip(".") or "png"
+    if fmt not in DIAGRAM_FORMATS:
+        raise ValueError(f"Unsupported diagram format: {fmt}")
+
+    file_name = f"provenance.{fmt}"
+    output_dir = os.path.join(configuration.get_config_value("server", "outputpath"), str(request_uuid))
+    output_url = configuration.get_config_value("server", "outputurl").rstrip("/")
+
+    os.makedirs(output_dir, exist_ok=True)
+    target = os.path.join(output_dir, file_name)
+    output.url = f"{output_url}/{request_uuid}/{file_name}"
+
+    key = get_diagram_key(provenance, fmt)
+    entry_dir = get_diagram_cache().get(key)
+
+    if entry_dir:
+        link_or_copy(os.path.join(entry_dir, f"diagram.{fmt}"), target)
+        return None
+
+    return _get_executor().submit(_render_and_publish, key, provenance.to_json(), fmt, target, render)
@@ -0,0 +1,176 @@
+"""
+encoding_utils.py
+=================
+
+NetCDF output encoding profiles: compression, chunk shapes and packing.
+
+A profile is a named `[netcdf_profile:<name>]` configuration section (the
+"compressed", "timeseries" and "packed" profiles are also built in), or a
+dictionary with the same settings. The profile used by a process is the
+"netcdf_profile" in its `DSET_INFO` or else the `profile` in the `[netcdf]`
+configuration section. The profile "none" leaves the outputs as written by
+clisops.
+
+Profile settings:
+    zlib = true|false          compress the variables
+    complevel = 1..9           zlib compression level
+    shuffle = true|false       apply the HDF5 shuffle filter
+    chunks = map|timeseries|dim:size,...
+                               "map" chunks hold one time step of the
+                               whole area, "timeseries" chunks hold all
+                               time steps of a small tile of the area
+    pack = true|false          pack floating-point data into int16 with
+                               scale_factor/add_offset (lossy)
+"""
+
+from flamingo.utils.config_utils import get_config_value
+
+import logging
+LOGGER = logging.getLogger("PYWPS")
+
+
+PROFILE_DEFAULTS = {
+    "zlib": False,
+    "complevel": 4,
+    "shuffle": True,
+    "chunks": "map",
+    "pack": False,
+}
+
+# Profiles that are available without a configuration section
+PROFILES = {
+    "compressed": {"zlib": True, "complevel": 1},
+    "timeseries": {"zlib": True, "complevel": 1, "chunks": "timeseries"},
+    "packed": {"zlib": True, "complevel": 1, "pack": True},
+}
+
+# Size of the tiles of the area held in "timeseries" chunks
+TIMESERIES_TILE = 32
+
+PACKED_FILL_VALUE = -32768
+
+TRUE_VALUES = ("true", "yes", "1", "on")
+
+
+def _to_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in TRUE_VALUES
+
+    return bool(value)
+
+
+def parse_profile(settings):
+    "Returns a complete profile from a dictionary of (string or typed) settings."
+    profile = dict(PROFILE_DEFAULTS, **settings)
+
+    return {
+        "zlib": _to_bool(profile["zlib"]),
+        "complevel": int(profile["complevel"]),
+        "shuffle": _to_bool(profile["shuffle"]),
+        "chunks": profile["chunks"],
+        "pack": _to_bool(profile["pack"]),
+    }
+
+
+def get_netcdf_profile(dset_info=None):
+    """
+    Returns the NetCDF encoding profile (a dictionary) for a dataset, or None
+    if outputs should be left as written by clisops.
+
+    Params:
+    :dset_info [dict]: the `DSET_INFO` of the process, which may hold a
+        "netcdf_profile" (a profile name or dictionary of settings)
+    """
+    profile = (dset_info or {}).get("netcdf_profile") or get_config_value("netcdf", "profile", "compressed")
+
+    if isinstance(profile, dict):
+        return parse_profile(profile)
+
+    if profile == "none":
+        return None
+
+    from pywps import configuration
+
+    section = f"netcdf_profile:{profile}"
+    if configuration.CONFIG.has_section(section):
+        return parse_profile(dict(configuration.CONFIG.items(section)))
+
+    if profile in PROFILES:
+        return parse_profile(PROFILES[profile])
+
+    raise ValueError(f"Unknown NetCDF encoding profile: {profile}")
+
+
+def get_chunk_sizes(da, chunks):
+    """
+    Returns the HDF5 chunk shape for a variable, from a chunk style ("map"
+    or "timeseries") or a list of "dim:size" strings.
+    """
+    sizes = dict(da.sizes)
+
+    if chunks == "map":
+        wanted = {"time": 1}
+    elif chunks == "timeseries":
+        wanted = {dim: TIMESERIES_TILE for dim in sizes if dim != "time"}
+    else:
+        from flamingo.utils.output_utils import parse_chunks
+
+        items = chunks.split(",") if isinstance(chunks, str) else chunks
+        wanted = parse_chunks(items)
+
+    return tuple(min(wanted.get(dim, size), size) or 1 for dim, size in sizes.items())
+
+
+def get_packing(da):
+    """
+    Returns the (scale_factor, add_offset) that pack the values of `da`
+    into int16, keeping -32768 for missing values.
+    """
+    import dask
+    import numpy as np
+
+    vmin, vmax = dask.compute(da.min(), da.max())
+    vmin, vmax = float(vmin), float(vmax)
+
+    if not np.isfinite(vmin) or not np.isfinite(vmax) or vmin == vmax:
+        return 1.0, vmin if np.isfinite(vmin) else 0.0
+
+    # Map [vmin, vmax] onto [-32767, 32767]
+    return (vmax - vmin) / (2 ** 16 - 2), (vmax + vmin) / 2
+
+
+def get_netcdf_encoding(ds, profile):
+    """
+    Returns the `to_netcdf` encoding of the variables of `ds` for an
+    encoding profile (as returned by `get_netcdf_profile`).
+    """
+    import numpy as np
+
+    encoding = {}
+
+    for name, da in ds.variables.items():
+        # Dimension coordinates are small and left as they are
+        if name in ds.dims or not da.dims or not np.issubdtype(da.dtype, np.number):
+            continue
+
+        var_encoding = {"zlib": profile["zlib"]}
+
+        if profile["zlib"]:
+            var_encoding.update(complevel=profile["complevel"], shuffle=profile["shuffle"])
+
+        if "_FillValue" in da.encoding:
+            var_encoding["_FillValue"] = da.encoding["_FillValue"]
+
+        # Only the data variables (over time) are chunked and packed: others,
+        # such as 2D latitude and longitude, are only compressed
+        if "time" in da.dims and name in ds.data_vars:
+            var_encoding["chunksizes"] = get_chunk_sizes(da, profile["chunks"])
+
+            if profile["pack"] and np.issubdtype(da.dtype, np.floating):
+                scale_factor, add_offset = get_packing(da)
+                var_encoding.update(dtype="int16", scale_factor=scale_factor, add_offset=add_offset,
+                                    _FillValue=np.int16(PACKED_FILL_VALUE))
+
+        encoding[name] = var_encoding
+
+    return encoding
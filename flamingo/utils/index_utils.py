@@ -0,0 +1,274 @@
+"""
+index_utils.py
+==============
+
+A precomputed index of the archive files behind each collection.
+
+For every file the index records its time span, spatial extent, variables,
+shape, data types, chunking, size and modification time. Subset requests
+use it to pass only the files that overlap the requested time range and
+area to `subset`, instead of globbing the archive and opening candidate
+files on every request.
+
+Indexes are stored as one JSON document per collection and are built with
+the `flamingo build-index` command (or at startup, see the `[file_index]`
+configuration section).
+"""
+
+import json
+import os
+import tempfile
+import time
+
+from flamingo.utils.config_utils import get_config_bool, get_config_value
+from flamingo.utils.input_utils import get_collection_files
+
+import logging
+LOGGER = logging.getLogger("PYWPS")
+
+
+LATITUDE_NAMES = ("lat", "latitude")
+LONGITUDE_NAMES = ("lon", "longitude")
+
+_loaded = {}
+
+
+def get_index_dir():
+    """
+    Returns the directory holding the index documents, or None if the
+    index is disabled in the `[file_index]` configuration section.
+    """
+    if not get_config_bool("file_index", "enabled", True):
+        return None
+
+    return get_config_value("file_index", "index_dir",
+                            os.path.join(tempfile.gettempdir(), "flamingo", "index"))
+
+
+def get_index_path(index_dir, collection):
+    return os.path.join(index_dir, f"{collection}.json")
+
+
+def _find_coord(ds, names, standard_name):
+    for name, var in ds.variables.items():
+        if var.attrs.get("standard_name") == standard_name or name in names:
+            return var
+
+    return None
+
+
+def _format_time(value):
+    return value.strftime("%Y-%m-%dT%H:%M:%S") if hasattr(value, "strftime") \
+        else str(value)[:19]
+
+
+def build_file_record(file_path):
+    "Opens `file_path` and returns its index record."
+    import xarray as xr
+
+    stat = os.stat(file_path)
+    record = {
+        "path": file_path,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "time": None,
+        "bbox": None,
+    }
+
+    with xr.open_dataset(file_path, use_cftime=True, decode_timedelta=False) as ds:
+        record["shape"] = dict(ds.sizes)
+        record["variables"] = {
+            name: {
+                "dims": list(var.dims),
+                "dtype": str(var.dtype),
+                "chunks": list(var.encoding["chunksizes"]) if var.encoding.get("chunksizes") else None,
+            }
+            for name, var in ds.data_vars.items()
+        }
+
+        if "time" in ds.variables and ds["time"].size:
+            times = ds["time"].values
+            record["time"] = [_format_time(times.min()), _format_time(times.max())]
+
+        lat = _find_coord(ds, LATITUDE_NAMES, "latitude")
+        lon = _find_coord(ds, LONGITUDE_NAMES, "longitude")
+
+        if lat is not None and lon is not None:
+            record["bbox"] = [float(lon.min()), float(lat.min()), float(lon.max()), float(lat.max())]
+
+    return record
+
+
+def build_collection_index(collection, index_dir=None):
+    """
+    Builds and writes the index for `collection`. Returns the index path.
+    """
+    index_dir = index_dir or get_index_dir()
+    os.makedirs(index_dir, exist_ok=True)
+
+    file_paths = get_collection_files(collection)
+    if not file_paths:
+        raise ValueError(f"No files found for collection: {collection}")
+
+    LOGGER.info(f"Indexing {len(file_paths)} files for collection: {collection}")
+
+    index = {
+        "collection": collection,
+        "created": time.time(),
+        "files": [build_file_record(file_path) for file_path in file_paths],
+    }
+
+    # Write to a temporary file and rename so readers never see a partial index
+    index_path = get_index_path(index_dir, collection)
+    tmp_path = f"{index_path}.{os.getpid()}.tmp"
+
+    with open(tmp_path, "w") as writer:
+        json.dump(index, writer)
+
+    os.replace(tmp_path, index_path)
+    return index_path
+
+
+def load_collection_index(collection, index_dir=None):
+    """
+    Returns the index for `collection`, or None if it has not been built.
+    Indexes are held in memory until the document on disk changes.
+    """
+    index_dir = index_dir or get_index_dir()
+    if not index_dir:
+        return None
+
+    index_path = get_index_path(index_dir, collection)
+
+    try:
+        mtime = os.path.getmtime(index_path)
+    except OSError:
+        return None
+
+    cached = _loaded.get(index_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with open(index_path) as reader:
+        index = json.load(reader)
+
+    _loaded[index_path] = (mtime, index)
+    return index
+
+
+def _pad_time(value, upper):
+    """
+    Extends a partial time string (e.g. "2001" or "2001-06-30") to a full
+    "YYYY-MM-DDTHH:MM:SS" string at the start (or end) of the period.
+    """
+    template = "9999-12-31T23:59:59" if upper else "0000-01-01T00:00:00"
+    value = str(value).replace(" ", "T")
+    return value + template[len(value):]
+
+
+def _overlaps_time(record, start, end):
+    if not record["time"]:
+        return True
+
+    first, last = record["time"]
+    return (start is None or last >= start) and (end is None or first <= end)
+
+
+def _overlaps_area(record, area):
+    if not record["bbox"] or not area:
+        return True
+
+    min_lon, min_lat, max_lon, max_lat = [float(value) for value in area]
+    f_min_lon, f_min_lat, f_max_lon, f_max_lat = record["bbox"]
+
+    if max_lat < f_min_lat or min_lat > f_max_lat:
+        return False
+
+    # Only compare longitudes if both use the -180 to 180 convention
+    if -180 <= min_lon <= max_lon <= 180 and -180 <= f_min_lon <= f_max_lon <= 180:
+        return not (max_lon < f_min_lon or min_lon > f_max_lon)
+
+    return True
+
+
+def get_file_records(collection, time=None, area=None, index_dir=None):
+    """
+    Returns the index records of the files in `collection` that overlap the
+    requested time interval and area.
+
+    Returns None if there is no index, or if any selected file has changed
+    since it was indexed, so that the caller falls back to scanning the archive.
+    """
+    index = load_collection_index(collection, index_dir)
+    if index is None:
+        return None
+
+    records = filter_records(index["files"], time, area)
+
+    if any(record_changed(record) for record in records):
+        LOGGER.warning(f"Index for {collection} is out of date: please rebuild it.")
+        return None
+
+    return records
+
+
+def filter_records(records, time=None, area=None):
+    "Returns the file records that overlap the requested time interval and area."
+    time_value = getattr(time, "value", time) or (None, None)
+    start = _pad_time(time_value[0], upper=False) if time_value[0] else None
+    end = _pad_time(time_value[1], upper=True) if time_value[1] else None
+
+    return [record for record in records
+            if _overlaps_time(record, start, end) and _overlaps_area(record, area)]
+
+
+def record_changed(record):
+    "Returns True if the file of a record has changed (or gone) since the record was made."
+    try:
+        stat = os.stat(record["path"])
+    except OSError:
+        return True
+
+    return (stat.st_mtime, stat.st_size) != (record["mtime"], record["size"])
+
+
+def select_files(collection, time=None, area=None, index_dir=None):
+    """
+    Returns the paths of the files in `collection` that overlap the requested
+    time interval and area, or None if the index cannot be used.
+    """
+    records = get_file_records(collection, time, area, index_dir)
+    if records is None:
+        return None
+
+    return [record["path"] for record in records]
+
+
+def build_indexes(collections, index_dir=None, missing_only=False):
+    """
+    Builds the index for each collection in `collections`. Collections that
+    cannot be indexed are logged and skipped. If `missing_only` is set, only
+    collections without an index are built.
+
+    Returns a list of the index paths written.
+    """
+    index_dir = index_dir or get_index_dir()
+    index_paths = []
+
+    for collection in collections:
+        if missing_only and os.path.isfile(get_index_path(index_dir, collection)):
+            continue
+
+        try:
+            index_paths.append(build_collection_index(collection, index_dir))
+        except Exception as exc:
+            LOGGER.warning(f"Could not index collection {collection}: {exc}")
+
+    return index_paths
+
+
+def get_process_collections(processes):
+    "Returns the collection identifiers for all processes that declare them (once each)."
+    collections = [collection for process in processes if hasattr(process, "get_collections")
+                   for collection in process.get_collections()]
+    return list(dict.fromkeys(collections))
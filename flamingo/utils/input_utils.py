@@ -1,7 +1,8 @@
 import os
 from pywps.app.exceptions import ProcessError
 
-from clisops.parameter._utils import interval
+# clisops is imported inside the functions that use it, so that the
+# application can start without importing the scientific stack
 
 def parse_wps_input(inputs, key, as_interval=False, as_sequence=False, 
                     must_exist=False, default=None):
@@ -16,6 +17,7 @@ def parse_wps_input(inputs, key, as_interval=False, as_sequence=False,
 
     # Special issue for ranges
     if as_interval:
+        from clisops.parameter._utils import interval
         value = interval(value[0].data)
     elif as_sequence:
         value = [dset.data for dset in value]
@@ -24,6 +26,33 @@ def parse_wps_input(inputs, key, as_interval=False, as_sequence=False,
 
     return value
 
+def normalise_request(identifier, collection, time=None, area=None, output_format=None,
+                      precision=4, output_options=None):
+    """
+    Returns the parameters of a subset request in a canonical form, so that
+    equivalent requests can be recognised (e.g. for caching). Times that
+    fall at midnight lose their time component and bounding box values are
+    rounded to `precision` decimal places. The `output_options` are the
+    settings that change the output files (e.g. the NetCDF profile).
+    """
+    time_value = getattr(time, "value", time)
+
+    if time_value:
+        time_value = [str(tm).replace("T00:00:00", "") if tm else None for tm in time_value]
+
+    if area:
+        area = [round(float(value), precision) for value in area]
+
+    return {
+        "identifier": identifier,
+        "collection": collection,
+        "time": time_value or None,
+        "area": area or None,
+        "output_format": output_format,
+        "output_options": output_options or None,
+    }
+
+
 def clean_inputs(inputs):
     "Remove common arguments not required in processing calls."
     to_remove = ('pre_checked', 'original_files')
@@ -47,3 +76,34 @@ def resolve_collection_if_files(coll):
                 return first_dir
 
     return coll[0]
+
+
+def get_collection_files(collection):
+    "Returns the sorted list of archive files mapped to a collection identifier."
+    from clisops.project_utils import DatasetMapper
+    return DatasetMapper(collection).files
+
+
+def to_file_mapper(file_paths, staging_dir):
+    """
+    Returns a `FileMapper` representing `file_paths` as a single dataset.
+    Files that do not share a directory are symlinked into `staging_dir`
+    first, since a `FileMapper` requires all its files to be in one place.
+    """
+    from clisops.utils.file_utils import FileMapper
+
+    dir_names = {os.path.dirname(file_path) for file_path in file_paths}
+
+    if len(dir_names) > 1:
+        os.makedirs(staging_dir, exist_ok=True)
+        staged_paths = []
+
+        for file_path in file_paths:
+            staged_path = os.path.join(staging_dir, os.path.basename(file_path))
+            if not os.path.lexists(staged_path):
+                os.symlink(file_path, staged_path)
+            staged_paths.append(staged_path)
+
+        file_paths = staged_paths
+
+    return FileMapper(file_paths)
@@ -0,0 +1,391 @@
+"""
+job_utils.py
+============
+
+An execution backend that runs the heavy part of each job in a dedicated
+pool of worker processes, fed by a persistent job queue held in SQLite.
+
+The PyWPS process submits a task to the queue and waits for it, relaying
+the progress reported by the worker through `response.update_status`.
+Jobs are claimed in priority order, subject to a per-user limit on the
+number of running jobs. Because the queue lives on disk, queued jobs
+survive a restart of the web workers, and jobs left running by a worker
+that has died are put back on the queue, unless they have already been
+started `max_attempts` times (their worker probably died running them).
+
+Since the PyWPS process waits for its job, each queued or running job
+still holds one of the `parallelprocesses` of the PyWPS server: that
+setting bounds the number of jobs in the queue, and should be larger than
+the number of workers.
+
+Workers are started with `flamingo workers`, or by `flamingo start` when
+`spawn_workers` is set in the `[jobs]` configuration section (see
+`flamingo.wsgi.start_workers` for other servers).
+"""
+
+import importlib
+import multiprocessing
+import os
+import pickle
+import sqlite3
+import tempfile
+import time
+import traceback
+import uuid
+
+import psutil
+
+from flamingo.utils.admission_utils import admission_enabled, get_large_lane
+from flamingo.utils.config_utils import (
+    get_config_bool, get_config_float, get_config_int, get_config_list, get_config_value
+)
+
+import logging
+LOGGER = logging.getLogger("PYWPS")
+
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+DEFAULT_LANE = "default"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    task TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    user TEXT NOT NULL,
+    lane TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    progress INTEGER NOT NULL DEFAULT 0,
+    message TEXT,
+    result BLOB,
+    worker_pid INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lane, priority, created);
+"""
+
+_pool = []
+
+
+def jobs_enabled():
+    return get_config_bool("jobs", "enabled", False)
+
+
+def get_queue_path():
+    return get_config_value("jobs", "database",
+                            os.path.join(tempfile.gettempdir(), "flamingo", "jobs.sqlite"))
+
+
+class JobQueue:
+    """
+    A persistent queue of jobs shared by all processes on one host.
+
+    Params:
+    :db_path [str]: path to the SQLite database file
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+            # Queues created before jobs counted their attempts
+            columns = [column["name"] for column in conn.execute("PRAGMA table_info(jobs)")]
+            if "attempts" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def submit(self, task, kwargs, user="anonymous", lane=DEFAULT_LANE, priority=0, message=None):
+        """
+        Adds a job to the queue and returns its identifier. `task` is the
+        dotted path of a module-level function ("package.module:function")
+        that will be called with `kwargs`. `message` is the status of the
+        job until a worker reports its progress.
+        """
+        job_id = uuid.uuid4().hex
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, task, payload, user, lane, priority, status, message, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, task, pickle.dumps(kwargs), user, lane, priority, QUEUED, message, time.time())
+            )
+
+        return job_id
+
+    def claim(self, worker_pid, lanes=(DEFAULT_LANE,), user_limit=0):
+        """
+        Marks the next eligible job as running and returns it, or returns None
+        if there is nothing to do. Jobs are taken highest priority first, then
+        oldest first, skipping users that already have `user_limit` jobs running.
+        """
+        conn = self._connect()
+
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            lane_params = ",".join("?" for _ in lanes)
+
+            candidates = conn.execute(
+                f"SELECT * FROM jobs WHERE status = ? AND lane IN ({lane_params}) "
+                "ORDER BY priority DESC, created ASC",
+                (QUEUED, *lanes)
+            ).fetchall()
+
+            running = dict(conn.execute(
+                "SELECT user, COUNT(*) FROM jobs WHERE status = ? GROUP BY user", (RUNNING,)
+            ).fetchall())
+
+            for job in candidates:
+                if user_limit and running.get(job["user"], 0) >= user_limit:
+                    continue
+
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker_pid = ?, started = ?, attempts = attempts + 1 WHERE id = ?",
+                    (RUNNING, worker_pid, time.time(), job["id"])
+                )
+                conn.execute("COMMIT")
+                return job
+
+            conn.execute("COMMIT")
+            return None
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            return conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+
+    def update_progress(self, job_id, message, progress=None):
+        with self._connect() as conn:
+            if progress is None:
+                conn.execute("UPDATE jobs SET message = ? WHERE id = ?", (message, job_id))
+            else:
+                conn.execute("UPDATE jobs SET message = ?, progress = ? WHERE id = ?",
+                             (message, int(progress), job_id))
+
+    def complete(self, job_id, result):
+        "Stores the result of a running job. Jobs failed in the meantime (e.g. timed out) are left as they are."
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, progress = 100, result = ?, finished = ? WHERE id = ? AND status = ?",
+                (SUCCEEDED, pickle.dumps(result), time.time(), job_id, RUNNING)
+            )
+
+    def fail(self, job_id, message):
+        "Marks a queued or running job as failed. Returns False if it had already finished."
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, message = ?, finished = ? WHERE id = ? AND status IN (?, ?)",
+                (FAILED, message, time.time(), job_id, QUEUED, RUNNING)
+            )
+
+        return cursor.rowcount > 0
+
+    def requeue_orphans(self, max_attempts=3):
+        """
+        Puts jobs back on the queue if the worker that claimed them is no
+        longer running, or fails them if they have been started `max_attempts`
+        times (0 for no limit). Returns the number of jobs requeued.
+        """
+        with self._connect() as conn:
+            running = conn.execute(
+                "SELECT id, worker_pid, attempts FROM jobs WHERE status = ?", (RUNNING,)
+            ).fetchall()
+
+            orphans = [job for job in running if not psutil.pid_exists(job["worker_pid"])]
+            n_requeued = 0
+
+            for job in orphans:
+                if max_attempts and job["attempts"] >= max_attempts:
+                    LOGGER.error(f"Failing job {job['id']}: its worker stopped in each of {job['attempts']} attempts")
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, message = ?, finished = ? WHERE id = ? AND status = ?",
+                        (FAILED, f"Job failed: its worker stopped in each of {job['attempts']} attempts",
+                         time.time(), job["id"], RUNNING)
+                    )
+                    continue
+
+                LOGGER.warning(f"Requeueing job {job['id']} from a worker that has stopped")
+                conn.execute(
+                    "UPDATE jobs SET status = ?, worker_pid = NULL, started = NULL WHERE id = ? AND status = ?",
+                    (QUEUED, job["id"], RUNNING)
+                )
+                n_requeued += 1
+
+        return n_requeued
+
+    def purge(self, max_age):
+        "Removes finished jobs older than `max_age` seconds."
+        with self._connect() as conn:
+            conn.execute("DELETE FROM jobs WHERE status IN (?, ?) AND finished < ?",
+                         (SUCCEEDED, FAILED, time.time() - max_age))
+
+
+def import_task(task):
+    "Returns the function referred to by a 'package.module:function' string."
+    module_name, func_name = task.split(":")
+    return getattr(importlib.import_module(module_name), func_name)
+
+
+def run_worker(db_path, lanes=(DEFAULT_LANE,), config_files=None, poll_interval=1.0,
+               user_limit=0, retention=86400, max_jobs=None, max_attempts=3):
+    """
+    Runs a worker loop: claims jobs from the queue and executes them until
+    `max_jobs` jobs have been run (forever if None). Finished jobs are kept
+    in the queue for `retention` seconds, and jobs whose worker has died are
+    started at most `max_attempts` times.
+    """
+    if config_files is not None:
+        from pywps import configuration
+        configuration.load_configuration(config_files)
+
+    queue = JobQueue(db_path)
+    pid = os.getpid()
+    n_jobs = 0
+
+    LOGGER.info(f"Job worker {pid} started for lanes: {', '.join(lanes)}")
+
+    while max_jobs is None or n_jobs < max_jobs:
+        queue.requeue_orphans(max_attempts)
+        job = queue.claim(pid, lanes=lanes, user_limit=user_limit)
+
+        if job is None:
+            time.sleep(poll_interval)
+            continue
+
+        n_jobs += 1
+        job_id = job["id"]
+
+        def progress(message, status_percentage=None):
+            queue.update_progress(job_id, message, status_percentage)
+
+        try:
+            func = import_task(job["task"])
+            result = func(progress=progress, **pickle.loads(job["payload"]))
+        except Exception as exc:
+            LOGGER.error(f"Job {job_id} failed: {traceback.format_exc()}")
+            queue.fail(job_id, str(exc))
+        else:
+            queue.complete(job_id, result)
+
+        queue.purge(retention)
+
+
+def start_worker_pool(config_files=None):
+    """
+    Starts the configured number of worker processes for this host, if they
+    are not already running from this process. Called once per host (see
+    `flamingo.wsgi.start_workers`), not from each web worker. Workers are also started for
+    the lane of large jobs (see `admission_utils`), unless the other workers
+    already take jobs from it.
+    """
+    if _pool:
+        return _pool
+
+    ctx = multiprocessing.get_context("spawn")
+    kwargs = {
+        "db_path": get_queue_path(),
+        "lanes": get_config_list("jobs", "lanes", [DEFAULT_LANE]),
+        "config_files": config_files,
+        "poll_interval": get_config_float("jobs", "poll_interval", 1.0),
+        "user_limit": get_config_int("jobs", "user_limit", 2),
+        "retention": get_config_int("jobs", "retention", 86400),
+        "max_attempts": get_config_int("jobs", "max_attempts", 3),
+    }
+
+    LOGGER.info(f"Starting {get_config_int('jobs', 'workers', 2)} job workers")
+
+    for _ in range(get_config_int("jobs", "workers", 2)):
+        worker = ctx.Process(target=run_worker, kwargs=kwargs, daemon=True)
+        worker.start()
+        _pool.append(worker)
+
+    large_lane = get_large_lane()
+    if admission_enabled() and large_lane not in kwargs["lanes"]:
+        n_large = get_config_int("admission", "large_jobs", 1)
+        LOGGER.info(f"Starting {n_large} job workers for the {large_lane} lane")
+
+        for _ in range(n_large):
+            worker = ctx.Process(target=run_worker, kwargs=dict(kwargs, lanes=[large_lane]), daemon=True)
+            worker.start()
+            _pool.append(worker)
+
+    return _pool
+
+
+def get_request_user(request):
+    "Returns an identifier for the user making a WPS request."
+    http_request = getattr(request, "http_request", None)
+
+    if http_request is None:
+        return "anonymous"
+
+    return http_request.remote_user or http_request.headers.get("X-Forwarded-For") or \
+        http_request.remote_addr or "anonymous"
+
+
+def run_job(task, kwargs, response=None, user="anonymous", lane=DEFAULT_LANE, priority=0, message=None):
+    """
+    Submits a job to the queue and waits for it to finish, relaying its
+    progress (starting with `message`, if given) to `response`. Returns the
+    result of the task or raises a RuntimeError with the message of a
+    failed job.
+
+    The job is failed if no worker has started it `queue_timeout` seconds
+    after it was submitted (e.g. no worker takes jobs from its lane), or if
+    it has not finished after `timeout` seconds (settings of the `[jobs]`
+    section, 0 for no limit). A worker still running a job that has timed
+    out finishes it, but its result is discarded.
+    """
+    queue = JobQueue(get_queue_path())
+    job_id = queue.submit(task, kwargs, user=user, lane=lane, priority=priority, message=message)
+    poll_interval = get_config_float("jobs", "poll_interval", 1.0)
+    queue_timeout = get_config_float("jobs", "queue_timeout", 900)
+    timeout = get_config_float("jobs", "timeout", 21600)
+    submitted = time.time()
+    last_status = None
+
+    LOGGER.info(f"Submitted job {job_id} to the {lane} lane")
+
+    while True:
+        job = queue.get(job_id)
+        status = (job["status"], job["message"], job["progress"])
+
+        if job["status"] == SUCCEEDED:
+            return pickle.loads(job["result"])
+        elif job["status"] == FAILED:
+            raise RuntimeError(job["message"])
+
+        waited = time.time() - submitted
+        if queue_timeout and job["status"] == QUEUED and waited > queue_timeout:
+            reason = f"Job was not started by a worker of the {lane} lane within {queue_timeout:g} seconds"
+        elif timeout and waited > timeout:
+            reason = f"Job did not finish within {timeout:g} seconds"
+        else:
+            reason = None
+
+        # Unless the job has just finished
+        if reason and queue.fail(job_id, reason):
+            LOGGER.error(f"Job {job_id} failed: {reason}")
+            raise RuntimeError(reason)
+
+        if response is not None and status != last_status:
+            message = job["message"] or f"Job {job['status']}"
+            response.update_status(message, job["progress"])
+            last_status = status
+
+        time.sleep(poll_interval)
@@ -1,24 +1,105 @@
+import os
+import shutil
+import uuid
 from urllib.parse import urlparse
 
+from pywps import configuration
 from pywps.inout.outputs import MetaFile, MetaLink4
-from pywps import FORMATS
+from pywps import FORMATS, Format
+
+from flamingo.utils.cache_utils import get_dir_size
+from flamingo.utils.result_cache_utils import link_or_copy
 
 file_type_map = {
     "netcdf": FORMATS.NETCDF,
-    "csv": FORMATS.TEXT
+    "csv": FORMATS.TEXT,
+    "json": FORMATS.JSON,
+    "parquet": Format("application/vnd.apache.parquet", extension=".parquet"),
+    "feather": Format("application/vnd.apache.arrow.file", extension=".feather"),
+    "zarr": Format("application/zip", extension=".zip"),
 }
 
+# Directory stores are published as directories that clients read partially
+ZARR_DIRECTORY_FORMAT = Format("application/vnd+zarr", extension=".zarr")
+
+
+def get_publish_dir(request_uuid):
+    "Returns the directory of the PyWPS output directory holding the outputs of a request."
+    return os.path.join(configuration.get_config_value("server", "outputpath"), str(request_uuid))
+
+
+def get_publish_url(request_uuid, name):
+    output_url = configuration.get_config_value("server", "outputurl").rstrip("/")
+    return f"{output_url}/{request_uuid}/{name}"
+
+
+def publish_file(file_path, request_uuid):
+    """
+    Publishes a file in the output directory of a request, as PyWPS does
+    for the outputs of the request when it finishes, and returns its URL.
+    """
+    publish_dir = get_publish_dir(request_uuid)
+    os.makedirs(publish_dir, exist_ok=True)
+
+    name = os.path.basename(file_path)
+    link_or_copy(file_path, os.path.join(publish_dir, name))
+    return get_publish_url(request_uuid, name)
+
+
+def publish_directory(dir_path, request_uuid=None):
+    """
+    Publishes a directory (such as a Zarr directory store) in the output
+    directory of a request, as PyWPS does for files, and returns its URL.
+    """
+    request_uuid = request_uuid or uuid.uuid1()
+    name = os.path.basename(dir_path.rstrip("/"))
+
+    shutil.copytree(dir_path, os.path.join(get_publish_dir(request_uuid), name),
+                    copy_function=link_or_copy, dirs_exist_ok=True)
+    return get_publish_url(request_uuid, name)
+
+
+def get_published_url(file_path, request_uuid):
+    """
+    Returns the URL of the copy of a file published (by `publish_file`) in
+    the output directory of a request, or None if it has not been published.
+    """
+    published = os.path.join(get_publish_dir(request_uuid), os.path.basename(file_path))
+
+    try:
+        if os.path.samefile(file_path, published) or os.path.getsize(file_path) == os.path.getsize(published):
+            return get_publish_url(request_uuid, os.path.basename(file_path))
+    except OSError:
+        pass
+
+    return None
+
 
-def build_metalink(identity, description, workdir, file_uris, file_type):
+def build_metalink(identity, description, workdir, file_uris, file_type, request_uuid=None):
+    """
+    Returns a Metalink document listing the output files (or URLs) in
+    `file_uris`. The files already published for the request `request_uuid`
+    (see `publish_file`) are listed by URL rather than copied again, and
+    directories are published with the outputs of the request.
+    """
     ml4 = MetaLink4(identity, description, workdir=workdir)
     file_desc = f"{file_type.upper()} file"
 
     # Add file paths or URLs
     for file_uri in file_uris:
-        mf = MetaFile(file_desc, file_desc, fmt=file_type_map.get(file_type, file_type))
+        is_dir = os.path.isdir(file_uri)
+        fmt = ZARR_DIRECTORY_FORMAT if is_dir else file_type_map.get(file_type, file_type)
+        mf = MetaFile(file_desc, file_desc, fmt=fmt)
+        published_url = get_published_url(file_uri, request_uuid) if request_uuid and not is_dir else None
 
         if urlparse(file_uri).scheme in ["http", "https"]:
             mf.url = file_uri
+        elif published_url:
+            mf.url = published_url
+            mf.size = os.path.getsize(file_uri)
+        elif is_dir:
+            mf.url = publish_directory(file_uri, request_uuid)
+            mf.size = get_dir_size(file_uri)
         else:
             mf.file = file_uri
 
@@ -0,0 +1,352 @@
+"""
+metrics_utils.py
+================
+
+Per-stage timing and profiling of jobs.
+
+Each job is timed in stages (input parsing, collection resolution, file
+discovery, subset, CSV conversion, metalink build and provenance write).
+For every stage the wall-clock time, bytes read and written by the process
+and the peak of its resident memory while the stage ran (sampled, see
+`MemorySampler`) are logged as a JSON record and added to a metrics store
+shared by all processes on the host (web and job workers).
+
+The WSGI application serves the store in the Prometheus text format at
+`/metrics` (see `MetricsMiddleware`). Setting `profile` in the `[metrics]`
+configuration section also writes a cProfile (or pyinstrument) dump of
+each job.
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+import psutil
+
+from flamingo.utils.config_utils import get_config_bool, get_config_float, get_config_value
+
+import logging
+LOGGER = logging.getLogger("PYWPS")
+
+
+# Upper bounds (in seconds) of the stage duration histogram buckets
+DURATION_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 1800, 3600, float("inf"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS stage_buckets (
+    process TEXT NOT NULL, stage TEXT NOT NULL, le REAL NOT NULL, count INTEGER NOT NULL,
+    PRIMARY KEY (process, stage, le)
+);
+CREATE TABLE IF NOT EXISTS stage_totals (
+    process TEXT NOT NULL, stage TEXT NOT NULL,
+    count INTEGER NOT NULL, seconds REAL NOT NULL,
+    bytes_read INTEGER NOT NULL, bytes_written INTEGER NOT NULL,
+    PRIMARY KEY (process, stage)
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    process TEXT NOT NULL, status TEXT NOT NULL, count INTEGER NOT NULL,
+    peak_rss INTEGER NOT NULL,
+    PRIMARY KEY (process, status)
+);
+"""
+
+
+def metrics_enabled():
+    return get_config_bool("metrics", "enabled", True)
+
+
+def get_metrics_path():
+    return get_config_value("metrics", "database",
+                            os.path.join(tempfile.gettempdir(), "flamingo", "metrics.sqlite"))
+
+
+class MetricsStore:
+    """
+    Counters and histograms of job stages, held in SQLite so that they
+    are shared by all processes on one host.
+
+    Params:
+    :db_path [str]: path to the SQLite database file
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def observe_stage(self, process, stage, seconds, bytes_read=0, bytes_written=0):
+        le = next(bound for bound in DURATION_BUCKETS if seconds <= bound)
+
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO stage_buckets VALUES (?, ?, ?, 1) "
+                "ON CONFLICT (process, stage, le) DO UPDATE SET count = count + 1",
+                (process, stage, le)
+            )
+            conn.execute(
+                "INSERT INTO stage_totals VALUES (?, ?, 1, ?, ?, ?) "
+                "ON CONFLICT (process, stage) DO UPDATE SET count = count + 1, "
+                "seconds = seconds + excluded.seconds, "
+                "bytes_read = bytes_read + excluded.bytes_read, "
+                "bytes_written = bytes_written + excluded.bytes_written",
+                (process, stage, seconds, bytes_read, bytes_written)
+            )
+
+    def observe_job(self, process, status, peak_rss):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs VALUES (?, ?, 1, ?) "
+                "ON CONFLICT (process, status) DO UPDATE SET count = count + 1, "
+                "peak_rss = MAX(peak_rss, excluded.peak_rss)",
+                (process, status, peak_rss)
+            )
+
+    def to_prometheus(self):
+        "Returns all metrics in the Prometheus text exposition format."
+        with self._connect() as conn:
+            buckets = conn.execute(
+                "SELECT process, stage, le, count FROM stage_buckets ORDER BY process, stage, le"
+            ).fetchall()
+            totals = conn.execute("SELECT * FROM stage_totals ORDER BY process, stage").fetchall()
+            jobs = conn.execute("SELECT * FROM jobs ORDER BY process, status").fetchall()
+
+        lines = [
+            "# HELP flamingo_stage_duration_seconds Time spent in each stage of a job.",
+            "# TYPE flamingo_stage_duration_seconds histogram",
+        ]
+
+        counts = {}
+        for process, stage, le, count in buckets:
+            counts.setdefault((process, stage), {})[le] = count
+
+        # Histogram buckets are cumulative and every bucket is listed
+        for (process, stage), stage_counts in counts.items():
+            cumulative = 0
+            for le in DURATION_BUCKETS:
+                cumulative += stage_counts.get(le, 0)
+                bound = "+Inf" if le == float("inf") else f"{le:g}"
+                lines.append(f'flamingo_stage_duration_seconds_bucket{{process="{process}",'
+                             f'stage="{stage}",le="{bound}"}} {cumulative}')
+
+        for process, stage, count, seconds, _, _ in totals:
+            labels = f'process="{process}",stage="{stage}"'
+            lines.append(f"flamingo_stage_duration_seconds_sum{{{labels}}} {seconds}")
+            lines.append(f"flamingo_stage_duration_seconds_count{{{labels}}} {count}")
+
+        for name, index, help_text in (("read", 4, "Bytes read"), ("written", 5, "Bytes written")):
+            lines.append(f"# HELP flamingo_stage_bytes_{name}_total {help_text} in each stage of a job.")
+            lines.append(f"# TYPE flamingo_stage_bytes_{name}_total counter")
+            lines.extend(f'flamingo_stage_bytes_{name}_total{{process="{row[0]}",stage="{row[1]}"}} '
+                         f"{row[index]}" for row in totals)
+
+        lines.append("# HELP flamingo_jobs_total Jobs run, by final status.")
+        lines.append("# TYPE flamingo_jobs_total counter")
+        lines.extend(f'flamingo_jobs_total{{process="{process}",status="{status}"}} {count}'
+                     for process, status, count, _ in jobs)
+
+        lines.append("# HELP flamingo_job_peak_rss_bytes Largest resident memory sampled while a job ran.")
+        lines.append("# TYPE flamingo_job_peak_rss_bytes gauge")
+        peaks = {}
+        for process, _, _, peak_rss in jobs:
+            peaks[process] = max(peaks.get(process, 0), peak_rss)
+        lines.extend(f'flamingo_job_peak_rss_bytes{{process="{process}"}} {peak_rss}'
+                     for process, peak_rss in peaks.items())
+
+        return "\n".join(lines) + "\n"
+
+
+class MemorySampler:
+    """
+    Context manager sampling the resident memory of this process every
+    `interval` seconds while the enclosed code runs, and keeping the
+    largest value in bytes (`peak`). Unlike `ru_maxrss`, the peak over the
+    life of the process, this is the peak while the code ran (including
+    any other job run by the process meanwhile).
+    """
+
+    def __init__(self, interval=0.5):
+        self.interval = interval
+        self.peak = 0
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        try:
+            self.peak = max(self.peak, self._process.memory_info().rss)
+        except psutil.Error:
+            pass
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+    def __enter__(self):
+        self.sample()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+
+def get_io_counters():
+    "Returns (bytes read, bytes written) by this process, or zeros if unsupported."
+    try:
+        counters = psutil.Process().io_counters()
+    except (AttributeError, psutil.Error):
+        return 0, 0
+
+    # On Linux, count all bytes passed through read/write calls (including
+    # reads served from the page cache), not just those that reached the disk
+    return (getattr(counters, "read_chars", counters.read_bytes),
+            getattr(counters, "write_chars", counters.write_bytes))
+
+
+class StageTimer:
+    """
+    Records the duration, I/O and peak memory of the stages of one job.
+
+    Params:
+    :process [str]: identifier of the process running the job
+    :job_id [str]: identifier of the job (used in log records)
+    """
+
+    def __init__(self, process, job_id=None):
+        self.process = process
+        self.job_id = job_id
+        self.stages = []
+        self.store = MetricsStore(get_metrics_path()) if metrics_enabled() else None
+        self.memory_interval = get_config_float("metrics", "memory_interval", 0.5)
+
+    @contextmanager
+    def stage(self, name):
+        "Context manager that times the enclosed code as stage `name`."
+        read_before, written_before = get_io_counters()
+        start = time.perf_counter()
+        status = "ok"
+
+        try:
+            with MemorySampler(self.memory_interval) as memory:
+                yield
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            read_after, written_after = get_io_counters()
+            record = {
+                "event": "stage",
+                "process": self.process,
+                "job_id": self.job_id,
+                "stage": name,
+                "status": status,
+                "seconds": round(time.perf_counter() - start, 6),
+                "bytes_read": read_after - read_before,
+                "bytes_written": written_after - written_before,
+                "peak_rss": memory.peak,
+            }
+            self.stages.append(record)
+            self._emit(record)
+
+            if self.store:
+                self.store.observe_stage(self.process, name, record["seconds"],
+                                         record["bytes_read"], record["bytes_written"])
+
+    def finish(self, status):
+        "Records the end of the job with its final `status`."
+        record = {
+            "event": "job",
+            "process": self.process,
+            "job_id": self.job_id,
+            "status": status,
+            "seconds": round(sum(stage["seconds"] for stage in self.stages), 6),
+            "peak_rss": max((stage["peak_rss"] for stage in self.stages), default=0),
+        }
+        self._emit(record)
+
+        if self.store:
+            self.store.observe_job(self.process, status, record["peak_rss"])
+
+    def _emit(self, record):
+        LOGGER.info(json.dumps(record))
+
+
+@contextmanager
+def profile_job(name):
+    """
+    Context manager that profiles the enclosed code if `profile` is set in
+    the `[metrics]` configuration section, writing the result to
+    `profile_dir` as `<name>.prof` (cProfile) or `<name>.html` (pyinstrument).
+    """
+    if not get_config_bool("metrics", "profile", False):
+        yield
+        return
+
+    profile_dir = get_config_value("metrics", "profile_dir",
+                                   os.path.join(tempfile.gettempdir(), "flamingo", "profiles"))
+    os.makedirs(profile_dir, exist_ok=True)
+
+    if get_config_value("metrics", "profiler", "cprofile") == "pyinstrument":
+        from pyinstrument import Profiler
+
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            profile_path = os.path.join(profile_dir, f"{name}.html")
+            with open(profile_path, "w") as writer:
+                writer.write(profiler.output_html())
+    else:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profile_path = os.path.join(profile_dir, f"{name}.prof")
+            profiler.dump_stats(profile_path)
+
+    LOGGER.info(f"Wrote profile: {profile_path}")
+
+
+class MetricsMiddleware:
+    """
+    WSGI middleware that serves the metrics store at `path` and passes
+    all other requests to `app`.
+    """
+
+    def __init__(self, app, path="/metrics"):
+        self.app = app
+        self.path = path
+
+    def __call__(self, environ, start_response):
+        if environ.get("PATH_INFO", "").rstrip("/") != self.path:
+            return self.app(environ, start_response)
+
+        body = MetricsStore(get_metrics_path()).to_prometheus().encode("utf-8")
+        start_response("200 OK", [
+            ("Content-Type", "text/plain; version=0.0.4; charset=utf-8"),
+            ("Content-Length", str(len(body))),
+        ])
+        return [body]
+
+    def __getattr__(self, name):
+        # Give access to the attributes of the wrapped application
+        return getattr(self.app, name)
@@ -0,0 +1,308 @@
+"""
+mirror_utils.py
+===============
+
+A local mirror of archive collections, rechunked for time series access.
+
+The archive files are chunked for map access (the whole grid, or a large
+part of it, in each chunk of one time step), so a request for a long time
+series over a small area reads nearly every chunk of every file. The mirror
+holds a NetCDF4 copy of each file of a collection whose chunks hold all the
+time steps of the file for a tile of the grid. It is built, and brought up
+to date with the archive, by the `flamingo build-mirror` command.
+
+For each request, the size of the chunks that would be read from the
+archive files and from the mirror are compared, and the files of the layout
+reading less are subset (see `select_mirror_files`). The mirror is only
+used if all the files needed are up to date.
+
+The mirror of a collection is described by a JSON manifest holding, for
+each file, the index records (see `index_utils`) of the archive file and of
+its copy. Settings are read from the `[mirror]` configuration section.
+"""
+
+import json
+import os
+import tempfile
+import time
+
+from flamingo.utils.admission_utils import get_itemsize, get_selected_shape, is_gridded
+from flamingo.utils.config_utils import get_config_bool, get_config_int, get_config_size, get_config_value
+from flamingo.utils.decompress_utils import decompress_files, pin_decompressed_files
+from flamingo.utils.index_utils import build_file_record, filter_records, record_changed
+from flamingo.utils.input_utils import get_collection_files
+
+import logging
+LOGGER = logging.getLogger("PYWPS")
+
+
+MANIFEST_NAME = "mirror.json"
+
+_loaded = {}
+
+
+def get_mirror_dir():
+    """
+    Returns the directory holding the mirror, or None if the mirror is
+    disabled in the `[mirror]` configuration section.
+    """
+    if not get_config_bool("mirror", "enabled", True):
+        return None
+
+    return get_config_value("mirror", "mirror_dir",
+                            os.path.join(tempfile.gettempdir(), "flamingo", "mirror"))
+
+
+def get_manifest_path(mirror_dir, collection):
+    return os.path.join(mirror_dir, collection, MANIFEST_NAME)
+
+
+def get_mirror_chunks(dims, shape, tile_size):
+    """
+    Returns the chunk shape of a gridded variable in the mirror: all the
+    time steps of a tile of `tile_size` x `tile_size` cells of the grid.
+    """
+    chunks = list(shape)
+
+    for axis in (-2, -1):
+        chunks[axis] = min(tile_size, shape[axis])
+
+    return [max(size, 1) for size in chunks]
+
+
+def rechunk_file(source_path, target_path, tile_size=32, complevel=1, memory_limit=512 * 1024 ** 2):
+    """
+    Copies the NetCDF file at `source_path` to `target_path` (NetCDF4), with
+    the gridded variables chunked along time (see `get_mirror_chunks`) and
+    compressed with zlib at `complevel`. The variables are copied in bands
+    of the grid of at most `memory_limit` bytes.
+    """
+    import netCDF4
+
+    with netCDF4.Dataset(source_path) as source, netCDF4.Dataset(target_path, "w", format="NETCDF4") as target:
+        target.setncatts({name: source.getncattr(name) for name in source.ncattrs()})
+
+        for name, dim in source.dimensions.items():
+            target.createDimension(name, None if dim.isunlimited() else len(dim))
+
+        for name, var in source.variables.items():
+            var.set_auto_maskandscale(False)
+            gridded = is_gridded(var.dimensions)
+
+            options = {}
+            if gridded:
+                options = {
+                    "chunksizes": get_mirror_chunks(var.dimensions, var.shape, tile_size),
+                    "zlib": complevel > 0,
+                    "complevel": complevel,
+                    "shuffle": True,
+                }
+
+            fill_value = var.getncattr("_FillValue") if "_FillValue" in var.ncattrs() else None
+            copy = target.createVariable(name, var.datatype, var.dimensions, fill_value=fill_value, **options)
+            copy.setncatts({attr: var.getncattr(attr) for attr in var.ncattrs() if attr != "_FillValue"})
+            copy.set_auto_maskandscale(False)
+
+            if not var.dimensions:
+                copy.assignValue(var.getValue())
+                continue
+
+            if not gridded or var.size * var.dtype.itemsize <= memory_limit:
+                copy[tuple(slice(0, size) for size in var.shape)] = var[:]
+                continue
+
+            # Bands of whole tiles of the grid
+            n_rows = var.shape[-2]
+            row_bytes = var.size // n_rows * var.dtype.itemsize
+            band = max(memory_limit // row_bytes // tile_size, 1) * tile_size
+
+            for start in range(0, n_rows, band):
+                index = [slice(0, size) for size in var.shape]
+                index[-2] = slice(start, min(start + band, n_rows))
+                copy[tuple(index)] = var[tuple(index)]
+
+
+def _write_mirror_file(source_path, mirror_path, tile_size, complevel, memory_limit):
+    "Writes the mirror copy of an archive file and returns its manifest entry."
+    # Compressed archive files are read from their decompressed copies
+    with pin_decompressed_files():
+        read_path = decompress_files([source_path])[0]
+
+        # Write to a temporary file and rename so readers never see a partial copy
+        tmp_path = f"{mirror_path}.{os.getpid()}.tmp"
+        try:
+            rechunk_file(read_path, tmp_path, tile_size, complevel, memory_limit)
+            os.replace(tmp_path, mirror_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        stat = os.stat(source_path)
+        source = dict(build_file_record(read_path), path=source_path, size=stat.st_size, mtime=stat.st_mtime)
+
+    return {"source": source, "mirror": build_file_record(mirror_path)}
+
+
+def build_mirror(collection, mirror_dir=None):
+    """
+    Builds, or brings up to date, the mirror of `collection`: files that
+    are new or have changed in the archive are copied, and the copies of
+    files that have gone are removed. Returns the manifest path.
+    """
+    mirror_dir = mirror_dir or get_mirror_dir()
+    collection_dir = os.path.join(mirror_dir, collection)
+    os.makedirs(collection_dir, exist_ok=True)
+
+    tile_size = get_config_int("mirror", "tile_size", 32)
+    complevel = get_config_int("mirror", "complevel", 1)
+    memory_limit = get_config_size("mirror", "memory_limit", "512mb")
+
+    file_paths = get_collection_files(collection)
+    if not file_paths:
+        raise ValueError(f"No files found for collection: {collection}")
+
+    manifest_path = get_manifest_path(mirror_dir, collection)
+    previous = load_mirror_manifest(collection, mirror_dir) or {"files": []}
+    entries = {entry["source"]["path"]: entry for entry in previous["files"]
+               if previous.get("tile_size") == tile_size}
+
+    files = []
+    for source_path in file_paths:
+        mirror_path = os.path.join(collection_dir, os.path.basename(source_path).replace(".nc.gz", ".nc"))
+        entry = entries.get(source_path)
+
+        if entry and entry["mirror"]["path"] == mirror_path and not record_changed(entry["source"]) \
+                and not record_changed(entry["mirror"]):
+            files.append(entry)
+            continue
+
+        LOGGER.info(f"Mirroring {source_path}")
+        files.append(_write_mirror_file(source_path, mirror_path, tile_size, complevel, memory_limit))
+
+    # Remove the copies of files that are no longer in the archive
+    mirror_paths = {entry["mirror"]["path"] for entry in files}
+    for file_name in os.listdir(collection_dir):
+        path = os.path.join(collection_dir, file_name)
+        if file_name != MANIFEST_NAME and path not in mirror_paths:
+            LOGGER.info(f"Removing {path} from the mirror")
+            os.remove(path)
+
+    manifest = {
+        "collection": collection,
+        "created": time.time(),
+        "tile_size": tile_size,
+        "files": files,
+    }
+
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as writer:
+        json.dump(manifest, writer)
+
+    os.replace(tmp_path, manifest_path)
+    return manifest_path
+
+
+def build_mirrors(collections, mirror_dir=None):
+    """
+    Builds or updates the mirror of each collection in `collections`.
+    Collections that cannot be mirrored are logged and skipped.
+
+    Returns a list of the manifest paths written.
+    """
+    manifest_paths = []
+
+    for collection in collections:
+        try:
+            manifest_paths.append(build_mirror(collection, mirror_dir))
+        except Exception as exc:
+            LOGGER.warning(f"Could not mirror collection {collection}: {exc}")
+
+    return manifest_paths
+
+
+def load_mirror_manifest(collection, mirror_dir=None):
+    """
+    Returns the mirror manifest of `collection`, or None if it has no
+    mirror. Manifests are held in memory until the document on disk changes.
+    """
+    mirror_dir = mirror_dir or get_mirror_dir()
+    if not mirror_dir:
+        return None
+
+    manifest_path = get_manifest_path(mirror_dir, collection)
+
+    try:
+        mtime = os.path.getmtime(manifest_path)
+    except OSError:
+        return None
+
+    cached = _loaded.get(manifest_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with open(manifest_path) as reader:
+        manifest = json.load(reader)
+
+    _loaded[manifest_path] = (mtime, manifest)
+    return manifest
+
+
+def estimate_chunk_bytes(record, time=None, area=None):
+    """
+    Returns the number of bytes of the chunks of gridded variables read
+    (and decompressed) from the file of an index `record` to subset it by
+    time and area. Contiguous variables read only the selected values.
+    """
+    read_bytes = 0
+
+    for var in record["variables"].values():
+        dims = var["dims"]
+        if not is_gridded(dims):
+            continue
+
+        selected = get_selected_shape(record, dims, time, area)
+        n_bytes = get_itemsize(var["dtype"])
+
+        if not var["chunks"]:
+            for n_selected in selected:
+                n_bytes *= n_selected
+
+            read_bytes += n_bytes
+            continue
+
+        for size, n_selected, chunk in zip([record["shape"][dim] for dim in dims], selected, var["chunks"]):
+            # Chunks touched by a selection that is not aligned with them
+            n_chunks = min(-(-(n_selected - 1) // chunk) + 1, -(-size // chunk)) if n_selected else 0
+            n_bytes *= min(n_chunks * chunk, size)
+
+        read_bytes += n_bytes
+
+    return read_bytes
+
+
+def select_mirror_files(collection, time=None, area=None, mirror_dir=None):
+    """
+    Returns the paths of the mirror files to subset `collection` by time
+    and area, or None if the archive files should be used: there is no
+    (up-to-date) mirror, or it would not read less.
+    """
+    manifest = load_mirror_manifest(collection, mirror_dir)
+    if manifest is None:
+        return None
+
+    entries = [entry for entry in manifest["files"] if filter_records([entry["source"]], time, area)]
+    if not entries:
+        return None
+
+    if any(record_changed(entry["source"]) or record_changed(entry["mirror"]) for entry in entries):
+        LOGGER.warning(f"Mirror of {collection} is out of date: please rebuild it.")
+        return None
+
+    archive_bytes = sum(estimate_chunk_bytes(entry["source"], time, area) for entry in entries)
+    mirror_bytes = sum(estimate_chunk_bytes(entry["mirror"], time, area) for entry in entries)
+    use_mirror = mirror_bytes < archive_bytes
+
+    LOGGER.info(f"Subsetting {collection} from the {'mirror' if use_mirror else 'archive'}: "
+                f"{mirror_bytes} bytes of chunks to read from the mirror, {archive_bytes} from the archive")
+
+    return [entry["mirror"]["path"] for entry in entries] if use_mirror else None
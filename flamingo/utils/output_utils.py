@@ -7,39 +7,293 @@ outputs.
 """
 
 import os
+import shutil
+from collections import OrderedDict
 
-from nappy.nc_interface.xarray_to_na import XarrayDatasetToNA
 
+class DatasetResults:
+    """
+    Holds Datasets in the structure of the results returned by
+    `clisops.subset()`: lists of Datasets keyed on a name.
+    """
+
+    def __init__(self, datasets=None, name="batch"):
+        self._results = OrderedDict()
+
+        if datasets is not None:
+            self.add(name, datasets)
+
+    def add(self, name, datasets):
+        "Adds the list of `datasets` under `name`."
+        self._results.setdefault(name, []).extend(datasets)
+
+
+def concat_time_slices(datasets):
+    """
+    Joins the Datasets of one collection along time. `clisops.subset()`
+    splits a subset larger than its file size limit into time slices, even
+    for xarray outputs. Variables without a time dimension are taken from
+    the first Dataset.
+    """
+    import xarray as xr
+
+    if len(datasets) == 1:
+        return datasets[0]
+
+    return xr.concat(datasets, "time", data_vars="minimal", coords="minimal", compat="override")
+
+
+def merge_datasets(results):
+    """
+    Takes a `results` object holding the Datasets of several collections
+    (e.g. one per variable) on the same grid and merges them into a single
+    Dataset. The Datasets of each collection are first joined along time.
+    Variables found in more than one collection (such as bounds and grid
+    mappings) are taken from the first of them.
 
-def write_to_csvs(results, output_dir):
+    Params:
+    :results [object]: object returned from `clisops.subset()` or a `DatasetResults`
+
+    Returns:
+    :results [DatasetResults]: results holding the merged Dataset
+    """
+    import xarray as xr
+
+    datasets = [concat_time_slices(result_list) for result_list in results._results.values() if result_list]
+
+    merged = xr.merge(datasets, compat="override", join="outer", combine_attrs="drop_conflicts")
+    return DatasetResults([merged], name="merged")
+
+
+def write_to_csvs(results, output_dir, workers=1, slab_size=None, start_method=None, on_output=None):
     """
     Takes a `results` objects returned by the `clisops.subset()` function.
-    It finds all the Xarray Datasets in the results and writes them to CSV 
-    files using `nappy`. 
+    It finds all the Xarray Datasets in the results and writes them to 
+    NASA Ames CSV files, streaming the data in blocks.
     The number of CSV files depends on the structure of the input
-    Datasets. `nappy` will examine the structure and work out which files
-    to write.
+    Datasets: one file is written per group of variables that share
+    the same dimensions. With several `workers`, the data is converted
+    by a pool of processes, in slabs of `slab_size` values; the files
+    and their order are unchanged.
 
     Params:
     :results [object]: object returned from `clisops.subset()`
     :output_dir [str]: output directory to write CSV files to
+    :workers [int]: number of processes converting the data
+    :slab_size [int]: number of values converted by a process at a time (or None for the default)
+    :start_method [str]: how the processes are started (or None for the default of the platform)
+    :on_output [callable]: called with the output file paths of each Dataset as soon as they are written
 
     Returns:
     :output_file_paths [list]: a list of output file paths
     """
-    output_file_paths = []
+    from flamingo.utils.csv_utils import SLAB_SIZE, write_datasets_to_csvs
+
+    datasets = []
+    output_files = []
     i = 1
 
     for result_list in results._results.values():
         
         for ds in result_list:
-            xr_to_na = XarrayDatasetToNA(ds)
-            xr_to_na.convert()
+            datasets.append(ds)
+            output_files.append(os.path.join(output_dir, f"output_{i:02d}.csv"))
+
+            i += 1
+
+    output_paths = write_datasets_to_csvs(datasets, output_files, float_format="%g", workers=workers,
+                                          slab_size=slab_size or SLAB_SIZE, start_method=start_method,
+                                          on_output=on_output)
+
+    return [path for paths in output_paths for path in paths]
+
+
+def write_to_tables(results, output_dir, fmt="parquet", compression="zstd", on_output=None):
+    """
+    Takes a `results` objects returned by the `clisops.subset()` function.
+    It finds all the Xarray Datasets in the results and writes each of them
+    to a columnar table: a Parquet or Arrow IPC (Feather v2) file.
+
+    Params:
+    :results [object]: object returned from `clisops.subset()`
+    :output_dir [str]: output directory to write the files to
+    :fmt [str]: "parquet" or "feather"
+    :compression [str]: compression codec (or "none")
+    :on_output [callable]: called with the output file paths of each Dataset as soon as they are written
+
+    Returns:
+    :output_file_paths [list]: a list of output file paths
+    """
+    from flamingo.utils.table_utils import TABLE_FORMATS, write_dataset_to_table
+
+    output_file_paths = []
+    i = 1
+
+    for result_list in results._results.values():
+
+        for ds in result_list:
+            output_file = os.path.join(output_dir, f"output_{i:02d}{TABLE_FORMATS[fmt]}")
+            output_path = write_dataset_to_table(ds, output_file, fmt=fmt, compression=compression)
+
+            if output_path:
+                output_file_paths.append(output_path)
+
+            if on_output:
+                on_output([output_path] if output_path else [])
+
+            i += 1
+
+    return output_file_paths
+
+
+def write_to_netcdfs(results, output_dir, profile, on_output=None):
+    """
+    Takes a `results` objects returned by the `clisops.subset()` function.
+    It finds all the Xarray Datasets in the results and writes them to
+    NetCDF files with the compression, chunking and packing set in an
+    encoding `profile` (see `flamingo.utils.encoding_utils`). The data of
+    all the files is computed together, so that the reads of several
+    Datasets share the dask scheduler, unless `on_output` is given: then
+    the files are computed one at a time, and each is reported as soon as
+    it is written.
+
+    Params:
+    :results [object]: object returned from `clisops.subset()`
+    :output_dir [str]: output directory to write NetCDF files to
+    :profile [dict]: NetCDF encoding profile (or None to write without one)
+    :on_output [callable]: called with the output file paths of each Dataset as soon as they are written
+
+    Returns:
+    :output_file_paths [list]: a list of output file paths
+    """
+    import dask
+
+    from flamingo.utils.encoding_utils import get_netcdf_encoding
+
+    output_file_paths = []
+    writes = []
+    i = 1
+
+    for result_list in results._results.values():
+
+        for ds in result_list:
+            # Drop the encodings of the input files
+            ds = ds.copy()
+            for var in ds.variables.values():
+                for key in NETCDF_ENCODINGS:
+                    var.encoding.pop(key, None)
+
+            # Named as by the "simple" file namer of clisops
+            output_file = os.path.join(output_dir, f"output_{i:03d}.nc")
+            encoding = get_netcdf_encoding(ds, profile) if profile else None
+            writes.append(ds.to_netcdf(output_file, engine="netcdf4", encoding=encoding, compute=False))
+            output_file_paths.append(output_file)
+
+            i += 1
+
+    if on_output is None:
+        dask.compute(*writes)
+        return output_file_paths
+
+    for write, output_file in zip(writes, output_file_paths):
+        dask.compute(write)
+        on_output([output_file])
+
+    return output_file_paths
+
+
+# Encoding settings that are specific to the NetCDF files read by the subset
+NETCDF_ENCODINGS = ("chunks", "chunksizes", "zlib", "complevel", "shuffle", "fletcher32",
+                    "contiguous", "compression", "source", "original_shape", "preferred_chunks")
+
+
+def parse_chunks(items):
+    """
+    Returns a dictionary of chunk sizes from a list of "dim:size" strings,
+    e.g. ["time:12", "lat:256"].
+    """
+    chunks = {}
+
+    for item in items:
+        dim, _, size = item.partition(":")
+        chunks[dim.strip()] = int(size)
+
+    return chunks
+
+
+def get_zarr_compressor(name="lz4", level=5):
+    """
+    Returns the `numcodecs` Blosc compressor named `name` (e.g. "zstd",
+    "lz4" or "zlib"), or None if `name` is "none".
+    """
+    if name.lower() == "none":
+        return None
+
+    from numcodecs import Blosc
+    return Blosc(cname=name.lower(), clevel=level, shuffle=Blosc.SHUFFLE)
+
+
+def _prepare_for_zarr(ds, chunks, compressor):
+    # Chunk every variable uniformly (dimensions without a configured size
+    # are not split) and drop the NetCDF encodings of the input files
+    ds = ds.chunk({dim: chunks.get(dim, -1) for dim in ds.dims})
+
+    for var in ds.variables.values():
+        for key in NETCDF_ENCODINGS:
+            var.encoding.pop(key, None)
+
+    encoding = {name: {"compressor": compressor} for name in ds.data_vars}
+    return ds, encoding
+
+
+def write_to_zarrs(results, output_dir, chunks=None, compressor=None, layout="zip", on_output=None):
+    """
+    Takes a `results` objects returned by the `clisops.subset()` function.
+    It finds all the Xarray Datasets in the results and writes them to
+    Zarr stores. The chunks are computed and compressed in parallel by
+    the active dask scheduler.
+
+    Params:
+    :results [object]: object returned from `clisops.subset()`
+    :output_dir [str]: output directory to write Zarr stores to
+    :chunks [dict]: chunk size of each dimension (others are not split)
+    :compressor [object]: `numcodecs` compressor (None for no compression)
+    :layout [str]: "zip" for zipped stores or "directory" for directory stores
+    :on_output [callable]: called with the output store paths of each Dataset as soon as they are written
+
+    Returns:
+    :output_paths [list]: a list of output store paths
+    """
+    import zarr
+
+    if layout not in ("zip", "directory"):
+        raise ValueError(f"Unknown Zarr layout: {layout}")
+
+    output_paths = []
+    i = 1
+
+    for result_list in results._results.values():
+
+        for ds in result_list:
+            ds, encoding = _prepare_for_zarr(ds, chunks or {}, compressor)
+            output_path = os.path.join(output_dir, f"output_{i:02d}.zarr")
+
+            if layout == "zip":
+                output_path += ".zip"
+                store = zarr.ZipStore(output_path, mode="w")
+            else:
+                shutil.rmtree(output_path, ignore_errors=True)
+                store = zarr.DirectoryStore(output_path)
+
+            try:
+                ds.to_zarr(store, mode="w", encoding=encoding, consolidated=True)
+            finally:
+                store.close()
 
-            output_file = os.path.join(output_dir, f"output_{i:02d}.csv")
-            xr_to_na.writeNAFiles(output_file, delimiter=",", float_format="%g")
-            output_file_paths.extend(xr_to_na.output_files_written)
+            output_paths.append(output_path)
+            if on_output:
+                on_output([output_path])
 
             i += 1
 
-    return output_file_paths
\ No newline at end of file
+    return output_paths
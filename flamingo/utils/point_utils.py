@@ -0,0 +1,322 @@
+"""
+point_utils.py
+==============
+
+Fast extraction of time series at one or more points (latitude/longitude
+pairs) of a gridded collection.
+
+The nearest grid cell of each point is found once per grid (from the first
+file of the collection, and cached in memory) and only the values of those
+cells are read from each file, with netCDF4, instead of subsetting and
+writing a dataset. Grids with 1D latitude and longitude (e.g. CRU TS) and
+with 2D latitude and longitude over projected coordinates (e.g. HadUK-Grid)
+are supported.
+
+The series are written as a CSV table (one row per point and time step) or
+as a JSON document.
+"""
+
+import csv
+import json
+import math
+import os
+from collections import OrderedDict
+
+from flamingo.utils.index_utils import LATITUDE_NAMES, LONGITUDE_NAMES, _pad_time
+
+import logging
+LOGGER = logging.getLogger("PYWPS")
+
+
+POINT_FORMATS = {
+    "csv": ".csv",
+    "json": ".json",
+}
+
+CSV_COLUMNS = ["point", "latitude", "longitude", "grid_latitude", "grid_longitude", "time"]
+
+# Stride of the coarse sample of 2D grids searched first for the nearest cell
+COARSE_SEARCH_STEP = 16
+
+# Number of grids (latitude/longitude arrays) held in memory
+GRID_CACHE_SIZE = 8
+
+_grids = OrderedDict()
+
+
+def parse_point(value):
+    """
+    Returns a (latitude, longitude) tuple from a "latitude,longitude" string.
+    Raises ValueError if the point is not valid.
+    """
+    try:
+        lat, lon = [float(item) for item in str(value).split(",")]
+    except ValueError:
+        raise ValueError(f'Invalid location "{value}": expected "latitude,longitude"')
+
+    if not -90 <= lat <= 90 or not -360 <= lon <= 360:
+        raise ValueError(f'Invalid location "{value}": latitude or longitude out of range')
+
+    return lat, lon
+
+
+def get_points_bbox(points):
+    "Returns the bounding box [min_lon, min_lat, max_lon, max_lat] of a list of points."
+    lats = [lat for lat, _ in points]
+    lons = [lon for _, lon in points]
+    return [min(lons), min(lats), max(lons), max(lats)]
+
+
+def _find_coord_var(nc, names, standard_name):
+    for name, var in nc.variables.items():
+        if getattr(var, "standard_name", None) == standard_name or name in names:
+            return var
+
+    return None
+
+
+def get_grid(file_path):
+    """
+    Returns the grid of a NetCDF file as a dictionary holding the latitude
+    and longitude arrays ("lat", "lon") and the names of the dimensions
+    they span ("dims": (y, x)). Grids are cached in memory, keyed on the
+    file path and modification time.
+    """
+    import netCDF4
+    import numpy as np
+
+    key = (file_path, os.stat(file_path).st_mtime)
+
+    if key in _grids:
+        _grids.move_to_end(key)
+        return _grids[key]
+
+    with netCDF4.Dataset(file_path) as nc:
+        lat = _find_coord_var(nc, LATITUDE_NAMES, "latitude")
+        lon = _find_coord_var(nc, LONGITUDE_NAMES, "longitude")
+
+        if lat is None or lon is None:
+            raise ValueError(f"No latitude/longitude coordinates were found in {file_path}")
+
+        if lat.ndim == 1:
+            dims = (lat.dimensions[0], lon.dimensions[0])
+        else:
+            dims = tuple(lat.dimensions)
+
+        grid = {
+            "lat": np.asarray(lat[:], dtype="float64"),
+            "lon": np.asarray(lon[:], dtype="float64"),
+            "dims": dims,
+        }
+
+    _grids[key] = grid
+    if len(_grids) > GRID_CACHE_SIZE:
+        _grids.popitem(last=False)
+
+    return grid
+
+
+def _wrap(lon):
+    "Wraps longitude differences into [-180, 180)."
+    return (lon + 180) % 360 - 180
+
+
+def find_nearest(grid, lat, lon):
+    """
+    Returns the (y, x) indices of the grid cell nearest to a point, or None
+    if the point is further than one grid cell from the grid.
+    """
+    import numpy as np
+
+    if grid["lat"].ndim == 1:
+        lats, lons = grid["lat"], grid["lon"]
+        iy = int(np.abs(lats - lat).argmin())
+        ix = int(np.abs(_wrap(lons - lon)).argmin())
+
+        step_y = abs(float(lats[1] - lats[0])) if lats.size > 1 else 0
+        step_x = abs(float(lons[1] - lons[0])) if lons.size > 1 else 0
+
+        if abs(lats[iy] - lat) > step_y or abs(_wrap(lons[ix] - lon)) > step_x:
+            return None
+
+        return iy, ix
+
+    # 2D coordinates: distances on a local equirectangular projection,
+    # searched on a coarse sample of the grid and then around its nearest cell
+    lats, lons = grid["lat"], grid["lon"]
+    scale = math.cos(math.radians(lat))
+
+    def nearest_in(y_slice, x_slice):
+        distance = (lats[y_slice, x_slice] - lat) ** 2 + (_wrap(lons[y_slice, x_slice] - lon) * scale) ** 2
+        iy, ix = np.unravel_index(np.nanargmin(distance), distance.shape)
+        return (y_slice.start or 0) + iy * (y_slice.step or 1), (x_slice.start or 0) + ix * (x_slice.step or 1)
+
+    step = COARSE_SEARCH_STEP
+    cy, cx = nearest_in(slice(None, None, step), slice(None, None, step))
+    iy, ix = [int(index) for index in nearest_in(slice(max(cy - 2 * step, 0), cy + 2 * step + 1),
+                                                 slice(max(cx - 2 * step, 0), cx + 2 * step + 1))]
+    nearest = (lats[iy, ix] - lat) ** 2 + (_wrap(lons[iy, ix] - lon) * scale) ** 2
+
+    # Compare with the spacing of the grid at the nearest cell
+    ny, nx = lats.shape
+    jy, jx = (iy + 1 if iy + 1 < ny else iy - 1), (ix + 1 if ix + 1 < nx else ix - 1)
+    spacing = max((lats[jy, ix] - lats[iy, ix]) ** 2 + (_wrap(lons[jy, ix] - lons[iy, ix]) * scale) ** 2,
+                  (lats[iy, jx] - lats[iy, ix]) ** 2 + (_wrap(lons[iy, jx] - lons[iy, ix]) * scale) ** 2)
+
+    if nearest > spacing:
+        return None
+
+    return iy, ix
+
+
+def get_point_indices(grid, points):
+    """
+    Returns a list of the nearest grid indices of each point (see `find_nearest`).
+    Raises ValueError if a point is outside the grid.
+    """
+    indices = []
+
+    for lat, lon in points:
+        nearest = find_nearest(grid, lat, lon)
+        if nearest is None:
+            raise ValueError(f"Location {lat},{lon} is outside the area of the dataset")
+
+        indices.append(nearest)
+
+    return indices
+
+
+def _format_time(value):
+    return value.strftime("%Y-%m-%dT%H:%M:%S")
+
+
+def _get_time_range(nc, start=None, end=None):
+    """
+    Returns the formatted times of a file and the slice of time steps that
+    fall between `start` and `end`. Partial times (e.g. "1951" or
+    "1951-12-16") are extended to the start (or end) of their period.
+    """
+    import cftime
+
+    start = _pad_time(start, upper=False) if start else None
+    end = _pad_time(end, upper=True) if end else None
+
+    time = nc.variables["time"]
+    dates = cftime.num2date(time[:], time.units, getattr(time, "calendar", "standard"),
+                            only_use_cftime_datetimes=True)
+    times = [_format_time(date) for date in dates]
+
+    selected = [i for i, value in enumerate(times)
+                if (start is None or value >= start) and (end is None or value <= end)]
+
+    if not selected:
+        return [], slice(0, 0)
+
+    return times[selected[0]:selected[-1] + 1], slice(selected[0], selected[-1] + 1)
+
+
+def read_point_series(file_paths, variable, points, start=None, end=None):
+    """
+    Reads the time series of `variable` at the grid cells nearest to
+    `points` from each file in `file_paths`.
+
+    Params:
+    :file_paths [list]: NetCDF files, in time order, sharing the same grid
+    :variable [str]: name of the variable to read
+    :points [list]: (latitude, longitude) tuples
+    :start [str]: first time (e.g. "YYYY-MM-DDTHH:MM:SS" or "YYYY") to read, or None
+    :end [str]: last time (e.g. "YYYY-MM-DDTHH:MM:SS" or "YYYY") to read, or None
+
+    Returns:
+    :series [dict]: the variable name, its attributes and, for each point,
+        the requested and grid coordinates, times and values (None for
+        missing values)
+    """
+    import netCDF4
+    import numpy as np
+
+    grid = get_grid(file_paths[0])
+    indices = get_point_indices(grid, points)
+
+    series = {
+        "variable": variable,
+        "attributes": {},
+        "points": [
+            {
+                "latitude": lat,
+                "longitude": lon,
+                "grid_latitude": float(grid["lat"][iy] if grid["lat"].ndim == 1 else grid["lat"][iy, ix]),
+                "grid_longitude": float(grid["lon"][ix] if grid["lon"].ndim == 1 else grid["lon"][iy, ix]),
+                "time": [],
+                "values": [],
+            }
+            for (lat, lon), (iy, ix) in zip(points, indices)
+        ],
+    }
+
+    for file_path in file_paths:
+        with netCDF4.Dataset(file_path) as nc:
+            if variable not in nc.variables:
+                raise ValueError(f"Variable {variable} was not found in {file_path}")
+
+            var = nc.variables[variable]
+            if not series["attributes"]:
+                series["attributes"] = {key: str(var.getncattr(key)) for key in ("units", "long_name")
+                                        if key in var.ncattrs()}
+
+            times, time_slice = _get_time_range(nc, start, end)
+            if not times:
+                continue
+
+            y_dim, x_dim = grid["dims"]
+
+            for point, (iy, ix) in zip(series["points"], indices):
+                index = tuple(time_slice if dim == "time" else iy if dim == y_dim else ix if dim == x_dim else 0
+                              for dim in var.dimensions)
+                values = np.ma.masked_invalid(np.ma.atleast_1d(var[index]).astype("float64"))
+
+                point["time"].extend(times)
+                point["values"].extend(None if masked else float(value)
+                                       for value, masked in zip(values.data, np.ma.getmaskarray(values)))
+
+    return series
+
+
+def write_series_to_csv(series, output_file):
+    "Writes the point time series returned by `read_point_series` to a CSV file."
+    variable = series["variable"]
+
+    with open(output_file, "w", newline="") as writer:
+        csv_writer = csv.writer(writer)
+        csv_writer.writerow(CSV_COLUMNS + [variable])
+
+        for i, point in enumerate(series["points"]):
+            coords = [i + 1, point["latitude"], point["longitude"],
+                      f"{point['grid_latitude']:g}", f"{point['grid_longitude']:g}"]
+
+            for time, value in zip(point["time"], point["values"]):
+                csv_writer.writerow(coords + [time, "" if value is None else f"{value:g}"])
+
+    return output_file
+
+
+def write_series_to_json(series, output_file):
+    "Writes the point time series returned by `read_point_series` to a JSON file."
+    with open(output_file, "w") as writer:
+        json.dump(series, writer)
+
+    return output_file
+
+
+def write_point_series(series, output_dir, fmt="csv"):
+    """
+    Writes point time series to `output_dir` in format `fmt` ("csv" or
+    "json"). Returns the list of output file paths.
+    """
+    if fmt not in POINT_FORMATS:
+        raise ValueError(f"Unknown point output format: {fmt}")
+
+    output_file = os.path.join(output_dir, f"output_01{POINT_FORMATS[fmt]}")
+    writer = write_series_to_csv if fmt == "csv" else write_series_to_json
+
+    return [writer(series, output_file)]
@@ -0,0 +1,173 @@
+"""
+progress_utils.py
+=================
+
+Progress reporting and incremental outputs for long jobs.
+
+Each output of a job is published to the PyWPS output directory of the
+request as soon as it is written, and listed in a partial Metalink document
+(`partial.meta4`) published next to it, so that clients can start
+downloading the first outputs while the job is still running. The status
+of the job reports the number of outputs written, their size and the URL
+of the partial Metalink. The final Metalink of the job refers to the
+published copies of the outputs (see `metalink_utils.build_metalink`), so
+they are not copied again.
+
+While an output is computed, the status also reports the fraction of the
+dask tasks of the computation that have finished (see `TaskProgress`).
+
+Settings are read from the `[progress]` configuration section.
+"""
+
+import os
+import threading
+import time
+
+from flamingo.utils.admission_utils import format_size
+from flamingo.utils.config_utils import get_config_bool, get_config_float
+from flamingo.utils.metalink_utils import get_publish_dir, get_publish_url, publish_file
+
+import logging
+LOGGER = logging.getLogger("PYWPS")
+
+
+PARTIAL_METALINK = "partial.meta4"
+
+
+def partial_outputs_enabled():
+    return get_config_bool("progress", "partial_outputs", True)
+
+
+class OutputProgress:
+    """
+    Publishes the outputs of a job as they are written and reports them in
+    the status of the job, moving from `start` to `end` percent as the
+    expected outputs are written.
+
+    Params:
+    :request_uuid [str]: the UUID of the request, naming its output directory
+    :progress [callable]: reports the status, as `progress(message, percentage)`
+    :n_outputs [int]: the number of outputs expected (e.g. the Datasets to write)
+    :file_type [str]: the output type, as in `build_metalink`
+    :identity [str]: the identity of the partial Metalink
+    """
+
+    def __init__(self, request_uuid, progress, n_outputs, file_type, identity="partial-results",
+                 start=70, end=90):
+        self.request_uuid = str(request_uuid)
+        self.progress = progress
+        self.n_outputs = max(n_outputs, 1)
+        self.file_type = file_type
+        self.identity = identity
+        self.start = start
+        self.end = end
+
+        self.n_written = 0
+        self.n_bytes = 0
+        self.urls = []
+        self.message = "Writing outputs"
+
+        interval = get_config_float("progress", "interval", 5)
+        self.task_progress = TaskProgress(self._report_tasks, interval)
+
+    @property
+    def metalink_url(self):
+        return get_publish_url(self.request_uuid, PARTIAL_METALINK)
+
+    def get_percentage(self, fraction=0.0):
+        "Returns the percentage of the job done, with `fraction` of the next output computed."
+        done = min((self.n_written + fraction) / self.n_outputs, 1.0)
+        return int(self.start + (self.end - self.start) * done)
+
+    def add(self, output_paths):
+        """
+        Publishes the output files of one of the expected outputs (a Dataset)
+        and reports them. Directories are not published until the job ends.
+        """
+        for output_path in output_paths:
+            if os.path.isdir(output_path):
+                continue
+
+            url = publish_file(output_path, self.request_uuid)
+            self.urls.append((url, os.path.getsize(output_path)))
+            self.n_bytes += os.path.getsize(output_path)
+
+        self.n_written += 1
+
+        if self.urls:
+            self._write_metalink()
+            self.message = (f"Wrote {self.n_written} of {self.n_outputs} outputs, "
+                            f"{format_size(self.n_bytes)}: partial results at {self.metalink_url}")
+        else:
+            self.message = f"Wrote {self.n_written} of {self.n_outputs} outputs"
+
+        self.progress(self.message, self.get_percentage())
+
+    def _report_tasks(self, fraction):
+        self.progress(f"{self.message}. Computing output {min(self.n_written + 1, self.n_outputs)}: "
+                      f"{fraction:.0%} done", self.get_percentage(fraction))
+
+    def _write_metalink(self):
+        "Writes the partial Metalink, listing the outputs published so far."
+        from pywps.inout.outputs import MetaFile, MetaLink4
+
+        from flamingo.utils.metalink_utils import file_type_map
+
+        ml4 = MetaLink4(self.identity, "Output files written so far.")
+        file_desc = f"{self.file_type.upper()} file"
+
+        for url, size in self.urls:
+            mf = MetaFile(file_desc, file_desc, fmt=file_type_map.get(self.file_type, self.file_type))
+            mf.url = url
+            mf.size = size
+            ml4.append(mf)
+
+        # Write to a temporary file and rename so clients never read a partial document
+        metalink_path = os.path.join(get_publish_dir(self.request_uuid), PARTIAL_METALINK)
+        tmp_path = f"{metalink_path}.{os.getpid()}.tmp"
+
+        with open(tmp_path, "w") as writer:
+            writer.write(ml4.xml)
+
+        os.replace(tmp_path, metalink_path)
+
+
+class TaskProgress:
+    """
+    A dask callback reporting the fraction of the tasks of each computation
+    that have finished, at most every `interval` seconds, by calling
+    `report(fraction)`. Used as a context manager around the computations:
+    only those run from the same thread (i.e. the same job) are reported.
+    """
+
+    def __init__(self, report, interval=5):
+        self.report = report
+        self.interval = interval
+        self._thread = None
+        self._callback = None
+        self._last = 0
+
+    def __enter__(self):
+        from dask.callbacks import Callback
+
+        self._thread = threading.get_ident()
+        self._last = time.time()
+        self._callback = Callback(posttask=self._posttask)
+        self._callback.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        self._callback.__exit__(*args)
+
+    def _posttask(self, key, result, dsk, state, worker_id):
+        if threading.get_ident() != self._thread or time.time() - self._last < self.interval:
+            return
+
+        self._last = time.time()
+        n_done = len(state["finished"])
+        n_tasks = n_done + sum(len(state[name]) for name in ("ready", "waiting", "running"))
+
+        try:
+            self.report(n_done / n_tasks if n_tasks else 1.0)
+        except Exception as exc:
+            LOGGER.warning(f"Could not report the progress of the job: {exc}")
@@ -1,10 +1,10 @@
-from ..provenance import Provenance
-
 import logging
 LOGGER = logging.getLogger("PYWPS")
 
 
 def populate_response(response, label, workdir, inputs, collection, ml4):
+    from ..provenance import Provenance
+
     response.outputs["output"].data = ml4.xml
 
     # Create a tidied copy of the inputs
@@ -13,7 +13,7 @@ def populate_response(response, label, workdir, inputs, collection, ml4):
     for key, value in inputs.items():
         inputs_copy[key] = getattr(value, "value", value)
 
-    # Collect provenance
+    # Collect provenance of every output file
     provenance = Provenance(workdir)
     provenance.start()
     urls = []
@@ -26,5 +26,9 @@ def populate_response(response, label, workdir, inputs, collection, ml4):
 
     provenance.add_operator(label, inputs_copy, collection, urls)
     response.outputs["prov"].file = provenance.write_json()
-    LOGGER.warning("Commented out: response.outputs[\"prov_plot\"].file = provenance.write_png()")
-#    response.outputs["prov_plot"].file = provenance.write_png()
+
+    # The diagram is rendered in the background, after the response is returned
+    from .diagram_utils import diagrams_available, publish_diagram
+
+    if diagrams_available():
+        publish_diagram(provenance, response.outputs["prov_plot"], response.uuid)
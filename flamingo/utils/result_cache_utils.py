@@ -0,0 +1,130 @@
+"""
+result_cache_utils.py
+=====================
+
+A cache of subset results keyed on the normalised request, so that
+repeated requests re-publish existing output files instead of running
+the subset again.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+
+from flamingo import __version__ as flamingo_version
+from flamingo.utils.cache_utils import DiskCache, make_key
+from flamingo.utils.config_utils import (
+    get_config_bool, get_config_int, get_config_size, get_config_value
+)
+
+import logging
+LOGGER = logging.getLogger("PYWPS")
+
+
+MANIFEST_FILE = "outputs.json"
+
+_cache = None
+
+
+def get_result_cache():
+    """
+    Returns the shared `DiskCache` of subset results, or None if the cache
+    is disabled in the `[result_cache]` configuration section.
+    """
+    global _cache
+
+    if not get_config_bool("result_cache", "enabled", True):
+        return None
+
+    if _cache is None:
+        cache_dir = get_config_value("result_cache", "cache_dir",
+                                     os.path.join(tempfile.gettempdir(), "flamingo", "results"))
+        max_size = get_config_size("result_cache", "max_size", "10gb")
+        ttl = get_config_int("result_cache", "ttl", 86400) or None
+        _cache = DiskCache(cache_dir, max_size=max_size, ttl=ttl)
+
+    return _cache
+
+
+def get_result_key(request):
+    """
+    Returns the cache key for a normalised request (as returned by
+    `flamingo.utils.input_utils.normalise_request`).
+    """
+    return make_key("result", flamingo_version, request)
+
+
+def link_or_copy(src, dst):
+    "Hard links `src` to `dst`, copying it if a link is not possible."
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def fetch_results(key, output_dir):
+    """
+    Publishes the cached outputs for `key` into `output_dir`.
+
+    Returns the list of output file paths (in their original order),
+    or None if there is no cached result or it cannot be published. The
+    entry is pinned meanwhile, so that no process evicts it.
+    """
+    cache = get_result_cache()
+    if not cache:
+        return None
+
+    output_paths = []
+
+    try:
+        with cache.pin(key):
+            entry_dir = cache.get(key)
+            if not entry_dir:
+                return None
+
+            with open(os.path.join(entry_dir, MANIFEST_FILE)) as reader:
+                file_names = json.load(reader)
+
+            for file_name in file_names:
+                output_path = os.path.join(output_dir, file_name)
+                link_or_copy(os.path.join(entry_dir, file_name), output_path)
+                output_paths.append(output_path)
+    except OSError as exc:
+        LOGGER.warning(f"Could not re-use the cached outputs for {key}: {exc}")
+
+        for output_path in output_paths:
+            os.remove(output_path)
+
+        return None
+
+    LOGGER.info(f"Re-using {len(output_paths)} cached output file(s) from {entry_dir}")
+    return output_paths
+
+
+def store_results(key, output_uris):
+    """
+    Adds the output files of a request to the cache. Results that include
+    remote URLs, or that share file names, are not cached.
+    """
+    cache = get_result_cache()
+
+    if not cache or not output_uris or not all(os.path.isfile(uri) for uri in output_uris):
+        return
+
+    file_names = [os.path.basename(uri) for uri in output_uris]
+    if len(set(file_names)) != len(file_names):
+        return
+
+    def populate(entry_dir):
+        for output_uri, file_name in zip(output_uris, file_names):
+            link_or_copy(output_uri, os.path.join(entry_dir, file_name))
+
+        with open(os.path.join(entry_dir, MANIFEST_FILE), "w") as writer:
+            json.dump(file_names, writer)
+
+    try:
+        cache.get_or_create(key, populate)
+    except OSError as exc:
+        # Caching is an optimisation: never fail the request because of it
+        LOGGER.warning(f"Could not cache results: {exc}")
@@ -0,0 +1,406 @@
+"""
+serve_utils.py
+==============
+
+A WSGI layer that serves the output files of the processes (the files
+under the `outputpath` of the `[server]` section, at the path of its
+`outputurl`).
+
+Files are served with an ETag and Last-Modified date, and conditional
+requests are answered with "304 Not Modified". Single byte ranges (the
+Range and If-Range headers) are supported, so that large downloads can be
+resumed or read in parts. The files are passed to the `wsgi.file_wrapper`
+of the server, which sends them with `os.sendfile` (without copying them
+through Python) on servers that support it, e.g. gunicorn and mod_wsgi,
+or else they are read in blocks. Text outputs (e.g. CSV) can be
+gzip-compressed on the fly for clients that accept it.
+
+The layer wraps the PyWPS application or runs on its own, with no
+application behind it, e.g. in a separate process in front of the WPS
+(see `serve_outputs` and the `flamingo serve-outputs` command). The
+server of `serve_outputs` sends the files with `os.sendfile`.
+
+Settings are read from the `[output_server]` configuration section.
+"""
+
+import mimetypes
+import os
+import re
+import zlib
+from email.utils import formatdate, parsedate_to_datetime
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse
+from wsgiref.simple_server import ServerHandler, WSGIRequestHandler, WSGIServer
+from wsgiref.util import FileWrapper
+
+from flamingo.utils.config_utils import (
+    get_config_bool, get_config_int, get_config_list, get_config_size, get_config_value
+)
+
+import logging
+LOGGER = logging.getLogger("PYWPS")
+
+
+CONTENT_TYPES = {
+    ".nc": "application/x-netcdf",
+    ".csv": "text/csv",
+    ".json": "application/json",
+    ".meta4": "application/metalink4+xml",
+    ".parquet": "application/vnd.apache.parquet",
+    ".feather": "application/vnd.apache.arrow.file",
+    ".zip": "application/zip",
+}
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def output_server_enabled():
+    return get_config_bool("output_server", "enabled", True)
+
+
+def get_output_prefix(output_url):
+    "Returns the URL path that the outputs are served at, from the `outputurl` setting."
+    return urlparse(output_url or "").path.rstrip("/") or "/outputs"
+
+
+def get_content_type(path):
+    content_type = CONTENT_TYPES.get(os.path.splitext(path)[1].lower())
+    return content_type or mimetypes.guess_type(path)[0] or "application/octet-stream"
+
+
+def make_etag(stat):
+    "Returns the ETag of a file from its `os.stat` result."
+    return f'"{stat.st_ino:x}-{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+
+
+def parse_range(header, size):
+    """
+    Returns the (start, end) positions (`end` excluded) of the byte range
+    requested in a Range header for a file of `size` bytes, or None if the
+    whole file should be served: there is no header, or it is not a single
+    byte range. Raises ValueError if the range cannot be satisfied.
+    """
+    match = RANGE_PATTERN.match((header or "").strip())
+    if not match or match.groups() == ("", ""):
+        return None
+
+    first, last = match.groups()
+
+    if first:
+        start = int(first)
+        end = min(int(last) + 1, size) if last else size
+
+        # An invalid range is ignored
+        if last and int(last) < start:
+            return None
+    else:
+        # The last bytes of the file
+        start, end = max(size - int(last), 0), size
+        if int(last) == 0:
+            raise ValueError(f"Range not satisfiable: {header}")
+
+    if start >= size:
+        raise ValueError(f"Range not satisfiable: {header}")
+
+    return start, end
+
+
+def _parse_date(value):
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def accepts_gzip(environ):
+    "Returns True if the Accept-Encoding header of a request accepts gzip (with a quality above 0)."
+    qualities = {}
+
+    for item in environ.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        coding, *params = [part.strip() for part in item.split(";")]
+        quality = 1.0
+
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+
+        qualities[coding.lower()] = quality
+
+    quality = qualities.get("gzip", qualities.get("x-gzip", qualities.get("*", 0.0)))
+    return quality > 0
+
+
+def is_not_modified(environ, etag, last_modified):
+    "Returns True if the conditional headers of a request match the file."
+    if_none_match = environ.get("HTTP_IF_NONE_MATCH")
+    if if_none_match:
+        return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+
+    if_modified_since = _parse_date(environ.get("HTTP_IF_MODIFIED_SINCE"))
+    return if_modified_since is not None and if_modified_since >= last_modified
+
+
+def range_applies(environ, etag, last_modified):
+    "Returns True unless an If-Range header shows that the client holds another version of the file."
+    if_range = environ.get("HTTP_IF_RANGE", "").strip()
+    if not if_range:
+        return True
+
+    if if_range.startswith(('"', "W/")):
+        return if_range == etag
+
+    return _parse_date(if_range) == last_modified
+
+
+class FileSlice:
+    """
+    A file object giving `length` bytes of the file at `path` from `offset`.
+
+    Servers whose `wsgi.file_wrapper` uses `os.sendfile` send the bytes
+    from the current position of `fileno()`, up to the Content-Length of
+    the response. Other servers call `read()`.
+    """
+
+    def __init__(self, path, offset, length):
+        self.file = open(path, "rb")
+        self.file.seek(offset)
+        self.remaining = length
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def iter_gzip(path, block_size, level=6):
+    "Yields the content of the file at `path`, gzip-compressed, one block at a time."
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    with open(path, "rb") as reader:
+        for block in iter(lambda: reader.read(block_size), b""):
+            data = compressor.compress(block)
+            if data:
+                yield data
+
+    yield compressor.flush()
+
+
+class OutputServerMiddleware:
+    """
+    WSGI middleware that serves the files in `output_dir` at the URL path
+    `prefix` and passes all other requests to `app`.
+
+    Params:
+    :app [callable]: the WSGI application to wrap, or None to answer other
+        requests with "404 Not Found"
+    :output_dir [str]: the directory holding the output files
+    :prefix [str]: the URL path of the output directory
+    :block_size [int]: size of the blocks read when the server has no `wsgi.file_wrapper`
+    :gzip_extensions [list]: extensions of the files to compress for clients that accept gzip
+    :max_age [int]: seconds that clients may re-use a file without revalidating it
+    """
+
+    def __init__(self, app, output_dir, prefix="/outputs", block_size=1024 ** 2,
+                 gzip_extensions=(".csv",), max_age=3600):
+        self.app = app
+        self.output_dir = os.path.realpath(output_dir)
+        self.prefix = prefix.rstrip("/")
+        self.block_size = block_size
+        self.gzip_extensions = tuple(ext.lower() for ext in gzip_extensions)
+        self.max_age = max_age
+
+    @classmethod
+    def from_config(cls, app):
+        "Returns the middleware set up from the `[server]` and `[output_server]` configuration sections."
+        return cls(
+            app,
+            get_config_value("server", "outputpath", "outputs"),
+            prefix=get_output_prefix(get_config_value("server", "outputurl")),
+            block_size=get_config_size("output_server", "block_size", "1mb"),
+            gzip_extensions=get_config_list("output_server", "gzip_extensions", [".csv"]),
+            max_age=get_config_int("output_server", "max_age", 3600),
+        )
+
+    def get_file_path(self, path_info):
+        "Returns the path of the file requested at `path_info`, or None if it is not an output file."
+        relative = path_info[len(self.prefix):].lstrip("/")
+        path = os.path.realpath(os.path.join(self.output_dir, relative))
+
+        if os.path.commonpath([self.output_dir, path]) != self.output_dir or not os.path.isfile(path):
+            return None
+
+        return path
+
+    def _error(self, start_response, status, headers=None):
+        body = status.encode("utf-8")
+        start_response(status, (headers or []) + [
+            ("Content-Type", "text/plain; charset=utf-8"),
+            ("Content-Length", str(len(body))),
+        ])
+        return [body]
+
+    def __call__(self, environ, start_response):
+        path_info = environ.get("PATH_INFO", "")
+
+        if path_info != self.prefix and not path_info.startswith(self.prefix + "/"):
+            if self.app is None:
+                return self._error(start_response, "404 Not Found")
+            return self.app(environ, start_response)
+
+        method = environ.get("REQUEST_METHOD", "GET")
+        if method not in ("GET", "HEAD"):
+            return self._error(start_response, "405 Method Not Allowed", [("Allow", "GET, HEAD")])
+
+        path = self.get_file_path(path_info)
+        if path is None:
+            return self._error(start_response, "404 Not Found")
+
+        return self.serve_file(environ, start_response, path, head=method == "HEAD")
+
+    def serve_file(self, environ, start_response, path, head=False):
+        stat = os.stat(path)
+        size = stat.st_size
+        etag = make_etag(stat)
+        last_modified = int(stat.st_mtime)
+
+        compressible = path.lower().endswith(self.gzip_extensions)
+        # Ranges are served from the file as it is, uncompressed
+        gzip_accepted = accepts_gzip(environ) and not environ.get("HTTP_RANGE")
+        compress = compressible and gzip_accepted
+        if compress:
+            etag = etag[:-1] + '-gzip"'
+
+        headers = [
+            ("Content-Type", get_content_type(path)),
+            ("ETag", etag),
+            ("Last-Modified", formatdate(last_modified, usegmt=True)),
+            ("Cache-Control", f"public, max-age={self.max_age}"),
+            ("Accept-Ranges", "bytes"),
+        ]
+        if compressible:
+            headers.append(("Vary", "Accept-Encoding"))
+
+        if is_not_modified(environ, etag, last_modified):
+            start_response("304 Not Modified", [header for header in headers if header[0] != "Content-Type"])
+            return [b""]
+
+        if compress:
+            start_response("200 OK", headers + [("Content-Encoding", "gzip")])
+            return [b""] if head else iter_gzip(path, self.block_size)
+
+        byte_range = None
+        if range_applies(environ, etag, last_modified):
+            try:
+                byte_range = parse_range(environ.get("HTTP_RANGE"), size)
+            except ValueError:
+                return self._error(start_response, "416 Range Not Satisfiable",
+                                   [("Content-Range", f"bytes */{size}")])
+
+        if byte_range:
+            start, end = byte_range
+            status = "206 Partial Content"
+            headers.append(("Content-Range", f"bytes {start}-{end - 1}/{size}"))
+        else:
+            start, end = 0, size
+            status = "200 OK"
+
+        start_response(status, headers + [("Content-Length", str(end - start))])
+
+        if head:
+            return [b""]
+
+        file_wrapper = environ.get("wsgi.file_wrapper", FileWrapper)
+        return file_wrapper(FileSlice(path, start, end - start), self.block_size)
+
+    def __getattr__(self, name):
+        # Give access to the attributes of the wrapped application
+        return getattr(self.app, name)
+
+
+class SendfileHandler(ServerHandler):
+    "A `wsgiref` handler that sends the files of `wsgi.file_wrapper` responses with `os.sendfile`."
+
+    def sendfile(self):
+        try:
+            file_no = self.result.filelike.fileno()
+        except (AttributeError, OSError):
+            return False
+
+        length = self.headers.get("Content-Length")
+        if length is None:
+            return False
+
+        if not self.headers_sent:
+            self.send_headers()
+        self._flush()
+
+        socket_no = self.request_handler.connection.fileno()
+        offset = os.lseek(file_no, 0, os.SEEK_CUR)
+        remaining = int(length)
+
+        while remaining > 0:
+            sent = os.sendfile(socket_no, file_no, offset, remaining)
+            if sent == 0:
+                break
+
+            offset += sent
+            remaining -= sent
+
+        self.bytes_sent = int(length) - remaining
+        return True
+
+
+class SendfileRequestHandler(WSGIRequestHandler):
+    "A `wsgiref` request handler that runs the application with a `SendfileHandler`."
+
+    def log_message(self, format, *args):
+        LOGGER.info("%s - %s", self.address_string(), format % args)
+
+    def handle(self):
+        self.raw_requestline = self.rfile.readline(65537)
+        if len(self.raw_requestline) > 65536:
+            self.send_error(414)
+            return
+
+        if not self.parse_request():
+            return
+
+        handler = SendfileHandler(self.rfile, self.wfile, self.get_stderr(), self.get_environ(),
+                                  multithread=True)
+        handler.request_handler = self
+        handler.run(self.server.get_app())
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+def make_output_server(app, host="localhost", port=5001):
+    "Returns a threaded WSGI server running `app` that sends files with `os.sendfile`."
+    server = ThreadingWSGIServer((host, port), SendfileRequestHandler)
+    server.set_app(app)
+    return server
+
+
+def serve_outputs(app, host="localhost", port=5001):
+    "Serves `app` (e.g. an `OutputServerMiddleware`) until interrupted."
+    server = make_output_server(app, host, port)
+    LOGGER.warning(f"Serving outputs on http://{host}:{server.server_port}")
+
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
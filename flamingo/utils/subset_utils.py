@@ -1,6 +1,8 @@
 from copy import deepcopy
 
+from .decompress_utils import pin_decompressed_files
 from .input_utils import resolve_collection_if_files
+from .metrics_utils import StageTimer
 
 
 def run_subset(args):
@@ -13,3 +15,28 @@ def run_subset(args):
 
     result = subset(**kwargs)
     return result.file_uris
+
+
+def get_process(identifier):
+    "Returns a new instance of the process registered as `identifier`."
+    from flamingo.processes import get_process_class
+
+    try:
+        return get_process_class(identifier)()
+    except KeyError:
+        raise KeyError(f"No process registered with identifier: {identifier}")
+
+
+def run_process_subset(identifier, inputs, output_format, workdir, job_id=None, progress=None):
+    """
+    Runs the subset step of a process in its job working directory.
+    Used as a task by the job workers (see `flamingo.utils.job_utils`).
+    The outputs are published as they are written for the request `job_id`.
+    Returns the list of output file paths.
+    """
+    process = get_process(identifier)
+    process.set_workdir(workdir)
+    timer = StageTimer(identifier, job_id)
+
+    with pin_decompressed_files():
+        return process._run_subset(inputs, output_format, progress=progress, timer=timer, request_uuid=job_id)
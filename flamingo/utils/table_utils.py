@@ -0,0 +1,204 @@
+"""
+table_utils.py
+==============
+
+A streaming writer for columnar tabular files: Parquet and Arrow IPC
+(Feather v2).
+
+Each Dataset is flattened into one table, with a column for each dimension
+of its main variables (e.g. time, lat, lon), a column for each coordinate
+over those dimensions (e.g. 2D latitude and longitude) and a column for each
+data variable. The rows are built with vectorised NumPy reshaping and
+written in blocks along the first dimension, so only one block is held in
+memory at a time, and each block becomes a Parquet row group or an Arrow
+record batch.
+
+The attributes of the Dataset and its variables are kept as JSON in the
+"flamingo" entry of the schema metadata, and the units and long names of
+the columns in their field metadata.
+"""
+
+import json
+
+import numpy as np
+
+from flamingo import __version__ as flamingo_version
+from flamingo.utils.csv_utils import BLOCK_SIZE
+
+
+TABLE_FORMATS = {
+    "parquet": ".parquet",
+    "feather": ".feather",
+}
+
+FIELD_ATTRS = ("units", "long_name", "standard_name")
+
+
+def get_table_variables(ds):
+    """
+    Returns a tuple of (dims, coordinate names, data variable names) for the
+    table of a Dataset. The dimensions are those of the data variables with
+    the most dimensions, and the coordinates and data variables are those
+    that only span these dimensions.
+    """
+    data_vars = [name for name in ds.data_vars if ds[name].dims]
+    if not data_vars:
+        return (), [], []
+
+    dims = max((ds[name].dims for name in data_vars), key=len)
+
+    def in_table(name):
+        return ds[name].dims and set(ds[name].dims) <= set(dims)
+
+    coords = [name for name in ds.coords if name not in ds.dims and in_table(name)]
+    names = [name for name in data_vars if in_table(name)]
+
+    return dims, coords, names
+
+
+def to_column_values(values):
+    """
+    Returns an array of values that Arrow can store: cftime dates are
+    converted to timestamps, or to ISO strings for calendars that have no
+    equivalent in the standard calendar (e.g. 30 February in "360_day").
+    """
+    if values.dtype != object or not values.size or not hasattr(values.flat[0], "calendar"):
+        return values
+
+    try:
+        return np.array([np.datetime64(value.isoformat()) for value in values.ravel()],
+                        dtype="datetime64[ns]").reshape(values.shape)
+    except ValueError:
+        return np.array([value.isoformat() for value in values.ravel()]).reshape(values.shape)
+
+
+def _field_metadata(var):
+    return {key: str(var.attrs[key]) for key in FIELD_ATTRS if key in var.attrs}
+
+
+def _schema_metadata(ds, names):
+    metadata = {
+        "attributes": {key: str(value) for key, value in ds.attrs.items()},
+        "variables": {name: {key: str(value) for key, value in ds[name].attrs.items()}
+                      for name in names},
+        "history": f"Converted to tabular format using flamingo-{flamingo_version}.",
+    }
+    return {"flamingo": json.dumps(metadata)}
+
+
+def _broadcast(var, ds, dims):
+    "Returns the values of `var` broadcast over `dims` of `ds`, as a 1D array."
+    missing = {dim: ds.sizes[dim] for dim in dims if dim not in var.dims}
+    if missing:
+        var = var.expand_dims(missing)
+
+    return var.transpose(*dims).values.ravel()
+
+
+def _iter_blocks(ds, dims, coords, names, block_size=BLOCK_SIZE):
+    "Yields dictionaries of column arrays, one block of rows at a time."
+    dim0 = dims[0]
+    rows_per_step = int(np.prod([ds.sizes[dim] for dim in dims[1:]]))
+    steps_per_block = max(1, block_size // max(rows_per_step, 1))
+
+    dim_values = {dim: to_column_values(ds[dim].values) if dim in ds.coords else np.arange(ds.sizes[dim])
+                  for dim in dims}
+
+    # Columns of variables without the first dimension repeat in every step
+    per_step = {}
+    for name in coords + names:
+        if dim0 not in ds[name].dims:
+            per_step[name] = to_column_values(_broadcast(ds[name], ds, dims[1:]))
+
+    for start in range(0, ds.sizes[dim0], steps_per_block):
+        block = slice(start, start + steps_per_block)
+        n_steps = len(dim_values[dim0][block])
+
+        grids = np.meshgrid(dim_values[dim0][block], *[dim_values[dim] for dim in dims[1:]],
+                            indexing="ij")
+        columns = {dim: grid.ravel() for dim, grid in zip(dims, grids)}
+
+        block_ds = ds.isel({dim0: block})
+
+        for name in coords + names:
+            if name in per_step:
+                columns[name] = np.tile(per_step[name], n_steps)
+            else:
+                columns[name] = to_column_values(_broadcast(block_ds[name], block_ds, dims))
+
+        yield columns
+
+
+def _to_record_batch(columns, schema):
+    import pyarrow as pa
+
+    # NaNs in floating-point columns are stored as nulls
+    arrays = [pa.array(columns[field.name], type=field.type, from_pandas=True) for field in schema]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def _get_schema(ds, first_block):
+    import pyarrow as pa
+
+    fields = []
+    for name, values in first_block.items():
+        field_type = pa.array(values[:1], from_pandas=True).type
+        metadata = _field_metadata(ds[name]) if name in ds.variables else {}
+        fields.append(pa.field(name, field_type, metadata=metadata or None))
+
+    return pa.schema(fields, metadata=_schema_metadata(ds, list(first_block)))
+
+
+def _open_writer(output_file, schema, fmt, compression):
+    import pyarrow as pa
+
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+        return pq.ParquetWriter(output_file, schema, compression=compression or "none")
+
+    # Arrow IPC only supports the lz4 and zstd codecs
+    options = pa.ipc.IpcWriteOptions(compression=compression if compression in ("lz4", "zstd") else None)
+    return pa.ipc.new_file(output_file, schema, options=options)
+
+
+def write_dataset_to_table(ds, output_file, fmt="parquet", compression="zstd", block_size=BLOCK_SIZE):
+    """
+    Writes an Xarray Dataset to a Parquet or Arrow IPC (Feather v2) file.
+
+    Params:
+    :ds [xarray.Dataset]: the Dataset to write
+    :output_file [str]: output file path
+    :fmt [str]: "parquet" or "feather"
+    :compression [str]: codec, e.g. "zstd", "lz4" or "snappy" (Parquet only), or "none"
+    :block_size [int]: number of rows written at a time (one row group per block)
+
+    Returns:
+    :output_file_path [str]: the output file path, or None if the Dataset has no data variables
+    """
+    if fmt not in TABLE_FORMATS:
+        raise ValueError(f"Unknown table format: {fmt}")
+
+    dims, coords, names = get_table_variables(ds)
+    if not names:
+        return None
+
+    compression = None if compression == "none" else compression
+    writer = None
+    schema = None
+
+    try:
+        for columns in _iter_blocks(ds, dims, coords, names, block_size):
+            if writer is None:
+                schema = _get_schema(ds, columns)
+                writer = _open_writer(output_file, schema, fmt, compression)
+
+            batch = _to_record_batch(columns, schema)
+            if fmt == "parquet":
+                writer.write_batch(batch, row_group_size=batch.num_rows)
+            else:
+                writer.write_batch(batch)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return output_file if writer is not None else None
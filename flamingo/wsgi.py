@@ -1,17 +1,85 @@
 import os
+import threading
+
 from pywps.app.Service import Service
 
-from .processes import processes
+from .processes import get_processes
+from .utils.capabilities_utils import (
+    CapabilitiesCacheMiddleware, capabilities_cache_enabled, get_common_requests
+)
+from .utils.config_utils import get_config_bool
+from .utils.index_utils import build_indexes, get_index_dir, get_process_collections
+from .utils.job_utils import jobs_enabled, start_worker_pool
+from .utils.metrics_utils import MetricsMiddleware, metrics_enabled
+from .utils.serve_utils import OutputServerMiddleware, output_server_enabled
 
 
-def create_app(cfgfiles=None):
+def get_config_files(cfgfiles=None):
     config_files = [os.path.join(os.path.dirname(__file__), "default.cfg")]
     if cfgfiles:
         config_files.extend(cfgfiles)
     if "PYWPS_CFG" in os.environ:
         config_files.append(os.environ["PYWPS_CFG"])
+    return config_files
+
+
+def create_app(cfgfiles=None):
+    config_files = get_config_files(cfgfiles)
+    processes = get_processes()
     service = Service(processes=processes, cfgfiles=config_files)
-    return service
+
+    # Build any missing file indexes in the background
+    if get_index_dir() and get_config_bool("file_index", "build_on_startup", False):
+        threading.Thread(
+            target=build_indexes,
+            args=(get_process_collections(processes),),
+            kwargs={"missing_only": True},
+            daemon=True,
+        ).start()
+
+    app = service
+
+    # Serve GetCapabilities and DescribeProcess responses from a cache
+    if capabilities_cache_enabled():
+        app = CapabilitiesCacheMiddleware(service, processes, config_files)
+        app.prerender(get_common_requests(processes))
+
+    # Serve the output files, with Range requests and zero-copy transfers
+    if output_server_enabled():
+        app = OutputServerMiddleware.from_config(app)
+
+    # Serve Prometheus metrics at /metrics
+    if metrics_enabled():
+        app = MetricsMiddleware(app)
+
+    return app
+
+
+def start_workers(cfgfiles=None):
+    """
+    Starts the job workers for this host, if the job workers are enabled and
+    `spawn_workers` is set. Called by `flamingo start`; other servers must
+    call it once per host, e.g. from the `on_starting` hook of gunicorn, not
+    from each of their workers.
+    """
+    from pywps import configuration
+
+    config_files = get_config_files(cfgfiles)
+    configuration.load_configuration(config_files)
+
+    if jobs_enabled() and get_config_bool("jobs", "spawn_workers", True):
+        start_worker_pool(config_files)
+
+
+def create_output_app(cfgfiles=None):
+    """
+    Returns an application that only serves the output files, to run in
+    front of (or beside) the WPS application.
+    """
+    from pywps import configuration
+
+    configuration.load_configuration(get_config_files(cfgfiles))
+    return OutputServerMiddleware.from_config(None)
 
 
 application = create_app()
@@ -53,7 +53,6 @@ setup(
     install_requires=[
         reqs,
         "daops @ git+https://github.com/roocs/daops.git",
-        "nappy @ git+https://github.com/cedadev/nappy.git",
     ],
     extras_require={
         "dev": dev_reqs,  # pip install ".[dev]"
@@ -12,7 +12,9 @@ from jinja2 import Template
 import tempfile
 import xml.etree.ElementTree as ET
 
+import pyarrow.parquet as pq
 import xarray as xr
+import zarr
 
 
 TESTS_HOME = os.path.abspath(os.path.dirname(__file__))
@@ -113,10 +115,16 @@ def _common_wps_process_test(proc_class, data_inputs):
     filepath = file_tag.find("{urn:ietf:params:xml:ns:metalink}metaurl").text[7:]
 
     if "output_type=csv" in data_inputs.lower():
-        # Read in as CSV using Nappy
+        # Read in as CSV (NASA Ames format)
         content = [line.strip() for line in open(filepath).readlines()]
         assert isinstance(content, list)
         assert len(content) > 10
+    elif "output_type=parquet" in data_inputs.lower():
+        content = pq.read_table(filepath)
+        assert content.num_rows > 0
+    elif "output_type=zarr" in data_inputs.lower():
+        content = xr.open_zarr(zarr.ZipStore(filepath, mode="r"), use_cftime=True, decode_timedelta=False)
+        assert isinstance(content, xr.Dataset)
     else:
         content = xr.open_dataset(filepath, use_cftime=True, decode_timedelta=False)
         assert isinstance(content, xr.Dataset)
@@ -0,0 +1,77 @@
+import cftime
+import numpy as np
+import pytest
+import xarray as xr
+
+from clisops.parameter._utils import interval
+
+from flamingo.utils import index_utils
+from flamingo.utils.admission_utils import check_estimate, estimate_subset, _count_steps
+
+
+COLLECTION = "cru_ts.4.04.wet"
+
+LATS = np.arange(-89.75, 90, 0.5)
+LONS = np.arange(-179.75, 180, 0.5)
+
+
+def _write_file(path, year):
+    times = [cftime.DatetimeGregorian(year, month, 16) for month in range(1, 13)]
+    ds = xr.Dataset(
+        {"wet": (("time", "lat", "lon"), np.zeros((12, len(LATS), len(LONS)), dtype="float32"))},
+        coords={"time": times, "lat": LATS, "lon": LONS},
+    )
+    ds.to_netcdf(path)
+    return str(path)
+
+
+@pytest.fixture
+def index_dir(tmp_path, monkeypatch):
+    file_paths = [_write_file(tmp_path / f"wet_{year}.nc", year) for year in (2000, 2001)]
+    monkeypatch.setattr(index_utils, "get_collection_files", lambda collection: file_paths)
+
+    index_dir = str(tmp_path / "index")
+    index_utils.build_collection_index(COLLECTION, index_dir)
+    return index_dir
+
+
+def test_count_steps():
+    assert _count_steps(12, 0, 11) == 12
+    assert _count_steps(12, 0, 11, 2.5, 5) == 3
+    assert _count_steps(12, 0, 11, 20, 30) == 0
+    assert _count_steps(1, 0, 0, None, None) == 1
+
+
+def test_estimate_subset(index_dir):
+    time = interval("2000-03-01/2001-02-28")
+    area = [-10, 35, 30, 70]
+
+    estimate = estimate_subset([COLLECTION], time, area, "netcdf", index_dir=index_dir)
+
+    # 12 months of a 70 x 80 cell area
+    assert estimate["files"] == 2
+    assert estimate["read_bytes"] == pytest.approx(12 * 70 * 80 * 4, rel=0.05)
+
+    csv_estimate = estimate_subset([COLLECTION], time, area, "csv", index_dir=index_dir)
+    assert csv_estimate["output_bytes"] > estimate["read_bytes"]
+
+    # Two variables read twice as much
+    assert estimate_subset([COLLECTION, COLLECTION], time, area, "netcdf",
+                           index_dir=index_dir)["read_bytes"] == 2 * estimate["read_bytes"]
+
+
+def test_estimate_subset_without_index(tmp_path):
+    assert estimate_subset([COLLECTION], None, None, index_dir=str(tmp_path)) is None
+
+
+def test_check_estimate(tmp_path):
+    gb = 1024 ** 3
+
+    assert check_estimate({"read_bytes": gb, "output_bytes": gb // 100}, str(tmp_path)) is False
+    assert check_estimate({"read_bytes": 3 * gb, "output_bytes": gb // 100}, str(tmp_path)) is True
+
+    with pytest.raises(ValueError, match="too large"):
+        check_estimate({"read_bytes": 200 * gb, "output_bytes": 0}, str(tmp_path))
+
+    with pytest.raises(ValueError, match="its outputs"):
+        check_estimate({"read_bytes": 0, "output_bytes": 1024 ** 5}, str(tmp_path))
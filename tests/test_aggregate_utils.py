@@ -0,0 +1,128 @@
+import cftime
+import numpy as np
+import pytest
+import xarray as xr
+
+from flamingo.utils.aggregate_utils import (
+    parse_polygon, polygon_mask, aggregate, aggregate_results
+)
+from flamingo.utils.output_utils import DatasetResults
+
+
+def _make_regular(n_years=2):
+    times = [cftime.datetime(2000 + month // 12, month % 12 + 1, 16, calendar="standard")
+             for month in range(n_years * 12)]
+    data = (np.ones((n_years * 12, 3, 2)) * np.arange(n_years * 12)[:, None, None]).astype("float32")
+    # The values at the equator are doubled
+    data[:, 1, :] *= 2
+
+    return xr.Dataset(
+        {"tmn": (("time", "lat", "lon"), data, {"units": "degC"})},
+        coords={"time": times, "lat": [-60.0, 0.0, 60.0], "lon": [0.5, 1.5]},
+    ).chunk({"time": 12})
+
+
+def _make_projected():
+    times = [cftime.datetime(2000, month, 16, calendar="360_day") for month in range(1, 13)]
+    data = np.arange(12 * 3 * 4, dtype="float32").reshape(12, 3, 4)
+
+    return xr.Dataset(
+        {
+            "tas": (("time", "y", "x"), data, {"grid_mapping": "transverse_mercator"}),
+            "transverse_mercator": (("time",), np.zeros(12, dtype="int32")),
+            "time_bnds": (("time", "bnds"), np.zeros((12, 2))),
+        },
+        coords={
+            "time": times,
+            "y": np.arange(3) * 1000.0,
+            "x": np.arange(4) * 1000.0,
+            "latitude": (("y", "x"), 50 + np.arange(3)[:, None] + np.zeros(4)),
+            "longitude": (("y", "x"), -2 + np.arange(4)[None, :] + np.zeros((3, 1))),
+        },
+    ).chunk({"time": 6})
+
+
+def test_parse_polygon():
+    assert parse_polygon("-3 51, 1 51, 1 54") == [(-3, 51), (1, 51), (1, 54)]
+
+    for value in ("-3 51, 1 51", "-3,51,1,51,1,54", "a b, c d, e f"):
+        with pytest.raises(ValueError):
+            parse_polygon(value)
+
+
+def test_polygon_mask():
+    lons, lats = np.meshgrid(np.arange(5.0), np.arange(5.0))
+    mask = polygon_mask(lons, lats, [(0.5, 0.5), (3.5, 0.5), (0.5, 3.5)])
+
+    assert mask.sum() == 3
+    assert mask[1, 1] and mask[1, 2] and not mask[3, 3]
+
+
+def test_area_mean_weighted():
+    ds = aggregate(_make_regular(), ["area_mean"])
+
+    assert ds.tmn.dims == ("time",)
+    assert ds.tmn.dtype == np.float32
+    assert ds.tmn.attrs == {"units": "degC", "cell_methods": "area: mean"}
+    # Weights: cos(60) = 0.5 at the poles, 1 at the equator
+    assert np.isclose(float(ds.tmn[1]), (0.5 + 2 + 0.5) / 2)
+
+
+def test_area_mean_polygon():
+    ds = aggregate(_make_projected(), ["area_mean"], polygon=[(-2.5, 49.5), (0.5, 49.5), (0.5, 50.5), (-2.5, 50.5)])
+
+    # The cells of the first row with longitudes -2, -1 and 0
+    assert float(ds.tas[0]) == 1.0
+    assert "transverse_mercator" not in ds
+    assert "latitude" not in ds.coords
+    assert "grid_mapping" not in ds.tas.attrs
+
+
+def test_annual_mean():
+    ds = aggregate(_make_regular(), ["area_mean", "annual_mean"])
+
+    assert ds.tmn.values.tolist() == pytest.approx([5.5 * 1.5, 17.5 * 1.5])
+    assert ds.tmn.attrs["cell_methods"] == "area: mean time: mean (interval: 1 year)"
+
+
+def test_seasonal_mean_grid_mapping():
+    ds = aggregate(_make_projected(), ["seasonal_mean"])
+
+    assert ds.tas.sizes == {"time": 5, "y": 3, "x": 4}
+    # The grid mapping loses its time dimension and the time bounds are dropped
+    assert ds.transverse_mercator.dims == ()
+    assert "time_bnds" not in ds
+
+
+def test_climatology():
+    ds = aggregate(_make_regular(), ["seasonal_climatology"])
+
+    assert [time.month for time in ds.time.values] == [1, 3, 6, 9]
+    assert ds.attrs["climatology_period"] == "2000-01-16/2001-12-16"
+    # DJF of both years: months 0, 1, 11, 12, 13 and 23
+    assert float(ds.tmn[0, 0, 0]) == np.mean([0, 1, 11, 12, 13, 23])
+
+    ds = aggregate(_make_regular(), ["monthly_climatology"])
+    assert ds.tmn.sizes["time"] == 12
+    assert float(ds.tmn[0, 0, 0]) == 6.0
+
+
+def test_aggregate_results():
+    results = aggregate_results(DatasetResults([_make_regular()], name="collection"), ["area_mean"])
+    ds, = results._results["collection"]
+    assert ds.tmn.dims == ("time",)
+
+    with pytest.raises(ValueError):
+        aggregate(_make_regular(), ["median"])
+
+
+def test_aggregate_results_time_slices():
+    # A subset split by clisops into time slices gives one climatology
+    ds = _make_regular()
+    results = DatasetResults([ds.isel(time=slice(0, 13)), ds.isel(time=slice(13, None))], name="collection")
+
+    result, = aggregate_results(results, ["monthly_climatology"])._results["collection"]
+    expected = aggregate(ds, ["monthly_climatology"])
+
+    xr.testing.assert_allclose(result.tmn, expected.tmn)
+    assert result.attrs["climatology_period"] == expected.attrs["climatology_period"]
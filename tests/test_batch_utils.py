@@ -0,0 +1,42 @@
+import json
+
+import pytest
+
+from flamingo.utils.batch_utils import parse_batch, parse_area, get_union_area, group_subsets
+
+
+def test_parse_batch():
+    subsets = [{"variable": "wet"}, {"variable": "tmn"}]
+    assert parse_batch(json.dumps(subsets), max_subsets=2) == subsets
+
+    for value in ("not json", "{}", "[]", "[1, 2]", json.dumps(subsets * 2)):
+        with pytest.raises(ValueError):
+            parse_batch(value, max_subsets=2)
+
+
+def test_parse_area():
+    assert parse_area("-10,35,30,70") == [-10.0, 35.0, 30.0, 70.0]
+    assert parse_area([1, 2, 3, 4]) == [1.0, 2.0, 3.0, 4.0]
+    assert parse_area("") is None
+
+    for value in ("1,2,3", "a,b,c,d"):
+        with pytest.raises(ValueError):
+            parse_area(value)
+
+
+def test_get_union_area():
+    assert get_union_area([[0, 50, 10, 60], [-5, 55, 5, 65]]) == [-5, 50, 10, 65]
+    assert get_union_area([[0, 50, 10, 60], None]) is None
+
+
+def test_group_subsets():
+    subsets = [
+        {"collection": "cru_ts.4.04.wet", "time": "1951-01-01/1960-12-31", "area": [0, 50, 10, 60]},
+        {"collection": "cru_ts.4.04.tmn", "time": "1951-01-01/1960-12-31", "area": [0, 50, 10, 60]},
+        {"collection": "cru_ts.4.04.wet", "time": "1951-01-01/1960-12-31", "area": None},
+    ]
+
+    groups = group_subsets(subsets)
+    assert list(groups) == [("cru_ts.4.04.wet", "1951-01-01/1960-12-31"),
+                            ("cru_ts.4.04.tmn", "1951-01-01/1960-12-31")]
+    assert [index for index, _ in groups[("cru_ts.4.04.wet", "1951-01-01/1960-12-31")]] == [0, 2]
@@ -0,0 +1,166 @@
+import gzip
+import os
+import time
+
+from flamingo.utils.cache_utils import DiskCache, make_key
+from flamingo.utils.decompress_utils import decompress_file, decompress_files, pin_decompressed_files
+
+
+def _write_file(entry_dir, size=100):
+    with open(os.path.join(entry_dir, "data.bin"), "wb") as fp:
+        fp.write(b"x" * size)
+
+
+def test_make_key_is_stable():
+    assert make_key("a", 1, [2, 3]) == make_key("a", 1, [2, 3])
+    assert make_key("a", 1) != make_key("a", 2)
+
+
+def test_get_or_create_populates_once(tmp_path):
+    cache = DiskCache(str(tmp_path))
+    calls = []
+
+    def populate(entry_dir):
+        calls.append(entry_dir)
+        _write_file(entry_dir)
+
+    assert cache.get("k1") is None
+    path = cache.get_or_create("k1", populate)
+    assert cache.get_or_create("k1", populate) == path
+    assert len(calls) == 1
+    assert os.path.isfile(os.path.join(path, "data.bin"))
+
+
+def test_failed_population_leaves_no_entry(tmp_path):
+    cache = DiskCache(str(tmp_path))
+
+    def populate(entry_dir):
+        _write_file(entry_dir)
+        raise ValueError("failed")
+
+    try:
+        cache.get_or_create("k1", populate)
+    except ValueError:
+        pass
+
+    assert cache.get("k1") is None
+    assert os.listdir(os.path.join(str(tmp_path), DiskCache.TMP_DIR)) == []
+
+
+def test_lru_eviction(tmp_path):
+    cache = DiskCache(str(tmp_path), max_size=250)
+
+    cache.get_or_create("k1", _write_file)
+    cache.get_or_create("k2", _write_file)
+
+    # Mark "k1" as used more recently than "k2"
+    os.utime(os.path.join(str(tmp_path), "k2"), (time.time() - 60,) * 2)
+    cache.get("k1")
+
+    cache.get_or_create("k3", _write_file)
+
+    assert cache.get("k1") is not None
+    assert cache.get("k2") is None
+    assert cache.get("k3") is not None
+
+
+def test_eviction_keeps_new_and_pinned_entries(tmp_path):
+    cache = DiskCache(str(tmp_path), max_size=150)
+
+    # An entry larger than the budget is not evicted as it is created
+    path = cache.get_or_create("k1", lambda entry_dir: _write_file(entry_dir, size=200))
+    assert cache.get("k1") == path
+
+    # Nor is an entry in use
+    with cache.pin("k1"):
+        cache.get_or_create("k2", _write_file)
+        assert cache.get("k1") is not None
+
+    cache.get_or_create("k3", _write_file)
+    assert cache.get("k1") is None
+    assert cache.get("k3") is not None
+
+
+def test_ttl_expiry(tmp_path):
+    cache = DiskCache(str(tmp_path), ttl=1)
+    cache.get_or_create("k1", _write_file)
+    assert cache.get("k1") is not None
+
+    time.sleep(1.1)
+    assert cache.get("k1") is None
+
+
+def test_expired_entry_in_use_is_kept(tmp_path):
+    cache = DiskCache(str(tmp_path), ttl=1)
+    path = cache.get_or_create("k1", _write_file)
+    time.sleep(1.1)
+
+    calls = []
+
+    def populate(entry_dir):
+        calls.append(entry_dir)
+        _write_file(entry_dir, size=50)
+
+    # The expired entry is not replaced while it is in use...
+    with cache.pin("k1"):
+        assert cache.get_or_create("k1", populate) == path
+        assert os.path.getsize(os.path.join(path, "data.bin")) == 100
+
+    assert calls == []
+
+    # ...but once it is not
+    assert cache.get_or_create("k1", populate) == path
+    assert os.path.getsize(os.path.join(path, "data.bin")) == 50
+
+
+def test_eviction_discards_lock_files(tmp_path):
+    cache = DiskCache(str(tmp_path), max_size=150)
+
+    with cache.pin("k1"):
+        cache.get_or_create("k1", _write_file)
+
+    cache.get_or_create("k2", _write_file)
+    assert cache.get("k1") is None
+
+    lock_files = os.listdir(os.path.join(str(tmp_path), DiskCache.LOCK_DIR))
+    assert "k1.lock" not in lock_files and "k1.pin.lock" not in lock_files
+    assert "k2.lock" in lock_files
+
+    # The locks of an evicted entry are re-created with it
+    with cache.pin("k1"):
+        assert cache.get_or_create("k1", _write_file) is not None
+
+
+def test_decompress_file(tmp_path):
+    src = tmp_path / "archive" / "cru_ts4.05.1901.2020.wet.dat.nc.gz"
+    src.parent.mkdir()
+    with gzip.open(src, "wb") as fp:
+        fp.write(b"netcdf content")
+
+    cache = DiskCache(str(tmp_path / "cache"))
+    path = decompress_file(str(src), cache)
+
+    assert os.path.basename(path) == "cru_ts4.05.1901.2020.wet.dat.nc"
+    assert open(path, "rb").read() == b"netcdf content"
+    assert decompress_file(str(src), cache) == path
+
+
+def test_pin_decompressed_files(tmp_path, monkeypatch):
+    from flamingo.utils import decompress_utils
+
+    src = tmp_path / "archive" / "cru_ts4.05.1901.2020.wet.dat.nc.gz"
+    src.parent.mkdir()
+    with gzip.open(src, "wb") as fp:
+        fp.write(b"x" * 200)
+
+    cache = DiskCache(str(tmp_path / "cache"), max_size=150)
+    monkeypatch.setattr(decompress_utils, "_cache", cache)
+
+    # The copy read by a job is kept while other entries are added
+    with pin_decompressed_files():
+        path, = decompress_files([str(src)])
+        cache.get_or_create("k1", _write_file)
+        assert os.path.isfile(path)
+
+    cache.get_or_create("k2", _write_file)
+    assert not os.path.exists(path)
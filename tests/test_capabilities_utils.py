@@ -0,0 +1,96 @@
+import gzip
+
+from pywps import Service
+from werkzeug.test import Client
+
+from flamingo.processes import processes
+from flamingo.utils.capabilities_utils import CapabilitiesCacheMiddleware, get_common_requests
+
+
+CAPS_URL = "/wps?service=WPS&request=GetCapabilities&version=1.0.0"
+
+
+class CountingService:
+    "Wraps a Service to count the requests that reach it."
+
+    def __init__(self, service):
+        self.service = service
+        self.calls = 0
+
+    def __call__(self, environ, start_response):
+        self.calls += 1
+        return self.service(environ, start_response)
+
+
+def _make_client(tmp_path):
+    config_file = tmp_path / "pywps.cfg"
+    config_file.write_text("[server]\n")
+
+    service = CountingService(Service(processes=processes))
+    app = CapabilitiesCacheMiddleware(service, processes, [str(config_file)])
+    return Client(app), service, app, config_file
+
+
+def test_cached_capabilities(tmp_path):
+    client, service, _, _ = _make_client(tmp_path)
+
+    resp = client.get(CAPS_URL)
+    assert resp.status_code == 200
+    assert b"SubsetCRUTimeSeries" in resp.data
+
+    # Equivalent requests are served from the cache
+    resp2 = client.get("/wps?REQUEST=getcapabilities&Version=1.0.0&service=wps")
+    assert resp2.data == resp.data
+    assert service.calls == 1
+
+    resp3 = client.get(CAPS_URL, headers={"If-None-Match": resp.headers["ETag"]})
+    assert resp3.status_code == 304
+
+    resp4 = client.get(CAPS_URL, headers={"Accept-Encoding": "gzip, deflate"})
+    assert resp4.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(resp4.data) == resp.data
+    assert service.calls == 1
+
+    resp5 = client.get(CAPS_URL, headers={"Accept-Encoding": "gzip;q=0, deflate"})
+    assert "Content-Encoding" not in resp5.headers
+    assert resp5.data == resp.data
+
+    # Parameters that do not select the response are not part of the key
+    client.get(CAPS_URL + "&cachebuster=12345")
+    assert service.calls == 1
+
+
+def test_cache_size_is_bounded(tmp_path):
+    client, service, app, _ = _make_client(tmp_path)
+    app.max_entries = 1
+
+    describe_url = "/wps?service=WPS&request=DescribeProcess&version=1.0.0&identifier=SubsetHadUKGrid"
+    for url in (CAPS_URL, describe_url, CAPS_URL):
+        assert client.get(url).status_code == 200
+
+    assert service.calls == 3
+    assert len(app._responses) == 1
+
+
+def test_errors_and_executes_are_not_cached(tmp_path):
+    client, service, _, _ = _make_client(tmp_path)
+
+    for _ in range(2):
+        resp = client.get("/wps?service=WPS&request=DescribeProcess&version=1.0.0&identifier=Unknown")
+        assert resp.status_code == 400
+
+    assert service.calls == 2
+
+
+def test_prerender_and_config_change(tmp_path):
+    client, service, app, config_file = _make_client(tmp_path)
+    app.prerender(get_common_requests(processes))
+    n_rendered = service.calls
+
+    resp = client.get("/wps?service=WPS&request=DescribeProcess&version=1.0.0&identifier=SubsetHadUKGrid")
+    assert resp.status_code == 200
+    assert service.calls == n_rendered
+
+    config_file.write_text("[server]\nurl = http://example.org/wps\n")
+    client.get(CAPS_URL)
+    assert service.calls == n_rendered + 1
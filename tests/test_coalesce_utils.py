@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+
+import pytest
+from pywps.app.exceptions import ProcessError
+
+from flamingo.utils import coalesce_utils
+from flamingo.utils.coalesce_utils import InflightTable, run_coalesced, RUNNING, SUCCEEDED
+
+
+@pytest.fixture
+def table_path(tmp_path, monkeypatch):
+    table_path = str(tmp_path / "inflight.sqlite")
+    monkeypatch.setattr(coalesce_utils, "get_table_path", lambda: table_path)
+    return table_path
+
+
+def test_register(table_path):
+    table = InflightTable(table_path)
+
+    assert table.register("key", "first") is None
+    assert table.register("key", "second")["owner"] == "first"
+    assert table.register("other", "second") is None
+
+    # Finished requests are replaced
+    table.finish("key", "first", SUCCEEDED, outputs=["a.nc"])
+    assert table.register("key", "second") is None
+    assert table.get("key")["status"] == RUNNING
+
+
+def test_register_dead_owner(table_path):
+    table = InflightTable(table_path)
+
+    # A request whose process has died is taken over
+    assert table.register("key", "first", pid=2 ** 22 + 1) is None
+    assert table.register("key", "second") is None
+    assert table.get("key")["owner"] == "second"
+
+
+def _run_pair(tmp_path, func):
+    "Runs `func` for a request, and an identical request while it is running."
+    started = threading.Event()
+    results = {}
+
+    def leader():
+        def run():
+            started.set()
+            return func()
+
+        try:
+            results["leader"] = run_coalesced("key", str(tmp_path / "leader"), run)
+        except Exception as exc:
+            results["leader"] = exc
+
+    def follower():
+        try:
+            results["follower"] = run_coalesced("key", str(tmp_path / "follower"),
+                                                lambda: pytest.fail("Identical request was run twice"))
+        except Exception as exc:
+            results["follower"] = exc
+
+    thread = threading.Thread(target=leader)
+    thread.start()
+    started.wait()
+
+    follower()
+    thread.join()
+    return results
+
+
+def test_run_coalesced(tmp_path, table_path):
+    for name in ("leader", "follower"):
+        os.makedirs(tmp_path / name)
+
+    def run():
+        time.sleep(1)
+        output_path = tmp_path / "leader" / "output.nc"
+        output_path.write_text("data")
+        return [str(output_path)]
+
+    results = _run_pair(tmp_path, run)
+
+    assert results["leader"] == [str(tmp_path / "leader" / "output.nc")]
+    assert results["follower"] == [str(tmp_path / "follower" / "output.nc")]
+    assert (tmp_path / "follower" / "output.nc").read_text() == "data"
+
+
+def test_run_coalesced_failure(tmp_path, table_path):
+    def run():
+        time.sleep(1)
+        raise ProcessError("No files found for the request.")
+
+    results = _run_pair(tmp_path, run)
+
+    assert isinstance(results["leader"], ProcessError)
+    assert isinstance(results["follower"], ProcessError)
+    assert "No files found" in str(results["follower"])
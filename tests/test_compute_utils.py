@@ -0,0 +1,47 @@
+import dask
+import clisops.utils.output_utils as clisops_output_utils
+import pytest
+
+from flamingo.utils import compute_utils
+from flamingo.utils.compute_utils import CoreBudget, compute_context, get_chunk_memory_limit
+
+
+def test_core_budget_shares_slots(tmp_path):
+    budget = CoreBudget(str(tmp_path), 4, poll_interval=0.01)
+
+    with budget.acquire(3) as first:
+        assert first == 3
+
+        # Only one slot is left for a second job
+        with budget.acquire(3) as second:
+            assert second == 1
+
+    with budget.acquire(10) as n_workers:
+        assert n_workers == 4
+
+
+def test_core_budget_timeout(tmp_path):
+    budget = CoreBudget(str(tmp_path), 1, poll_interval=0.01)
+
+    with budget.acquire(1):
+        with pytest.raises(TimeoutError):
+            with budget.acquire(1, timeout=0.05):
+                pass
+
+
+def test_chunk_memory_limit():
+    assert get_chunk_memory_limit({}, 4) == 512 * 1024 ** 2
+    assert get_chunk_memory_limit({"chunk_memory_limit": "64mb"}, 4) == 64 * 1024 ** 2
+
+
+def test_compute_context(tmp_path, monkeypatch):
+    monkeypatch.setattr(compute_utils, "get_core_budget",
+                        lambda: CoreBudget(str(tmp_path), 2, poll_interval=0.01))
+    original_limit = clisops_output_utils.chunk_memory_limit
+
+    with compute_context({"chunk_memory_limit": "1mb"}) as n_workers:
+        assert n_workers == 2
+        assert dask.config.get("num_workers") == 2
+        assert clisops_output_utils.chunk_memory_limit == f"{1024 ** 2}B"
+
+    assert clisops_output_utils.chunk_memory_limit == original_limit
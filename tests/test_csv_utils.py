@@ -0,0 +1,151 @@
+import cftime
+import numpy as np
+import pytest
+import xarray as xr
+
+from flamingo.utils import csv_utils
+from flamingo.utils.csv_utils import write_dataset_to_csv, write_datasets_to_csvs
+
+
+def _make_dataset(n_times=5, n_lats=2, n_lons=3):
+    times = [cftime.DatetimeGregorian(2000, month, 1) for month in range(1, n_times + 1)]
+    data = np.arange(n_times * n_lats * n_lons, dtype="float32").reshape(n_times, n_lats, n_lons)
+    data[0, 0, 0] = np.nan
+
+    ds = xr.Dataset(
+        {"wet": (("time", "lat", "lon"), data, {"long_name": "wet day frequency", "units": "days"})},
+        coords={
+            "time": times,
+            "lat": ("lat", np.arange(n_lats) * 0.5, {"units": "degrees_north"}),
+            "lon": ("lon", np.arange(n_lons) * 0.5, {"units": "degrees_east"}),
+        },
+        attrs={"Conventions": "CF-1.4", "title": "CRU TS4.04 Rain Days",
+               "history": "created\nncks -d lat,,,100"},
+    )
+    ds["wet"].encoding["_FillValue"] = 9.96921e36
+    return ds
+
+
+def _read_lines(path):
+    return [line.rstrip("\n") for line in open(path)]
+
+
+def _read_content(path):
+    # The History line holds the time of writing
+    return [line for line in _read_lines(path) if not line.startswith("History:")]
+
+
+def test_write_3010_header(tmp_path):
+    output_file = str(tmp_path / "output_01.csv")
+    assert write_dataset_to_csv(_make_dataset(), output_file) == [output_file]
+
+    lines = _read_lines(output_file)
+    n_header, ffi = lines[0].split(",")
+
+    assert ffi == "3010"
+    assert lines[4] == "CRU TS4.04 Rain Days"
+    assert lines[6].startswith("2000 1 1,")
+    assert "Conventions:   CF-1.4" in lines
+    assert "    ncks -d lat,,,100" in lines
+    assert lines[int(n_header) - 1] == "=== Data Section begins on the next line ==="
+
+
+def test_write_3010_data_in_blocks(tmp_path, monkeypatch):
+    # Force one time step per block
+    monkeypatch.setattr(csv_utils, "BLOCK_SIZE", 1)
+    output_file = str(tmp_path / "output_01.csv")
+    write_dataset_to_csv(_make_dataset(), output_file)
+
+    lines = _read_lines(output_file)
+    data = lines[int(lines[0].split(",")[0]):]
+
+    # One line for each time step and one per latitude row
+    assert len(data) == 5 * 3
+    assert data[0] == "0"
+    assert data[1] == "9.96921e+36,1,2"
+    assert data[2] == "3,4,5"
+    assert data[3] == "31"
+
+
+def test_write_1001(tmp_path):
+    import nappy
+
+    ds = _make_dataset().isel(lat=0, lon=0, drop=True)
+    output_file = str(tmp_path / "output_01.csv")
+    write_dataset_to_csv(ds, output_file)
+
+    # nappy reads space-delimited files
+    na_file = tmp_path / "output_01.na"
+    na_file.write_text(open(output_file).read().replace(",", " "))
+
+    reader = nappy.openNAFile(str(na_file))
+    reader.readData()
+    na_dict = reader.getNADict()
+
+    assert na_dict["FFI"] == 1001
+    assert na_dict["XNAME"] == ["time (days since 2000-01-01 00:00:00)"]
+    assert na_dict["VNAME"] == ["wet day frequency (days)"]
+    assert na_dict["X"] == [0, 31, 60, 91, 121]
+    assert na_dict["V"] == [[9.96921e36, 6, 12, 18, 24]]
+    assert na_dict["NSCOML"] == 8
+    assert na_dict["NNCOML"] == 8
+
+    # The column labels are the last line of the header, as written by nappy
+    assert na_dict["NCOM"][-1] == "time (days since 2000-01-01 00:00:00) wet day frequency (days)"
+
+
+def test_variables_grouped_by_dims(tmp_path):
+    ds = _make_dataset()
+    ds["time_bnds"] = (("time", "bnds"), np.zeros((5, 2)))
+    ds["crs"] = ((), 0)
+
+    output_file = str(tmp_path / "output_01.csv")
+    output_paths = write_dataset_to_csv(ds, output_file)
+
+    assert output_paths == [str(tmp_path / "output_01_1.csv"), str(tmp_path / "output_01_2.csv")]
+    assert _read_lines(output_paths[1])[0].endswith(",2010")
+
+
+def test_write_2d_coordinates_without_fill_value(tmp_path):
+    ds = _make_dataset()
+    ds = ds.assign_coords(latitude=(("lat", "lon"), np.ones((2, 3)), {"units": "degrees_north"}))
+    ds["latitude"].encoding["_FillValue"] = None
+
+    output_file = str(tmp_path / "output_01.csv")
+    output_paths = write_dataset_to_csv(ds, output_file)
+
+    # The 2D coordinate is written to its own file with a NaN missing value
+    assert len(output_paths) == 2
+    assert "nan" in _read_lines(output_paths[1])
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_write_datasets_to_csvs(tmp_path, workers):
+    datasets = [_make_dataset(), _make_dataset(n_times=3).isel(lat=0, lon=0, drop=True)]
+    expected = [write_dataset_to_csv(ds, str(tmp_path / f"expected_{i}.csv")) for i, ds in enumerate(datasets)]
+
+    # Slabs of two time steps
+    output_paths = write_datasets_to_csvs(datasets, [str(tmp_path / "output_01.csv"), str(tmp_path / "output_02.csv")],
+                                          workers=workers, slab_size=12, start_method="spawn")
+
+    assert output_paths == [[str(tmp_path / "output_01.csv")], [str(tmp_path / "output_02.csv")]]
+    for (expected_path,), (output_path,) in zip(expected, output_paths):
+        assert _read_content(output_path) == _read_content(expected_path)
+
+    assert not list(tmp_path.glob("*.part*"))
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_write_datasets_to_csvs_reports_outputs(tmp_path, workers):
+    datasets = [_make_dataset(), _make_dataset(n_times=6)]
+    expected = [write_dataset_to_csv(ds, str(tmp_path / f"expected_{i}.csv")) for i, ds in enumerate(datasets)]
+    written = []
+
+    def on_output(paths):
+        # The files of each Dataset are complete when they are reported
+        written.append([_read_content(path) for path in paths])
+
+    write_datasets_to_csvs(datasets, [str(tmp_path / "output_01.csv"), str(tmp_path / "output_02.csv")],
+                           workers=workers, slab_size=12, start_method="spawn", on_output=on_output)
+
+    assert written == [[_read_content(path) for path in paths] for paths in expected]
@@ -0,0 +1,65 @@
+import pytest
+
+from pywps import Format, configuration
+from pywps.inout.outputs import ComplexOutput
+
+from flamingo.provenance import Provenance
+from flamingo.utils import diagram_utils
+from flamingo.utils.cache_utils import DiskCache
+from flamingo.utils.diagram_utils import publish_diagram
+
+
+def _provenance(tmp_path, outputs):
+    provenance = Provenance(str(tmp_path))
+    provenance.start()
+    provenance.add_operator("subset", {"time": "2001-01-01/2002-12-31"}, "cru_ts.4.04.wet", outputs)
+    return provenance
+
+
+def _output():
+    return ComplexOutput("prov_plot", "Provenance Diagram", as_reference=True, supported_formats=[
+        Format("image/png", extension=".png", encoding="base64"),
+        Format("image/svg+xml", extension=".svg"),
+    ])
+
+
+@pytest.fixture
+def output_path(tmp_path):
+    original = configuration.get_config_value("server", "outputpath")
+    configuration.CONFIG.set("server", "outputpath", str(tmp_path / "outputs"))
+    yield tmp_path / "outputs"
+    configuration.CONFIG.set("server", "outputpath", original)
+
+
+def test_publish_diagram(tmp_path, output_path, monkeypatch):
+    monkeypatch.setattr(diagram_utils, "_cache", DiskCache(str(tmp_path / "cache")))
+    rendered = []
+
+    def render(prov_json, fmt, file_path):
+        rendered.append(fmt)
+        with open(file_path, "w") as writer:
+            writer.write(f"{fmt} diagram")
+
+    # The first job renders the diagram in the background
+    output = _output()
+    future = publish_diagram(_provenance(tmp_path, ["output_01.nc"]), output, "job1", render=render)
+    target = future.result()
+
+    assert target == str(output_path / "job1" / "provenance.png")
+    assert output.url.endswith("/job1/provenance.png")
+    assert open(target).read() == "png diagram"
+
+    # A job with the same graph re-uses it straight away
+    assert publish_diagram(_provenance(tmp_path, ["output_01.nc"]), _output(), "job2", render=render) is None
+    assert open(output_path / "job2" / "provenance.png").read() == "png diagram"
+
+    # Other graphs and formats are rendered
+    publish_diagram(_provenance(tmp_path, ["output_01.nc", "output_02.nc"]), _output(), "job3",
+                    render=render).result()
+
+    output = _output()
+    output.data_format = output.supported_formats[1]
+    publish_diagram(_provenance(tmp_path, ["output_01.nc"]), output, "job4", render=render).result()
+
+    assert open(output_path / "job4" / "provenance.svg").read() == "svg diagram"
+    assert rendered == ["png", "png", "svg"]
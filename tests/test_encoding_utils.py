@@ -0,0 +1,76 @@
+import cftime
+import numpy as np
+import pytest
+import xarray as xr
+
+from flamingo.utils.encoding_utils import get_chunk_sizes, get_netcdf_encoding, get_netcdf_profile
+from flamingo.utils.output_utils import DatasetResults, write_to_netcdfs
+
+
+def _make_dataset(n_times=24, n_y=40, n_x=30):
+    times = [cftime.DatetimeGregorian(2000 + i // 12, i % 12 + 1, 16) for i in range(n_times)]
+    data = np.round(np.random.default_rng(0).normal(10, 5, (n_times, n_y, n_x)), 1).astype("float32")
+    data[:, :5, :5] = np.nan
+
+    ds = xr.Dataset(
+        {"tas": (("time", "y", "x"), data, {"units": "degC"})},
+        coords={
+            "time": times,
+            "y": np.arange(n_y) * 1000.0,
+            "x": np.arange(n_x) * 1000.0,
+            "latitude": (("y", "x"), np.random.default_rng(1).random((n_y, n_x))),
+        },
+    )
+    ds["tas"].encoding.update({"_FillValue": np.float32(1e20), "chunksizes": (1, 10, 10),
+                               "source": "/archive/tas.nc"})
+    return ds
+
+
+def test_get_netcdf_profile():
+    assert get_netcdf_profile({"netcdf_profile": "none"}) is None
+    assert get_netcdf_profile({"netcdf_profile": "packed"})["pack"] is True
+    assert get_netcdf_profile({"netcdf_profile": {"zlib": "false", "complevel": "6"}}) == {
+        "zlib": False, "complevel": 6, "shuffle": True, "chunks": "map", "pack": False
+    }
+
+    with pytest.raises(ValueError):
+        get_netcdf_profile({"netcdf_profile": "unknown"})
+
+
+def test_get_chunk_sizes():
+    da = _make_dataset()["tas"]
+
+    assert get_chunk_sizes(da, "map") == (1, 40, 30)
+    assert get_chunk_sizes(da, "timeseries") == (24, 32, 30)
+    assert get_chunk_sizes(da, "time:6,x:10") == (6, 40, 10)
+
+
+def test_get_netcdf_encoding():
+    ds = _make_dataset()
+    encoding = get_netcdf_encoding(ds, get_netcdf_profile({"netcdf_profile": "compressed"}))
+
+    assert set(encoding) == {"tas", "latitude"}
+    assert encoding["tas"] == {"zlib": True, "complevel": 1, "shuffle": True,
+                               "_FillValue": np.float32(1e20), "chunksizes": (1, 40, 30)}
+    assert "chunksizes" not in encoding["latitude"]
+
+
+@pytest.mark.parametrize("profile_name", ["compressed", "timeseries", "packed"])
+def test_write_to_netcdfs(tmp_path, profile_name):
+    ds = _make_dataset()
+    output_path, = write_to_netcdfs(DatasetResults([ds]), str(tmp_path),
+                                    get_netcdf_profile({"netcdf_profile": profile_name}))
+    assert output_path == str(tmp_path / "output_001.nc")
+
+    result = xr.open_dataset(output_path, use_cftime=True)
+    filters = result["tas"].encoding
+
+    assert filters["zlib"] is True
+    assert np.isnan(result["tas"].values[:, :5, :5]).all()
+
+    if profile_name == "packed":
+        assert filters["dtype"] == np.int16
+        np.testing.assert_allclose(result["tas"].values, ds["tas"].values,
+                                   atol=float(filters["scale_factor"]))
+    else:
+        xr.testing.assert_identical(result, ds)
@@ -0,0 +1,48 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+# Time allowed to import flamingo.wsgi (which creates the application),
+# excluding the interpreter start-up. Measured at ~0.7s, mostly pywps.
+IMPORT_BUDGET = float(os.environ.get("FLAMINGO_IMPORT_BUDGET", "2.0"))
+
+# Modules that must only be imported when a process is executed
+HEAVY_MODULES = ["daops", "clisops", "xarray", "dask", "numpy", "netCDF4", "nappy", "prov", "pydot", "zarr", "pyarrow"]
+
+SCRIPT = f"""
+import json, sys, time
+start = time.perf_counter()
+import flamingo.wsgi
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "elapsed": elapsed,
+    "heavy": [name for name in {HEAVY_MODULES!r} if name in sys.modules],
+}}))
+"""
+
+
+@pytest.fixture
+def env(tmp_path):
+    # Log to a temporary file rather than the flamingo.log of the default configuration
+    config_file = tmp_path / "pywps.cfg"
+    config_file.write_text(f"[logging]\nfile = {tmp_path / 'flamingo.log'}\n")
+    return dict(os.environ, PYWPS_CFG=str(config_file))
+
+
+def _run_import(env):
+    output = subprocess.run([sys.executable, "-c", SCRIPT], check=True,
+                            capture_output=True, text=True, env=env).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def test_startup_does_not_import_scientific_stack(env):
+    assert _run_import(env)["heavy"] == []
+
+
+def test_import_time_budget(env):
+    # Best of three runs, to reduce noise from a busy machine
+    elapsed = min(_run_import(env)["elapsed"] for _ in range(3))
+    assert elapsed < IMPORT_BUDGET, f"Importing flamingo.wsgi took {elapsed:.2f}s"
@@ -0,0 +1,60 @@
+import cftime
+import numpy as np
+import xarray as xr
+
+from clisops.parameter._utils import interval
+
+from flamingo.utils import index_utils
+from flamingo.utils.index_utils import build_collection_index, select_files
+
+
+COLLECTION = "cru_ts.4.04.wet"
+
+
+def _write_file(path, year, lats, lons):
+    times = [cftime.DatetimeGregorian(year, month, 16) for month in range(1, 13)]
+    ds = xr.Dataset(
+        {"wet": (("time", "lat", "lon"), np.zeros((12, len(lats), len(lons)), dtype="float32"))},
+        coords={"time": times, "lat": lats, "lon": lons},
+    )
+    ds.to_netcdf(path)
+    return str(path)
+
+
+def _build_index(tmp_path, monkeypatch):
+    file_paths = [
+        _write_file(tmp_path / "wet_2000.nc", 2000, [10.25, 20.25], [0.25, 10.25]),
+        _write_file(tmp_path / "wet_2001.nc", 2001, [10.25, 20.25], [0.25, 10.25]),
+        _write_file(tmp_path / "wet_2002_south.nc", 2002, [-20.25, -10.25], [0.25, 10.25]),
+    ]
+    monkeypatch.setattr(index_utils, "get_collection_files", lambda collection: file_paths)
+
+    index_dir = str(tmp_path / "index")
+    build_collection_index(COLLECTION, index_dir)
+    return index_dir, file_paths
+
+
+def test_select_files_by_time(tmp_path, monkeypatch):
+    index_dir, file_paths = _build_index(tmp_path, monkeypatch)
+
+    assert select_files(COLLECTION, interval("2001-03-01/2001-06-30"), index_dir=index_dir) == [file_paths[1]]
+    assert select_files(COLLECTION, interval("2000-12-16/2001"), index_dir=index_dir) == file_paths[:2]
+    assert select_files(COLLECTION, None, index_dir=index_dir) == file_paths
+
+
+def test_select_files_by_area(tmp_path, monkeypatch):
+    index_dir, file_paths = _build_index(tmp_path, monkeypatch)
+
+    assert select_files(COLLECTION, area=[0, -30, 20, -5], index_dir=index_dir) == [file_paths[2]]
+    assert select_files(COLLECTION, area=[50, -30, 60, 30], index_dir=index_dir) == []
+
+
+def test_select_files_without_index(tmp_path):
+    assert select_files(COLLECTION, index_dir=str(tmp_path)) is None
+
+
+def test_select_files_with_changed_file(tmp_path, monkeypatch):
+    index_dir, file_paths = _build_index(tmp_path, monkeypatch)
+    _write_file(file_paths[0], 2000, [10.25], [0.25])
+
+    assert select_files(COLLECTION, index_dir=index_dir) is None
@@ -0,0 +1,144 @@
+import multiprocessing
+import os
+
+import pytest
+
+from flamingo.utils import job_utils
+from flamingo.utils.csv_utils import write_datasets_to_csvs
+from flamingo.utils.job_utils import (
+    FAILED, QUEUED, RUNNING, SUCCEEDED, JobQueue, run_job, run_worker
+)
+
+
+TASK = "tests.test_job_utils:add_task"
+
+
+def add_task(a, b, progress=None):
+    progress("Adding", 50)
+    return a + b
+
+
+def fail_task(progress=None):
+    raise ValueError("bad inputs")
+
+
+def csv_task(output_file, progress=None):
+    from tests.test_csv_utils import _make_dataset
+
+    return write_datasets_to_csvs([_make_dataset(n_times=12)], [output_file], workers=2, slab_size=6)
+
+
+@pytest.fixture
+def jobs_config(tmp_path, monkeypatch):
+    db_path = str(tmp_path / "jobs.sqlite")
+    values = {"poll_interval": 0.01, "queue_timeout": 0.1, "timeout": 0}
+
+    monkeypatch.setattr(job_utils, "get_queue_path", lambda: db_path)
+    monkeypatch.setattr(job_utils, "get_config_float", lambda section, option, default: values[option])
+    return db_path
+
+
+def test_claim_by_priority(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"))
+
+    low = queue.submit(TASK, {"a": 1, "b": 2}, priority=0)
+    high = queue.submit(TASK, {"a": 1, "b": 2}, priority=5)
+    other_lane = queue.submit(TASK, {"a": 1, "b": 2}, lane="large", priority=9)
+
+    assert queue.claim(os.getpid())["id"] == high
+    assert queue.claim(os.getpid())["id"] == low
+    assert queue.claim(os.getpid()) is None
+    assert queue.claim(os.getpid(), lanes=["large"])["id"] == other_lane
+
+
+def test_claim_user_limit(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"))
+
+    first = queue.submit(TASK, {}, user="alice")
+    queue.submit(TASK, {}, user="alice")
+    bob = queue.submit(TASK, {}, user="bob")
+
+    assert queue.claim(os.getpid(), user_limit=1)["id"] == first
+    assert queue.claim(os.getpid(), user_limit=1)["id"] == bob
+    assert queue.claim(os.getpid(), user_limit=1) is None
+
+
+def test_requeue_orphans(tmp_path):
+    queue = JobQueue(str(tmp_path / "jobs.sqlite"))
+    job_id = queue.submit(TASK, {})
+
+    # A worker pid that cannot exist
+    queue.claim(2 ** 30)
+    assert queue.get(job_id)["status"] == RUNNING
+
+    assert queue.requeue_orphans() == 1
+    assert queue.get(job_id)["status"] == QUEUED
+
+    # A job whose worker keeps dying is failed
+    queue.claim(2 ** 30)
+    assert queue.requeue_orphans(max_attempts=2) == 0
+
+    job = queue.get(job_id)
+    assert job["status"] == FAILED
+    assert job["attempts"] == 2
+
+
+def test_run_worker(tmp_path):
+    db_path = str(tmp_path / "jobs.sqlite")
+    queue = JobQueue(db_path)
+
+    ok = queue.submit(TASK, {"a": 1, "b": 2}, message="Estimated to read 1.0 MB")
+    bad = queue.submit("tests.test_job_utils:fail_task", {})
+    assert queue.get(ok)["message"] == "Estimated to read 1.0 MB"
+
+    run_worker(db_path, poll_interval=0.01, max_jobs=2)
+
+    job = queue.get(ok)
+    assert job["status"] == SUCCEEDED
+    assert job["message"] == "Adding"
+
+    job = queue.get(bad)
+    assert job["status"] == FAILED
+    assert job["message"] == "bad inputs"
+
+
+def test_run_worker_csv(tmp_path):
+    # Job workers are daemons, which cannot start a pool to convert CSV slabs
+    db_path = str(tmp_path / "jobs.sqlite")
+    queue = JobQueue(db_path)
+    output_file = str(tmp_path / "output_01.csv")
+    job_id = queue.submit("tests.test_job_utils:csv_task", {"output_file": output_file})
+
+    worker = multiprocessing.get_context("spawn").Process(
+        target=run_worker, args=(db_path,), kwargs={"poll_interval": 0.01, "max_jobs": 1}, daemon=True)
+    worker.start()
+    worker.join(120)
+
+    job = queue.get(job_id)
+    assert job["status"] == SUCCEEDED, job["message"]
+
+    # The data section matches a serial conversion (the header has the time of writing)
+    expected = str(tmp_path / "expected.csv")
+    csv_task(expected)
+
+    lines = open(output_file).readlines()
+    n_header = int(lines[0].split(",")[0])
+    assert lines[n_header:] == open(expected).readlines()[n_header:]
+
+
+def test_run_job_queue_timeout(jobs_config):
+    # No worker takes jobs from the lane
+    with pytest.raises(RuntimeError, match="not started by a worker of the large lane"):
+        run_job(TASK, {"a": 1, "b": 2}, lane="large")
+
+    # The job is failed in the queue, so no worker will start it
+    queue = JobQueue(jobs_config)
+    assert queue.claim(os.getpid(), lanes=["large"]) is None
+
+    # A worker finishing a job that has timed out does not change its status
+    job_id = queue.submit(TASK, {})
+    queue.claim(os.getpid())
+    assert queue.fail(job_id, "Job did not finish")
+    queue.complete(job_id, 3)
+    assert queue.get(job_id)["status"] == FAILED
+    assert not queue.fail(job_id, "Job did not finish")
@@ -0,0 +1,71 @@
+import json
+
+import pytest
+from werkzeug.test import Client
+
+from flamingo.utils import metrics_utils
+from flamingo.utils.metrics_utils import MemorySampler, MetricsMiddleware, MetricsStore, StageTimer
+
+
+@pytest.fixture
+def metrics_path(tmp_path, monkeypatch):
+    path = str(tmp_path / "metrics.sqlite")
+    monkeypatch.setattr(metrics_utils, "get_metrics_path", lambda: path)
+    return path
+
+
+def test_stage_timer(metrics_path, caplog):
+    timer = StageTimer("SubsetTest", "job-1")
+
+    with caplog.at_level("INFO", logger="PYWPS"):
+        with timer.stage("subset"):
+            pass
+
+        with pytest.raises(ValueError):
+            with timer.stage("csv_conversion"):
+                raise ValueError()
+
+        timer.finish("failed")
+
+    records = [json.loads(record.message) for record in caplog.records
+               if record.message.startswith("{")]
+    assert [record["stage"] for record in records[:2]] == ["subset", "csv_conversion"]
+    assert records[1]["status"] == "error"
+    assert records[2]["event"] == "job"
+    assert records[2]["peak_rss"] > 0
+
+    text = MetricsStore(metrics_path).to_prometheus()
+    assert 'flamingo_stage_duration_seconds_count{process="SubsetTest",stage="subset"} 1' in text
+    assert 'flamingo_stage_duration_seconds_bucket{process="SubsetTest",stage="subset",le="+Inf"} 1' in text
+    assert 'flamingo_jobs_total{process="SubsetTest",status="failed"} 1' in text
+
+
+def test_memory_sampler():
+    with MemorySampler(interval=0.01) as memory:
+        before = memory.peak
+        data = bytearray(200 * 1024 ** 2)
+        data[::4096] = b"x" * len(data[::4096])
+
+    assert memory.peak >= before + 100 * 1024 ** 2
+
+    # A later sampler does not report the memory released since
+    del data
+    with MemorySampler(interval=0.01) as later:
+        pass
+
+    assert later.peak < memory.peak
+
+
+def test_metrics_middleware(metrics_path):
+    def app(environ, start_response):
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        return [b"wps"]
+
+    MetricsStore(metrics_path).observe_stage("SubsetTest", "subset", 2.0)
+    client = Client(MetricsMiddleware(app))
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert b'le="5"} 1' in response.data
+
+    assert client.get("/wps").data == b"wps"
@@ -0,0 +1,89 @@
+import os
+
+import cftime
+import numpy as np
+import xarray as xr
+
+from clisops.parameter._utils import interval
+
+from flamingo.utils import mirror_utils
+from flamingo.utils.mirror_utils import build_mirror, load_mirror_manifest, select_mirror_files
+
+
+COLLECTION = "cru_ts.4.04.wet"
+
+LATS = np.arange(-89.75, 90, 2.0)
+LONS = np.arange(-179.75, 180, 2.0)
+
+
+def _write_file(path, year):
+    times = [cftime.DatetimeGregorian(year, month, 16) for month in range(1, 13)]
+    data = np.random.default_rng(year).random((12, len(LATS), len(LONS)), dtype="float32")
+    ds = xr.Dataset(
+        {"wet": (("time", "lat", "lon"), data, {"units": "days"})},
+        coords={"time": times, "lat": LATS, "lon": LONS},
+        attrs={"title": "CRU TS"},
+    )
+    # Chunked for map access, as in the archive
+    ds.to_netcdf(path, encoding={"wet": {"chunksizes": (1, len(LATS), len(LONS)), "zlib": True}})
+    return str(path)
+
+
+def _build(tmp_path, monkeypatch):
+    file_paths = [_write_file(tmp_path / f"wet_{year}.nc", year) for year in (2000, 2001)]
+    monkeypatch.setattr(mirror_utils, "get_collection_files", lambda collection: file_paths)
+
+    mirror_dir = str(tmp_path / "mirror")
+    build_mirror(COLLECTION, mirror_dir)
+    return mirror_dir, file_paths
+
+
+def test_build_mirror(tmp_path, monkeypatch):
+    mirror_dir, file_paths = _build(tmp_path, monkeypatch)
+    manifest = load_mirror_manifest(COLLECTION, mirror_dir)
+
+    assert [entry["source"]["path"] for entry in manifest["files"]] == file_paths
+
+    for entry in manifest["files"]:
+        assert entry["mirror"]["variables"]["wet"]["chunks"] == [12, 32, 32]
+
+        with xr.open_dataset(entry["source"]["path"], decode_timedelta=False) as source, \
+                xr.open_dataset(entry["mirror"]["path"], decode_timedelta=False) as mirror:
+            xr.testing.assert_identical(source, mirror)
+
+
+def test_build_mirror_updates(tmp_path, monkeypatch):
+    mirror_dir, file_paths = _build(tmp_path, monkeypatch)
+    first = load_mirror_manifest(COLLECTION, mirror_dir)["files"][0]["mirror"]
+
+    # Unchanged files are kept, and copies of files gone from the archive are removed
+    monkeypatch.setattr(mirror_utils, "get_collection_files", lambda collection: file_paths[:1])
+    build_mirror(COLLECTION, mirror_dir)
+    manifest = load_mirror_manifest(COLLECTION, mirror_dir)
+
+    assert [entry["mirror"] for entry in manifest["files"]] == [first]
+    assert sorted(os.listdir(os.path.join(mirror_dir, COLLECTION))) == ["mirror.json", "wet_2000.nc"]
+
+
+def test_select_mirror_files(tmp_path, monkeypatch):
+    mirror_dir, file_paths = _build(tmp_path, monkeypatch)
+    mirror_paths = [entry["mirror"]["path"] for entry in load_mirror_manifest(COLLECTION, mirror_dir)["files"]]
+
+    # A time series at a small area reads less from the mirror
+    assert select_mirror_files(COLLECTION, interval("2000-01-01/2001-12-31"), [0, 50, 2, 52],
+                               mirror_dir=mirror_dir) == mirror_paths
+    assert select_mirror_files(COLLECTION, interval("2001-01-01/2001-12-31"), [0, 50, 2, 52],
+                               mirror_dir=mirror_dir) == mirror_paths[1:]
+
+    # A map at one time step reads less from the archive
+    assert select_mirror_files(COLLECTION, interval("2000-06-01/2000-06-30"), None,
+                               mirror_dir=mirror_dir) is None
+
+    # An out-of-date mirror is not used
+    _write_file(file_paths[0], 2000)
+    assert select_mirror_files(COLLECTION, interval("2000-01-01/2001-12-31"), [0, 50, 2, 52],
+                               mirror_dir=mirror_dir) is None
+
+
+def test_select_mirror_files_without_mirror(tmp_path):
+    assert select_mirror_files(COLLECTION, mirror_dir=str(tmp_path)) is None
@@ -0,0 +1,96 @@
+import cftime
+import numpy as np
+import pytest
+import xarray as xr
+import zarr
+
+from flamingo.utils.output_utils import (
+    DatasetResults, get_zarr_compressor, merge_datasets, parse_chunks, write_to_netcdfs, write_to_zarrs
+)
+
+
+def _make_dataset(n_times=24, n_lats=4, n_lons=6):
+    times = [cftime.DatetimeGregorian(2000 + i // 12, i % 12 + 1, 16) for i in range(n_times)]
+    data = np.arange(n_times * n_lats * n_lons, dtype="float32").reshape(n_times, n_lats, n_lons)
+
+    ds = xr.Dataset(
+        {"wet": (("time", "lat", "lon"), data, {"units": "mm"})},
+        coords={"time": times, "lat": np.arange(n_lats) * 0.5, "lon": np.arange(n_lons) * 0.5},
+    )
+    # Encodings as read from a NetCDF4 file
+    ds["wet"].encoding.update({"zlib": True, "complevel": 4, "chunksizes": (1, n_lats, n_lons),
+                               "_FillValue": np.float32(9.96921e36), "source": "/archive/wet.nc"})
+    return ds.chunk({"time": 5})
+
+
+def test_parse_chunks():
+    assert parse_chunks(["time:12", " lat : 256"]) == {"time": 12, "lat": 256}
+
+
+@pytest.mark.parametrize("layout", ["zip", "directory"])
+def test_write_to_zarrs(tmp_path, layout):
+    ds = _make_dataset()
+    output_paths = write_to_zarrs(DatasetResults([ds, ds.isel(time=slice(0, 12))]), str(tmp_path),
+                                  chunks={"time": 12, "lat": 2},
+                                  compressor=get_zarr_compressor("zstd", 3), layout=layout)
+
+    suffix = ".zarr.zip" if layout == "zip" else ".zarr"
+    assert output_paths == [str(tmp_path / f"output_01{suffix}"), str(tmp_path / f"output_02{suffix}")]
+
+    store = zarr.ZipStore(output_paths[0], mode="r") if layout == "zip" else output_paths[0]
+    result = xr.open_zarr(store, use_cftime=True)
+
+    xr.testing.assert_identical(result.load(), ds.load())
+    assert result["wet"].encoding["chunks"] == (12, 2, 6)
+    assert result["wet"].encoding["compressor"].cname == "zstd"
+
+
+def test_write_to_zarrs_uncompressed(tmp_path):
+    output_path, = write_to_zarrs(DatasetResults([_make_dataset()]), str(tmp_path),
+                                  compressor=get_zarr_compressor("none"), layout="directory")
+
+    result = xr.open_zarr(output_path)
+    assert result["wet"].encoding["compressor"] is None
+    assert result["wet"].encoding["chunks"] == (24, 4, 6)
+
+
+def test_merge_datasets():
+    ds = _make_dataset()
+    tmn = (ds.rename({"wet": "tmn"}) - 10).assign_attrs(title="tmn")
+
+    results = DatasetResults()
+    results.add("wet", [ds.isel(time=slice(0, 12)), ds.isel(time=slice(12, None))])
+    results.add("tmn", [tmn])
+
+    merged, = merge_datasets(results)._results["merged"]
+
+    assert sorted(merged.data_vars) == ["tmn", "wet"]
+    assert merged.sizes == {"time": 24, "lat": 4, "lon": 6}
+    xr.testing.assert_equal(merged["wet"].load(), ds["wet"].load())
+    assert float(merged["tmn"][0, 0, 1]) == -9.0
+
+
+def test_write_to_netcdfs(tmp_path):
+    ds = _make_dataset()
+    results = DatasetResults([ds])
+    results.add("tmn", [ds.rename({"wet": "tmn"})])
+
+    output_paths = write_to_netcdfs(results, str(tmp_path), None)
+
+    assert output_paths == [str(tmp_path / "output_001.nc"), str(tmp_path / "output_002.nc")]
+    with xr.open_dataset(output_paths[1], use_cftime=True) as result:
+        np.testing.assert_array_equal(result["tmn"].values, ds["wet"].values)
+
+
+def test_write_to_netcdfs_incrementally(tmp_path):
+    ds = _make_dataset()
+    written = []
+
+    def on_output(paths):
+        # Each file is complete when it is reported
+        with xr.open_dataset(paths[0], use_cftime=True) as result:
+            np.testing.assert_array_equal(result["wet"].values, ds["wet"].values)
+        written.extend(paths)
+
+    output_paths = write_to_netcdfs(DatasetResults([ds, ds]), str(tmp_path), None, on_output=on_output)
+    assert written == output_paths
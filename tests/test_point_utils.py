@@ -0,0 +1,131 @@
+import csv
+import json
+
+import cftime
+import numpy as np
+import pytest
+import xarray as xr
+
+from flamingo.utils.point_utils import (
+    parse_point, get_grid, find_nearest, read_point_series, write_point_series
+)
+
+
+def _write_regular(tmp_path, year):
+    times = [cftime.datetime(year, month, 16, calendar="standard") for month in range(1, 13)]
+    lats = np.arange(-89.75, 90, 0.5)
+    lons = np.arange(-179.75, 180, 0.5)
+    data = np.broadcast_to(np.arange(12, dtype="float32")[:, None, None] + (year - 2000) * 12,
+                           (12, lats.size, lons.size)).copy()
+    data[:, 0, :] = np.nan
+
+    ds = xr.Dataset({"tmn": (("time", "lat", "lon"), data, {"units": "degC"})},
+                    coords={"time": times, "lat": lats, "lon": lons})
+
+    file_path = str(tmp_path / f"tmn_{year}.nc")
+    ds.to_netcdf(file_path)
+    return file_path
+
+
+def _write_projected(tmp_path):
+    times = [cftime.datetime(2000, month, 16, calendar="360_day") for month in range(1, 4)]
+    y, x = np.arange(5) * 1000.0, np.arange(4) * 1000.0
+    lat = 50 + np.arange(5)[:, None] * 0.01 + np.zeros(4)
+    lon = -2 + np.arange(4)[None, :] * 0.015 + np.zeros((5, 1))
+    data = np.arange(3 * 5 * 4, dtype="float32").reshape(3, 5, 4)
+
+    ds = xr.Dataset(
+        {"tas": (("time", "projection_y_coordinate", "projection_x_coordinate"), data)},
+        coords={
+            "time": times,
+            "projection_y_coordinate": y,
+            "projection_x_coordinate": x,
+            "latitude": (("projection_y_coordinate", "projection_x_coordinate"), lat),
+            "longitude": (("projection_y_coordinate", "projection_x_coordinate"), lon),
+        },
+    )
+
+    file_path = str(tmp_path / "tas.nc")
+    ds.to_netcdf(file_path)
+    return file_path
+
+
+def test_parse_point():
+    assert parse_point("51.75,-1.25") == (51.75, -1.25)
+
+    for value in ("51.75", "north,south", "95,0"):
+        with pytest.raises(ValueError):
+            parse_point(value)
+
+
+def test_find_nearest_regular(tmp_path):
+    grid = get_grid(_write_regular(tmp_path, 2000))
+
+    assert grid["dims"] == ("lat", "lon")
+    assert find_nearest(grid, 51.6, -1.3) == (283, 357)
+    # Longitudes in the 0-360 convention
+    assert find_nearest(grid, 51.6, 358.7) == (283, 357)
+
+
+def test_find_nearest_projected(tmp_path):
+    grid = get_grid(_write_projected(tmp_path))
+
+    assert grid["dims"] == ("projection_y_coordinate", "projection_x_coordinate")
+    assert find_nearest(grid, 50.021, -1.956) == (2, 3)
+    # Outside the grid
+    assert find_nearest(grid, 55, -2) is None
+
+
+def test_read_point_series(tmp_path):
+    file_paths = [_write_regular(tmp_path, 2000), _write_regular(tmp_path, 2001)]
+    points = [(51.6, -1.3), (-89.9, 0)]
+
+    series = read_point_series(file_paths, "tmn", points, start="2000-11-01T00:00:00", end="2001-02-28T23:59:59")
+
+    assert series["attributes"] == {"units": "degC"}
+    first, second = series["points"]
+    assert (first["grid_latitude"], first["grid_longitude"]) == (51.75, -1.25)
+    assert first["time"] == ["2000-11-16T00:00:00", "2000-12-16T00:00:00",
+                             "2001-01-16T00:00:00", "2001-02-16T00:00:00"]
+    assert first["values"] == [10.0, 11.0, 12.0, 13.0]
+    # Missing values
+    assert second["values"] == [None] * 4
+
+
+def test_read_point_series_partial_times(tmp_path):
+    file_paths = [_write_regular(tmp_path, 2000), _write_regular(tmp_path, 2001)]
+    points = [(51.6, -1.3)]
+
+    # An end date on a time step includes that step
+    point, = read_point_series(file_paths, "tmn", points, start="2000-11-16", end="2001-01-16")["points"]
+    assert point["time"] == ["2000-11-16T00:00:00", "2000-12-16T00:00:00", "2001-01-16T00:00:00"]
+
+    # Years cover all of their time steps
+    point, = read_point_series(file_paths, "tmn", points, start="2001", end="2001")["points"]
+    assert len(point["time"]) == 12
+    assert point["values"][0] == 12.0
+
+
+def test_read_point_series_outside(tmp_path):
+    with pytest.raises(ValueError):
+        read_point_series([_write_projected(tmp_path)], "tas", [(60, -2)])
+
+
+def test_write_point_series(tmp_path):
+    file_path = _write_projected(tmp_path)
+    series = read_point_series([file_path], "tas", [(50.021, -1.956), (50, -2)])
+
+    csv_path, = write_point_series(series, str(tmp_path), "csv")
+    with open(csv_path) as reader:
+        rows = list(csv.reader(reader))
+
+    assert rows[0] == ["point", "latitude", "longitude", "grid_latitude", "grid_longitude", "time", "tas"]
+    assert rows[1] == ["1", "50.021", "-1.956", "50.02", "-1.955", "2000-01-16T00:00:00", "11"]
+    assert len(rows) == 7
+
+    json_path, = write_point_series(series, str(tmp_path), "json")
+    with open(json_path) as reader:
+        content = json.load(reader)
+
+    assert content["variable"] == "tas"
+    assert content["points"][1]["values"] == [0.0, 20.0, 40.0]
@@ -0,0 +1,76 @@
+import dask.array as da
+import pytest
+
+from pywps import configuration
+
+from flamingo.utils.metalink_utils import build_metalink
+from flamingo.utils.progress_utils import OutputProgress, TaskProgress
+
+
+REQUEST_UUID = "0a1b2c3d-0000-0000-0000-000000000000"
+
+
+@pytest.fixture
+def output_path(tmp_path):
+    original = configuration.get_config_value("server", "outputpath")
+    configuration.CONFIG.set("server", "outputpath", str(tmp_path / "outputs"))
+    yield tmp_path / "outputs"
+    configuration.CONFIG.set("server", "outputpath", original)
+
+
+def _write(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+def test_output_progress(tmp_path, output_path):
+    statuses = []
+    output_progress = OutputProgress(REQUEST_UUID, lambda message, percentage: statuses.append(
+        (message, percentage)), n_outputs=2, file_type="csv")
+
+    first = _write(tmp_path / "output_01.csv", "first")
+    output_progress.add([first])
+
+    # The output is published, and listed in the partial Metalink given in the status
+    assert (output_path / REQUEST_UUID / "output_01.csv").read_text() == "first"
+    assert statuses[-1][1] == 80
+    assert output_progress.metalink_url in statuses[-1][0]
+
+    partial = (output_path / REQUEST_UUID / "partial.meta4").read_text()
+    assert f"{REQUEST_UUID}/output_01.csv</metaurl>" in partial
+    assert "<size>5</size>" in partial
+
+    second = _write(tmp_path / "output_02.csv", "second")
+    output_progress.add([second])
+
+    assert statuses[-1][1] == 90
+    assert "Wrote 2 of 2 outputs" in statuses[-1][0]
+    assert f"{REQUEST_UUID}/output_02.csv</metaurl>" in (output_path / REQUEST_UUID / "partial.meta4").read_text()
+
+    # The final Metalink refers to the published copies
+    ml4 = build_metalink("subset-result", "Subset results.", str(tmp_path), [first, second], "csv",
+                         request_uuid=REQUEST_UUID)
+    assert [mf.url for mf in ml4.files] == [url for url, _ in output_progress.urls]
+
+
+def test_build_metalink_directory(tmp_path, output_path):
+    store = tmp_path / "output_01.zarr"
+    store.mkdir()
+    _write(store / ".zgroup", "{}")
+
+    # Directory stores are published with the outputs of the request
+    ml4 = build_metalink("subset-result", "Subset results.", str(tmp_path), [str(store)], "zarr",
+                         request_uuid=REQUEST_UUID)
+    mf, = ml4.files
+    assert mf.url.endswith(f"/{REQUEST_UUID}/output_01.zarr")
+    assert (output_path / REQUEST_UUID / "output_01.zarr" / ".zgroup").read_text() == "{}"
+
+
+def test_task_progress():
+    fractions = []
+
+    with TaskProgress(fractions.append, interval=0):
+        da.ones((10, 10), chunks=2).sum().compute(scheduler="threads")
+
+    assert fractions and fractions == sorted(fractions)
+    assert 0 < fractions[-1] <= 1
@@ -0,0 +1,64 @@
+import json
+
+from prov.model import ProvDocument
+
+from flamingo import __version__ as flamingo_version
+from flamingo.provenance import Provenance, get_package_version
+
+
+def _expected_document(inputs, outputs):
+    "Builds the expected document with the prov library."
+    doc = ProvDocument()
+    doc.set_default_namespace(uri="http://purl.org/roocs/prov#")
+    doc.add_namespace("provone", uri="http://purl.dataone.org/provone/2015/01/15/ontology#")
+    doc.add_namespace("dcterms", uri="http://purl.org/dc/terms/")
+
+    cds = doc.agent(":copernicus_CDS", {"prov:type": "prov:Organization",
+                                        "dcterms:title": "Copernicus Climate Data Store"})
+    sw_flamingo = doc.agent(":flamingo", {
+        "prov:type": "prov:SoftwareAgent",
+        "dcterms:source": f"https://github.com/cedadev/flamingo/releases/tag/v{flamingo_version}"})
+    doc.wasAttributedTo(sw_flamingo, cds)
+    sw_daops = doc.agent(":daops", {
+        "prov:type": "prov:SoftwareAgent",
+        "dcterms:source": f"https://github.com/roocs/daops/releases/tag/v{get_package_version('daops')}"})
+
+    op = doc.activity(":subset", other_attributes={":time": "1961-01-01/1962-12-31", ":apply_fixes": False})
+    doc.start(op, starter=sw_daops, trigger=sw_flamingo)
+
+    for ds_out in outputs:
+        for ds_in in inputs:
+            doc.wasDerivedFrom(doc.entity(f":{ds_out}"), doc.entity(f":{ds_in}"), activity=op)
+
+    return doc
+
+
+def test_provenance_matches_prov_document(tmp_path):
+    outputs = [f"http://example.org/outputs/output_0{i}.csv" for i in range(1, 4)]
+
+    provenance = Provenance(str(tmp_path))
+    provenance.start()
+    provenance.add_operator("subset", {"time": "1961-01-01/1962-12-31", "apply_fixes": False},
+                            "cru_ts.4.04.wet", outputs)
+
+    with open(provenance.write_json()) as reader:
+        content = json.load(reader)
+
+    # Every output is derived from the whole collection
+    assert set(content["entity"]) == {"cru_ts.4.04.wet", "output_01.csv", "output_02.csv", "output_03.csv"}
+    assert len(content["wasDerivedFrom"]) == 3
+
+    expected = _expected_document(["cru_ts.4.04.wet"], ["output_01.csv", "output_02.csv", "output_03.csv"])
+    assert provenance.to_prov() == ProvDocument.deserialize(content=expected.serialize(format="json"), format="json")
+
+
+def test_provenance_documents_are_independent(tmp_path):
+    for n_outputs in (2, 1):
+        provenance = Provenance(str(tmp_path))
+        provenance.start()
+        provenance.add_operator("subset", {}, ["/data/a.nc", "/data/b.nc"],
+                                [f"out_{i}.nc" for i in range(n_outputs)])
+
+        content = json.loads(provenance.to_json())
+        assert len(content["wasDerivedFrom"]) == 2 * n_outputs
+        assert list(content["wasAttributedTo"]) == ["_:id1"]
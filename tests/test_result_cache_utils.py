@@ -0,0 +1,79 @@
+import os
+
+from clisops.parameter._utils import interval
+
+from flamingo.processes import _wps_subset_base
+from flamingo.processes.wps_subset_cru_ts import SubsetCRUTS
+from flamingo.utils import result_cache_utils
+from flamingo.utils.cache_utils import DiskCache
+from flamingo.utils.input_utils import normalise_request
+from flamingo.utils.result_cache_utils import get_result_key, fetch_results, store_results
+
+
+def test_normalise_request():
+    req1 = normalise_request("SubsetCRUTimeSeries", "cru_ts.4.04.wet",
+                             interval("2001-01-01/2005-12-31"), [1.000001, 1, 300, 89], "netcdf")
+    req2 = normalise_request("SubsetCRUTimeSeries", "cru_ts.4.04.wet",
+                             interval("2001-01-01T00:00:00/2005-12-31"), ["1", "1", "300", "89.0"], "netcdf")
+
+    assert req1 == req2
+    assert get_result_key(req1) == get_result_key(req2)
+    assert req1["time"] == ["2001-01-01", "2005-12-31"]
+
+    req3 = normalise_request("SubsetCRUTimeSeries", "cru_ts.4.04.wet",
+                             interval("2001-01-01/2005-12-31"), [1, 1, 300, 89], "csv")
+    assert get_result_key(req1) != get_result_key(req3)
+
+    # Settings that change the output files are part of the key
+    req4 = normalise_request("SubsetCRUTimeSeries", "cru_ts.4.04.wet",
+                             interval("2001-01-01/2005-12-31"), [1, 1, 300, 89], "netcdf",
+                             output_options={"profile": None})
+    assert get_result_key(req1) != get_result_key(req4)
+
+
+def test_output_options(monkeypatch):
+    process = SubsetCRUTS()
+    assert process._get_output_options("csv") is None
+
+    netcdf, parquet = process._get_output_options("netcdf"), process._get_output_options("parquet")
+    monkeypatch.setitem(process.DSET_INFO, "netcdf_profile", "none")
+    monkeypatch.setattr(_wps_subset_base, "get_config_value",
+                        lambda section, option, default=None: "snappy" if section == "tabular" else default)
+
+    assert process._get_output_options("netcdf") == {"profile": None} != netcdf
+    assert process._get_output_options("parquet") == {"compression": "snappy"} != parquet
+
+
+def test_store_and_fetch_results(tmp_path, monkeypatch):
+    monkeypatch.setattr(result_cache_utils, "_cache", DiskCache(str(tmp_path / "cache")))
+
+    workdir = tmp_path / "job1"
+    workdir.mkdir()
+    output_uris = []
+
+    for name in ("output_02.csv", "output_01.csv"):
+        path = workdir / name
+        path.write_text(name)
+        output_uris.append(str(path))
+
+    key = get_result_key({"collection": "test"})
+    assert fetch_results(key, str(workdir)) is None
+
+    store_results(key, output_uris)
+
+    new_workdir = tmp_path / "job2"
+    new_workdir.mkdir()
+    fetched = fetch_results(key, str(new_workdir))
+
+    assert [os.path.basename(path) for path in fetched] == ["output_02.csv", "output_01.csv"]
+    assert open(fetched[0]).read() == "output_02.csv"
+
+    # An entry evicted while its outputs are published is a miss, leaving no outputs
+    for path in fetched:
+        os.remove(path)
+
+    entry_dir = result_cache_utils._cache.get(key)
+    os.remove(os.path.join(entry_dir, "output_01.csv"))
+
+    assert fetch_results(key, str(new_workdir)) is None
+    assert os.listdir(new_workdir) == []
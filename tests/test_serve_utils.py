@@ -0,0 +1,148 @@
+import gzip
+import http.client
+import os
+import threading
+
+import pytest
+from werkzeug.test import Client
+
+from flamingo.utils.serve_utils import (
+    OutputServerMiddleware, accepts_gzip, get_output_prefix, make_output_server, parse_range
+)
+
+
+def _app(environ, start_response):
+    start_response("200 OK", [("Content-Type", "text/plain")])
+    return [b"wps"]
+
+
+@pytest.fixture
+def output_dir(tmp_path):
+    (tmp_path / "job").mkdir()
+    (tmp_path / "job" / "output_001.nc").write_bytes(bytes(range(256)) * 40)
+    (tmp_path / "job" / "output_01.csv").write_text("".join(f"{i},{i / 2:g}\n" for i in range(1000)))
+    return tmp_path
+
+
+def test_parse_range():
+    assert parse_range(None, 100) is None
+    assert parse_range("bytes=10-19", 100) == (10, 20)
+    assert parse_range("bytes=90-", 100) == (90, 100)
+    assert parse_range("bytes=90-200", 100) == (90, 100)
+    assert parse_range("bytes=-10", 100) == (90, 100)
+    assert parse_range("bytes=-200", 100) == (0, 100)
+
+    # Several ranges, invalid ranges and other units give the whole file
+    for header in ("bytes=0-1,5-6", "bytes=20-10", "items=0-1", "bytes=-"):
+        assert parse_range(header, 100) is None
+
+    for header in ("bytes=100-", "bytes=-0"):
+        with pytest.raises(ValueError):
+            parse_range(header, 100)
+
+
+def test_accepts_gzip():
+    for header in ("gzip", "deflate, gzip", "GZIP;q=0.5", "x-gzip", "*", "br;q=1, *;q=0.1"):
+        assert accepts_gzip({"HTTP_ACCEPT_ENCODING": header})
+
+    for header in ("", "deflate", "gzip;q=0", "gzip; q=0.0, deflate", "*, gzip;q=0", "gzip;q=bad"):
+        assert not accepts_gzip({"HTTP_ACCEPT_ENCODING": header})
+
+
+def test_get_output_prefix():
+    assert get_output_prefix("http://localhost:5000/outputs/") == "/outputs"
+    assert get_output_prefix("https://example.org/wps/outputs") == "/wps/outputs"
+    assert get_output_prefix(None) == "/outputs"
+
+
+def test_serve_file(output_dir):
+    client = Client(OutputServerMiddleware(_app, str(output_dir)))
+    content = (output_dir / "job" / "output_001.nc").read_bytes()
+
+    resp = client.get("/outputs/job/output_001.nc")
+    assert resp.status_code == 200
+    assert resp.data == content
+    assert resp.headers["Content-Type"] == "application/x-netcdf"
+    assert resp.headers["Accept-Ranges"] == "bytes"
+
+    etag = resp.headers["ETag"]
+    assert client.get("/outputs/job/output_001.nc", headers={"If-None-Match": etag}).status_code == 304
+
+    resp = client.head("/outputs/job/output_001.nc")
+    assert resp.headers["Content-Length"] == str(len(content))
+    assert resp.data == b""
+
+    # Other requests go to the application
+    assert client.get("/wps").data == b"wps"
+    assert client.post("/outputs/job/output_001.nc").status_code == 405
+
+
+def test_serve_range(output_dir):
+    client = Client(OutputServerMiddleware(_app, str(output_dir)))
+    content = (output_dir / "job" / "output_001.nc").read_bytes()
+
+    resp = client.get("/outputs/job/output_001.nc", headers={"Range": "bytes=100-299"})
+    assert resp.status_code == 206
+    assert resp.data == content[100:300]
+    assert resp.headers["Content-Range"] == f"bytes 100-299/{len(content)}"
+
+    resp = client.get("/outputs/job/output_001.nc", headers={"Range": f"bytes={len(content)}-"})
+    assert resp.status_code == 416
+    assert resp.headers["Content-Range"] == f"bytes */{len(content)}"
+
+    # The whole file is sent if the client holds another version of it
+    resp = client.get("/outputs/job/output_001.nc", headers={"Range": "bytes=0-9", "If-Range": '"other"'})
+    assert resp.status_code == 200
+    assert len(resp.data) == len(content)
+
+
+def test_not_found(output_dir):
+    (output_dir.parent / "secret.txt").write_text("secret")
+    client = Client(OutputServerMiddleware(None, str(output_dir)))
+
+    for path in ("/outputs/job/missing.nc", "/outputs/job", "/outputs/../secret.txt", "/wps"):
+        assert client.get(path).status_code == 404
+
+
+def test_gzip_csv(output_dir):
+    client = Client(OutputServerMiddleware(_app, str(output_dir)))
+    content = (output_dir / "job" / "output_01.csv").read_bytes()
+
+    resp = client.get("/outputs/job/output_01.csv", headers={"Accept-Encoding": "gzip, deflate"})
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert resp.headers["Vary"] == "Accept-Encoding"
+    assert gzip.decompress(resp.data) == content
+
+    # Ranges are served from the plain file
+    resp = client.get("/outputs/job/output_01.csv", headers={"Accept-Encoding": "gzip", "Range": "bytes=0-3"})
+    assert resp.status_code == 206
+    assert resp.data == content[:4]
+
+
+def test_output_server_sendfile(output_dir, monkeypatch):
+    calls = []
+    sendfile = os.sendfile
+
+    def counting_sendfile(*args):
+        calls.append(args)
+        return sendfile(*args)
+
+    monkeypatch.setattr(os, "sendfile", counting_sendfile)
+    content = (output_dir / "job" / "output_001.nc").read_bytes()
+
+    server = make_output_server(OutputServerMiddleware(None, str(output_dir)), "127.0.0.1", 0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    try:
+        connection = http.client.HTTPConnection("127.0.0.1", server.server_port)
+        connection.request("GET", "/outputs/job/output_001.nc", headers={"Range": "bytes=1000-"})
+        resp = connection.getresponse()
+
+        assert resp.status == 206
+        assert resp.read() == content[1000:]
+        connection.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert calls
@@ -0,0 +1,72 @@
+import json
+
+import cftime
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+import xarray as xr
+
+from flamingo.utils.table_utils import get_table_variables, write_dataset_to_table
+
+
+def _make_dataset(n_times=5, n_y=3, n_x=4, calendar="standard"):
+    times = [cftime.datetime(2000, month, 16, calendar=calendar) for month in range(1, n_times + 1)]
+    data = np.arange(n_times * n_y * n_x, dtype="float32").reshape(n_times, n_y, n_x)
+    data[0, 0, 0] = np.nan
+
+    return xr.Dataset(
+        {
+            "tas": (("time", "y", "x"), data, {"units": "degC", "long_name": "temperature"}),
+            "time_bnds": (("time", "bnds"), np.zeros((n_times, 2))),
+        },
+        coords={
+            "time": times,
+            "y": np.arange(n_y) * 1000.0,
+            "x": np.arange(n_x) * 1000.0,
+            "latitude": (("y", "x"), np.arange(n_y * n_x, dtype="float64").reshape(n_y, n_x) + 50),
+        },
+        attrs={"title": "HadUK-Grid tas"},
+    )
+
+
+def test_get_table_variables():
+    assert get_table_variables(_make_dataset()) == (("time", "y", "x"), ["latitude"], ["tas"])
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "feather"])
+def test_write_dataset_to_table(tmp_path, fmt):
+    ds = _make_dataset()
+    output_file = str(tmp_path / f"output.{fmt}")
+
+    # Blocks of 2 time steps
+    assert write_dataset_to_table(ds, output_file, fmt=fmt, block_size=24) == output_file
+
+    if fmt == "parquet":
+        assert pq.ParquetFile(output_file).num_row_groups == 3
+        table = pq.read_table(output_file)
+    else:
+        table = pa.ipc.open_file(output_file).read_all()
+
+    assert table.column_names == ["time", "y", "x", "latitude", "tas"]
+    assert table.num_rows == 5 * 3 * 4
+
+    df = table.to_pandas()
+    expected = ds.drop_vars("time_bnds").to_dataframe().reset_index()
+
+    assert df["time"].tolist() == expected["time"].map(lambda t: np.datetime64(t.isoformat())).tolist()
+    np.testing.assert_array_equal(df["tas"], expected["tas"])
+    np.testing.assert_array_equal(df["latitude"], expected["latitude"])
+    assert df["tas"].isna().sum() == 1
+
+    assert table.schema.field("tas").metadata[b"units"] == b"degC"
+    metadata = json.loads(table.schema.metadata[b"flamingo"])
+    assert metadata["attributes"]["title"] == "HadUK-Grid tas"
+
+
+def test_360_day_calendar_times_as_strings(tmp_path):
+    ds = _make_dataset(n_times=2, calendar="360_day")
+    ds = ds.assign_coords(time=[cftime.Datetime360Day(2000, 2, 30), cftime.Datetime360Day(2000, 3, 30)])
+
+    table = pq.read_table(write_dataset_to_table(ds, str(tmp_path / "output.parquet")))
+    assert table.column("time")[0].as_py() == "2000-02-30T00:00:00"
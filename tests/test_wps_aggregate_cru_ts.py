@@ -0,0 +1,24 @@
+from tests.common import _common_wps_process_test
+
+from flamingo.processes.wps_aggregate_cru_ts import AggregateCRUTS
+
+PROC_CLASS = AggregateCRUTS
+
+
+def test_wps_aggregate_cru_ts_area_annual_mean(load_ceda_test_data):
+    data_inputs = ("dataset_version=Climatic Research Unit (CRU) TS (time-series) dataset 4.04;"
+                   "variable=wet day frequency (days);timeDateRange=1951-01-01/1955-12-31;"
+                   "area=1,1,50,50;operation=area_mean;operation=annual_mean;output_type=netcdf")
+    ds = _common_wps_process_test(PROC_CLASS, data_inputs)
+
+    assert ds.wet.dims == ("time",)
+    assert ds.wet.sizes["time"] == 5
+    assert ds.wet.attrs["cell_methods"].endswith("area: mean time: mean (interval: 1 year)")
+
+
+def test_wps_aggregate_cru_ts_climatology_csv(load_ceda_test_data):
+    data_inputs = ("dataset_version=Climatic Research Unit (CRU) TS (time-series) dataset 4.04;"
+                   "variable=wet day frequency (days);timeDateRange=1951-01-01/1955-12-31;"
+                   "polygon=1 1, 50 1, 50 50;operation=area_mean;operation=monthly_climatology;"
+                   "output_type=csv")
+    _ = _common_wps_process_test(PROC_CLASS, data_inputs)
@@ -0,0 +1,117 @@
+import json
+import os
+import xml.etree.ElementTree as ET
+
+import numpy as np
+import xarray as xr
+
+from pywps import Service
+from pywps.tests import client_for, assert_response_success
+
+from tests.common import PYWPS_CFG, get_output, _common_wps_process_test
+
+from flamingo.processes import _wps_batch_base
+from flamingo.processes.wps_batch_cru_ts import BatchSubsetCRUTS
+from flamingo.processes.wps_subset_cru_ts import SubsetCRUTS
+from flamingo.utils import result_cache_utils
+from flamingo.utils.cache_utils import DiskCache
+
+PROC_CLASS = BatchSubsetCRUTS
+
+DATASET_VERSION = "Climatic Research Unit (CRU) TS (time-series) dataset 4.04"
+TIME_RANGE = "1951-01-01/1955-12-31"
+AREAS = ["1,1,50,50", "-20,10,10,40"]
+
+
+def _execute(subsets, output_type):
+    client = client_for(Service(processes=[PROC_CLASS()], cfgfiles=[PYWPS_CFG]))
+    return client.get(
+        f"?service=WPS&request=Execute&version=1.0.0&identifier={PROC_CLASS.IDENTIFIER}"
+        f"&datainputs=subsets={json.dumps(subsets)};output_type={output_type}"
+    )
+
+
+def _get_output_files(resp):
+    output_file = get_output(resp.xml)["output"][7:]  # trim off 'file://'
+    ns = "{urn:ietf:params:xml:ns:metalink}"
+    return [file_tag.find(f"{ns}metaurl").text[7:]
+            for file_tag in ET.parse(output_file).getroot().findall(f"{ns}file")]
+
+
+def test_wps_batch_subset_cru_ts_netcdf(load_ceda_test_data):
+    variables = ["wet day frequency (days)", "near-surface temperature minimum (degrees Celsius)"]
+    subsets = [{"dataset_version": DATASET_VERSION, "variable": variable, "timeDateRange": TIME_RANGE,
+                "area": area} for variable in variables for area in AREAS]
+
+    resp = _execute(subsets, "netcdf")
+    assert_response_success(resp)
+
+    output_files = _get_output_files(resp)
+    assert [os.path.basename(path) for path in output_files] == [
+        f"subset_{i:02d}_output_001.nc" for i in range(1, 5)
+    ]
+
+    # The outputs match those of the subset process
+    for subset, output_file in zip(subsets, output_files):
+        data_inputs = (f"dataset_version={DATASET_VERSION};variable={subset['variable']};"
+                       f"timeDateRange={TIME_RANGE};area={subset['area']};output_type=netcdf")
+        expected = _common_wps_process_test(SubsetCRUTS, data_inputs)
+
+        with xr.open_dataset(output_file, use_cftime=True, decode_timedelta=False) as ds:
+            name = list(expected.data_vars)[0]
+            assert ds[name].shape == expected[name].shape
+            assert np.allclose(ds[name].values, expected[name].values, equal_nan=True)
+
+
+def test_wps_batch_subset_cru_ts_invalid(load_ceda_test_data):
+    resp = _execute([{"dataset_version": DATASET_VERSION, "variable": "rainfall"}], "csv")
+    assert "ExceptionReport" in resp.data.decode()
+
+
+def test_wps_batch_subset_cru_ts_invalid_type(load_ceda_test_data):
+    # Lists or objects instead of strings are reported as invalid values
+    for item in ({"dataset_version": DATASET_VERSION, "variable": ["wet day frequency (days)"]},
+                 {"dataset_version": {"version": DATASET_VERSION}, "variable": "wet day frequency (days)"}):
+        resp = _execute([item], "csv")
+        assert "Invalid or missing value for" in resp.data.decode()
+
+
+def test_wps_batch_subset_cru_ts_admission(load_ceda_test_data, monkeypatch):
+    areas = []
+
+    def estimate_subset(collections, time, area, output_format):
+        areas.append(area)
+        return {"read_bytes": 200 * 1024 ** 3, "output_bytes": 1024, "files": 5}
+
+    monkeypatch.setattr(_wps_batch_base, "estimate_subset", estimate_subset)
+
+    subsets = [{"dataset_version": DATASET_VERSION, "variable": "wet day frequency (days)",
+                "timeDateRange": "1952-01-01/1952-12-31", "area": area} for area in AREAS]
+    resp = _execute(subsets, "netcdf")
+    assert "The request is too large" in resp.data.decode()
+
+    # The group reads the union of the areas once, and writes each subset
+    assert areas == [[-20, 1, 50, 50], [1, 1, 50, 50], [-20, 10, 10, 40]]
+
+
+def test_wps_batch_subset_cru_ts_split_time(load_ceda_test_data, monkeypatch, tmp_path):
+    from clisops import CONFIG
+
+    # The shared subset of the group is split into several time slices
+    monkeypatch.setitem(CONFIG["clisops:write"], "file_size_limit", "20KB")
+    monkeypatch.setattr(result_cache_utils, "_cache", DiskCache(str(tmp_path / "cache")))
+
+    subsets = [{"dataset_version": DATASET_VERSION, "variable": "wet day frequency (days)",
+                "timeDateRange": TIME_RANGE, "area": area} for area in AREAS]
+    resp = _execute(subsets, "netcdf")
+    assert_response_success(resp)
+
+    # Every time step of each subset is written
+    for i in range(1, len(AREAS) + 1):
+        output_files = [path for path in _get_output_files(resp)
+                        if os.path.basename(path).startswith(f"subset_{i:02d}_")]
+        n_steps = 0
+        for output_file in output_files:
+            with xr.open_dataset(output_file, use_cftime=True, decode_timedelta=False) as ds:
+                n_steps += ds.time.size
+        assert n_steps == 60
@@ -24,6 +24,12 @@ def test_wps_caps():
         "/wps:Capabilities" "/wps:ProcessOfferings" "/wps:Process" "/ows:Identifier"
     )
     assert sorted(names.split()) == [
+        "AggregateCRUTimeSeries",
+        "AggregateHadUKGrid",
+        "BatchSubsetCRUTimeSeries",
+        "BatchSubsetHadUKGrid",
+        "ExtractPointsCRUTimeSeries",
+        "ExtractPointsHadUKGrid",
         "SubsetCRUTimeSeries",
         "SubsetHadUKGrid"
     ]
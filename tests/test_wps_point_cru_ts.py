@@ -0,0 +1,77 @@
+import json
+import xml.etree.ElementTree as ET
+
+from pywps import Service
+from pywps.tests import client_for, assert_response_success
+
+from tests.common import PYWPS_CFG, get_output
+
+from flamingo.processes.wps_point_cru_ts import ExtractPointsCRUTS
+from flamingo.utils import result_cache_utils
+from flamingo.utils.cache_utils import DiskCache
+
+PROC_CLASS = ExtractPointsCRUTS
+
+
+def _execute(data_inputs):
+    client = client_for(Service(processes=[PROC_CLASS()], cfgfiles=[PYWPS_CFG]))
+    return client.get(
+        f"?service=WPS&request=Execute&version=1.0.0&identifier={PROC_CLASS.IDENTIFIER}&datainputs={data_inputs}"
+    )
+
+
+def _get_output_file(resp):
+    output_file = get_output(resp.xml)["output"][7:]  # trim off 'file://'
+    file_tag = ET.parse(output_file).getroot().find("{urn:ietf:params:xml:ns:metalink}file")
+    return file_tag.find("{urn:ietf:params:xml:ns:metalink}metaurl").text[7:]
+
+
+def test_wps_point_cru_ts_csv(load_ceda_test_data):
+    data_inputs = ("dataset_version=Climatic Research Unit (CRU) TS (time-series) dataset 4.04;"
+                   "variable=wet day frequency (days);timeDateRange=1951-01-01/1951-12-31;"
+                   "locations=51.75,-1.25;locations=-20.25,130.25;output_type=csv")
+    resp = _execute(data_inputs)
+    assert_response_success(resp)
+
+    lines = open(_get_output_file(resp)).read().splitlines()
+    assert lines[0] == "point,latitude,longitude,grid_latitude,grid_longitude,time,wet"
+    assert lines[1].startswith("1,51.75,-1.25,")
+    assert lines[1].split(",")[5].startswith("1951-01")
+    assert len(lines) == 1 + 2 * 12
+
+
+def test_wps_point_cru_ts_json(load_ceda_test_data):
+    data_inputs = ("dataset_version=Climatic Research Unit (CRU) TS (time-series) dataset 4.04;"
+                   "variable=wet day frequency (days);timeDateRange=1951-01-01/1951-12-31;"
+                   "locations=51.75,-1.25;output_type=json")
+    resp = _execute(data_inputs)
+    assert_response_success(resp)
+
+    with open(_get_output_file(resp)) as reader:
+        content = json.load(reader)
+
+    point, = content["points"]
+    assert content["variable"] == "wet"
+    assert len(point["time"]) == len(point["values"]) == 12
+
+
+def test_wps_point_cru_ts_partial_times(load_ceda_test_data, monkeypatch, tmp_path):
+    monkeypatch.setattr(result_cache_utils, "_cache", DiskCache(str(tmp_path / "cache")))
+
+    # An end date on a time step, and a range of years
+    for time_range, n_steps in (("1951-01-01/1951-12-16", 12), ("1951/1952", 24)):
+        data_inputs = ("dataset_version=Climatic Research Unit (CRU) TS (time-series) dataset 4.04;"
+                       f"variable=wet day frequency (days);timeDateRange={time_range};"
+                       "locations=51.75,-1.25;output_type=csv")
+        resp = _execute(data_inputs)
+        assert_response_success(resp)
+
+        lines = open(_get_output_file(resp)).read().splitlines()
+        assert len(lines) == 1 + n_steps
+
+
+def test_wps_point_cru_ts_invalid_location(load_ceda_test_data):
+    data_inputs = ("dataset_version=Climatic Research Unit (CRU) TS (time-series) dataset 4.04;"
+                   "variable=wet day frequency (days);locations=51.75;output_type=csv")
+    resp = _execute(data_inputs)
+    assert "ExceptionReport" in resp.data.decode()
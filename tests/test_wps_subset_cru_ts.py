@@ -64,6 +64,25 @@ def test_wps_subset_cru_ts_4_04_csv_wet(load_ceda_test_data):
     _ = _common_wps_process_test(PROC_CLASS, data_inputs)
 
 
+def test_wps_subset_cru_ts_4_04_parquet_wet(load_ceda_test_data):
+    data_inputs = ("dataset_version=Climatic Research Unit (CRU) TS (time-series) dataset 4.04;"
+                   "variable=wet day frequency (days);timeDateRange=1951-01-01/2005-12-15;"
+                   "area=1,1,300,89;output_type=parquet")
+    table = _common_wps_process_test(PROC_CLASS, data_inputs)
+
+    assert table.column_names == ["time", "lat", "lon", "wet"]
+
+
+def test_wps_subset_cru_ts_4_04_zarr_wet(load_ceda_test_data):
+    data_inputs = ("dataset_version=Climatic Research Unit (CRU) TS (time-series) dataset 4.04;"
+                   "variable=wet day frequency (days);timeDateRange=1951-01-01/2005-12-15;"
+                   "area=1,1,300,89;output_type=zarr")
+    ds = _common_wps_process_test(PROC_CLASS, data_inputs)
+
+    assert "wet" in ds.data_vars
+    assert ds.attrs["title"].startswith("CRU TS4.04")
+
+
 def test_wps_subset_cru_ts_4_04_csv_check_global_attrs(load_ceda_test_data):
     data_inputs = ("dataset_version=Climatic Research Unit (CRU) TS (time-series) dataset 4.04;"
                    "variable=wet day frequency (days);timeDateRange=1951-01-01/2005-12-15;"
@@ -75,11 +94,31 @@ def test_wps_subset_cru_ts_4_04_csv_check_global_attrs(load_ceda_test_data):
     assert "CRU TS4.04 Rain Days" in lines
 
     assert "History:  20" in content
-    assert "Converted to NASA Ames format using nappy" in content
+    assert "Converted to NASA Ames format using flamingo" in content
     assert "ncks -d lat,,,100 -d lon,,,100 --variable wet /badc/cru/data/cru_ts/cru_ts_4.04/data/wet/cru_ts4.04.1901.2019.wet.dat.nc" in content
     assert "BST : User ianharris : Program makegridsauto.for called by update.for" in content
 
 
+def test_wps_subset_cru_ts_4_04_multiple_variables(load_ceda_test_data):
+    variables = ["wet day frequency (days)", "near-surface temperature minimum (degrees Celsius)"]
+    variable_inputs = "".join(f"variable={variable};" for variable in variables)
+    data_inputs = ("dataset_version=Climatic Research Unit (CRU) TS (time-series) dataset 4.04;"
+                   f"{variable_inputs}timeDateRange=1951-01-01/1955-12-31;area=1,1,50,50;merge=true;output_type=netcdf")
+    ds = _common_wps_process_test(PROC_CLASS, data_inputs)
+
+    assert sorted(ds.data_vars) == ["tmn", "wet"]
+
+    # Each variable matches its single-variable subset
+    for variable in variables:
+        expected = _common_wps_process_test(PROC_CLASS, data_inputs.replace(
+            "".join(f"variable={variable};" for variable in variables), f"variable={variable};"
+        ).replace("merge=true;", ""))
+        name = allowed_vars[variable]
+
+        assert ds[name].shape == expected[name].shape
+        assert np.allclose(ds[name].values, expected[name].values, equal_nan=True)
+
+
 @pytest.mark.parametrize("variable,start_date,end_date,area,output_type", TEST_SETS)
 def test_wps_subset_cru_ts_4_04_check_nc_content(
     load_ceda_test_data, variable, start_date, end_date, area, output_type